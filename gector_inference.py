@@ -1,69 +1,216 @@
-# import libraries
+"""Scores the sentences of a large text or CSV file with GECToR.
+
+Usage example:
+    python gector_inference.py --input essays.txt --output scores.csv --num_workers 4
+    python gector_inference.py --input essays.txt --output scores.csv --num_workers 4 --resume
+
+The sentences are read as a stream in chunks, so the input can be larger than the memory. The chunks are
+scored by worker processes and the results are appended to the output in the order of the input.
+After every chunk, the progress is stored next to the output (<output>.progress), so an interrupted run
+continues with --resume where it stopped. Every output row contains the index of the sentence, the sentence,
+the correction of GECToR and the correctness value (0.5 if GECToR did not change the sentence, 0 otherwise).
+"""
+import argparse
+import collections
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
 
-import pandas as pd
 from nltk import tokenize
 
-from utils.helpers import read_lines
-from gector.gec_model import GecBERTModel
-
-# initialize model with fine-tuned checkpoints
-try:
-    model = GecBERTModel('./data/gector/output_vocabulary/',
-                         model_paths=['./data/gector/model/model.th'],
-                         weigths=None,
-                         max_len=50,
-                         min_len=3,
-                         iterations=5,
-                         lowercase_tokens=0,
-                         log=False,
-                         model_name='roberta',
-                         special_tokens_fix=1,
-                         is_ensemble=0,
-                         min_error_probability=0.0,
-                         confidence=0)
-except FileNotFoundError:
-    print("The file of the model has not been found where it should be (./data/gector/model/model.th)")
-    print("You can download it from here:https://drive.google.com/file/d/1GXxl6mThLKBpImjFNpL9sRTYu4mR93kX/view?usp=sharing")
-
-
-def predict_for_string(model, input_data, out_file, batch_size=16):
-    """
-    Categorizes each sentence in the string of sentences as grammatically correct (1) or incorrect (0)
-
-    Args:
-        model: initialized instance of GecBERTModel
-        input_data: one input string containing sentences to be categorized. No \n assumed in the string
-        batch_size: batch size over which inference is performed; default = 16
-        out_file: path to csv file where classified data is written to sentence-wise
-
-    """
-    # split input string into sentences
-    data = tokenize.sent_tokenize(input_data)
-    predictions = []
-    correctness_value = []
-    batch = []
-    cnt_corrections = 0
-    for sent in data:
-        batch.append(sent.split())
-        if len(batch) == batch_size:
-            preds, cnt = model.handle_batch(batch)
-            predictions.extend(preds)
-            cnt_corrections += cnt
-            batch = []
-    # for smaller batches
-    if batch:
-        preds, cnt = model.handle_batch(batch)
-        predictions.extend(preds)
-        cnt_corrections += cnt
-    # put predicted tokens back into sentence
-    predictions_sents = [" ".join(x) for x in predictions]
-    # check if input sentence was grammatically correct
-    for (s_in, s_out) in zip(data, predictions_sents):
-        if s_in == s_out:
-            correctness_value.append(0.5)
-        else:
-            correctness_value.append(0)
-    # write classified data to csv
-    # to be adjusted to corresponding endpoint for discussion task scoring
-    pd.DataFrame({'sent_in': data, 'sent_out': predictions_sents,
-                 'correctness_value': correctness_value}).to_csv(out_file)
+OUTPUT_COLUMNS = ['index', 'sent_in', 'sent_out', 'correctness_value']
+
+# the model of a worker process, inherited from the parent process if the workers are forked
+_model = None
+
+
+def read_sentences(input_file, input_format, column, delimiter):
+    """Yields the sentences of the input file one by one.
+    Every line of a text file is split into sentences, in a CSV file every row of the column is one sentence."""
+    with open(input_file, encoding='utf-8', newline='') as file:
+        if input_format == 'csv':
+            for row in csv.DictReader(file, delimiter=delimiter):
+                sent = str(row[column] or '').strip()
+                if sent:
+                    yield sent
+            return
+        for line in file:
+            line = line.strip()
+            if line:
+                yield from tokenize.sent_tokenize(line)
+
+
+def get_chunks(sentences, chunk_size, start_index):
+    """Groups the sentences into lists of (index, sentence) pairs with at most chunk_size sentences."""
+    indexed_sentences = enumerate(sentences)
+    # the sentences of a resumed run that were already scored are skipped
+    for _ in itertools.islice(indexed_sentences, start_index):
+        pass
+    while True:
+        chunk = list(itertools.islice(indexed_sentences, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_model(model_options, num_threads):
+    """Loads the model of the process, unless it was inherited from the parent process."""
+    global _model
+    import torch
+    from src.backend.models.gector.gec_model import GecBERTModel
+
+    torch.set_num_threads(num_threads)
+    if _model is None:
+        _model = GecBERTModel(model_options['vocab_path'],
+                              model_paths=[model_options['model_path']],
+                              weigths=None, max_len=50, min_len=3, iterations=model_options['iterations'],
+                              lowercase_tokens=0, log=False, model_name='roberta',
+                              special_tokens_fix=1, is_ensemble=0, min_error_probability=0.0,
+                              confidence=0, quantize=model_options['quantize'],
+                              mmap_paths=[model_options['mmap_dir']] if model_options['mmap_dir'] else None)
+
+
+def score_chunk(chunk, batch_size):
+    """Corrects the sentences of the chunk and returns the output rows."""
+    rows = []
+    for i in range(0, len(chunk), batch_size):
+        batch = chunk[i:i + batch_size]
+        preds, _ = _model.handle_batch([sent.split() for _, sent in batch])
+        for (index, sent), pred in zip(batch, preds):
+            sent_out = " ".join(pred)
+            rows.append([index, sent, sent_out, 0.5 if sent == sent_out else 0])
+    return rows
+
+
+def read_progress(progress_file):
+    """Returns the number of scored sentences and the size of the output file after them."""
+    if not os.path.exists(progress_file):
+        return 0, 0
+    with open(progress_file, encoding='utf-8') as file:
+        progress = json.load(file)
+    return progress['sentences'], progress['offset']
+
+
+def write_progress(progress_file, sentences, offset):
+    """Stores the progress atomically, so it is never half written."""
+    temporary_file = progress_file + '.tmp'
+    with open(temporary_file, 'w', encoding='utf-8') as file:
+        json.dump({'sentences': sentences, 'offset': offset}, file)
+    os.replace(temporary_file, progress_file)
+
+
+def open_output(output_file, resume):
+    """Opens the output file for appending and returns it with the number of scored sentences.
+    A resumed output is cut back to the last stored progress, a new output starts with the header."""
+    progress_file = output_file + '.progress'
+    if os.path.exists(output_file) and not resume:
+        sys.exit(f"{output_file} already exists, use --resume to continue it or choose another output.")
+    sentences, offset = read_progress(progress_file) if resume else (0, 0)
+    output = open(output_file, 'ab')
+    # rows written after the last stored progress are written again
+    output.truncate(offset)
+    output.seek(offset)
+    if offset == 0:
+        write_rows(output, [OUTPUT_COLUMNS])
+        write_progress(progress_file, 0, output.tell())
+    return output, sentences
+
+
+def write_rows(output, rows):
+    """Appends the rows to the output file and writes them to disk."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    output.write(buffer.getvalue().encode('utf-8'))
+    output.flush()
+    os.fsync(output.fileno())
+
+
+def score_chunks(pool, chunks, output, progress_file, scored, batch_size, max_pending):
+    """Scores the chunks with the worker pool and writes the results in the order of the input.
+    At most max_pending chunks are read ahead, so the input is never loaded completely.
+    Yields the number of sentences of every written chunk."""
+    pending = collections.deque()
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is not None:
+            pending.append(pool.apply_async(score_chunk, (chunk, batch_size)))
+        while pending and (chunk is None or len(pending) >= max_pending):
+            rows = pending.popleft().get()
+            write_rows(output, rows)
+            scored += len(rows)
+            write_progress(progress_file, scored, output.tell())
+            yield len(rows)
+
+
+def main(args):
+    input_format = args.input_format or ('csv' if args.input.lower().endswith('.csv') else 'text')
+    model_options = {'vocab_path': args.vocab_path, 'model_path': args.model_path, 'iterations': args.iterations,
+                     'quantize': args.quantize, 'mmap_dir': args.mmap_dir}
+    num_threads = max(1, (os.cpu_count() or 1) // args.num_workers)
+    try:
+        # the model is loaded once and shared copy-on-write by the forked workers
+        context = multiprocessing.get_context('fork')
+        load_model(model_options, num_threads)
+    except ValueError:
+        context = multiprocessing.get_context('spawn')
+
+    output, scored = open_output(args.output, args.resume)
+    if scored:
+        print(f"Resuming after {scored} sentences.")
+    chunks = get_chunks(read_sentences(args.input, input_format, args.column, args.delimiter),
+                        args.chunk_size, scored)
+
+    start = last_report = time.time()
+    new_sentences = 0
+    with context.Pool(args.num_workers, initializer=load_model, initargs=(model_options, num_threads)) as pool:
+        for count in score_chunks(pool, chunks, output, args.output + '.progress', scored, args.batch_size,
+                                  2 * args.num_workers):
+            new_sentences += count
+            if time.time() - last_report >= args.report_interval:
+                last_report = time.time()
+                print(f"{scored + new_sentences} sentences scored, "
+                      f"{new_sentences / (last_report - start):.1f} sentences/s")
+    output.close()
+
+    runtime = time.time() - start
+    print(f"Finished: {scored + new_sentences} sentences scored, {new_sentences} of them in {runtime:.1f}s "
+          f"({new_sentences / runtime if runtime else 0.0:.1f} sentences/s).")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', required=True,
+                        help='Path to the text or CSV file with the sentences.')
+    parser.add_argument('--output', required=True,
+                        help='Path to the CSV file the scores are written to.')
+    parser.add_argument('--input_format', choices=['text', 'csv'], default=None,
+                        help='Format of the input, by default CSV for .csv files and text otherwise.')
+    parser.add_argument('--column', default='Sentence',
+                        help='Column of the sentences in a CSV input.')
+    parser.add_argument('--delimiter', default=',',
+                        help='Delimiter of a CSV input.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run with the same input and output.')
+    parser.add_argument('--num_workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Number of worker processes.')
+    parser.add_argument('--chunk_size', type=int, default=256,
+                        help='Number of sentences a worker scores at a time.')
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help='Number of sentences GECToR corrects in one batch.')
+    parser.add_argument('--report_interval', type=float, default=10.0,
+                        help='Number of seconds between two throughput reports.')
+    parser.add_argument('--vocab_path', default='./data/gector/output_vocabulary/',
+                        help='Path to the output vocabulary.')
+    parser.add_argument('--model_path', default='./data/gector/model/model.th',
+                        help='Path to the model checkpoint.')
+    parser.add_argument('--mmap_dir', default=None,
+                        help='Directory of the converted weights (see src.backend.models.gector.mmap_weights).')
+    parser.add_argument('--iterations', type=int, default=5,
+                        help='Number of correction iterations.')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Quantize GECToR to int8.')
+    main(parser.parse_args())
@@ -3,41 +3,52 @@ from src.bot.util import send_message
 
 import sys
 import json
+import atexit
 import logging
 import psycopg2
 import psycopg2.extras
 from pathlib import Path
 
 from src.misc.log_filter import TestInformationFilter
-from src.backend.db.connection import set_db_config
+from src.backend.db.connection import set_db_config, set_db_pool_config, close_all_connections
+from src.backend.db.student_cache import set_student_cache_config
 from src.telegram.groups.group_handler import set_group_handler_config, get_telegram_client
 
-# ensure that the logging directory exists
-Path('./logs').mkdir(parents=True, exist_ok=True)
-# setup the logging
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-# create console handler that a higher log level
-ch = logging.StreamHandler()
-ch.setLevel(logging.WARNING)
-# create a file handler that logs even debug messages
-fh = logging.FileHandler('logs/ALL_bot.log', 'w', 'utf-8')
-fh.setLevel(logging.DEBUG)
-# create a file handler that logs just the test information
-testInfoHandler = logging.FileHandler('logs/test_info.log', 'w', 'utf-8')
-testInfoHandler.setLevel(logging.DEBUG)
-testInfoHandler.addFilter(TestInformationFilter())
-# create formatter and add it to the handlers
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-ch.setFormatter(formatter)
-fh.setFormatter(formatter)
-testInfoHandler.setFormatter(formatter)
-logger.addHandler(ch)
-logger.addHandler(fh)
-logger.addHandler(testInfoHandler)
+
+
+def setup_logging():
+    """
+    Sets up the logging of the bot process. Processes that import this module (e.g. the grammar workers)
+    must not truncate the log files.
+    """
+    # ensure that the logging directory exists
+    Path('./logs').mkdir(parents=True, exist_ok=True)
+    # setup the logging
+    logger.setLevel(logging.DEBUG)
+    # create console handler that a higher log level
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.WARNING)
+    # create a file handler that logs even debug messages
+    fh = logging.FileHandler('logs/ALL_bot.log', 'w', 'utf-8')
+    fh.setLevel(logging.DEBUG)
+    # create a file handler that logs just the test information
+    testInfoHandler = logging.FileHandler('logs/test_info.log', 'w', 'utf-8')
+    testInfoHandler.setLevel(logging.DEBUG)
+    testInfoHandler.addFilter(TestInformationFilter())
+    # create formatter and add it to the handlers
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    fh.setFormatter(formatter)
+    testInfoHandler.setFormatter(formatter)
+    logger.addHandler(ch)
+    logger.addHandler(fh)
+    logger.addHandler(testInfoHandler)
+
 
 if __name__ == '__main__':
+    setup_logging()
     print("Starting the bot.")
     # check arguments
     if len(
@@ -59,20 +70,39 @@ if __name__ == '__main__':
     config['db_connection']['options'] = config['db_connection'][
         'options'].format(config['database_schema'])
     set_db_config(config['db_connection'])
+    set_db_pool_config(config.get('db_pool', {}))
+    set_student_cache_config(config.get('student_cache', {}))
+    # return all pooled connections to the server when the bot stops
+    atexit.register(close_all_connections)
     logger.info('Finished database configuration')
     # we need to register the usage of uuids
     psycopg2.extras.register_uuid()
 
     # Recreate or update to the new database schema
-    from src.backend.db.setup import create_or_update_tables, delete_schema, create_schema_and_tables, insert_base_data
+    from src.backend.db.setup import create_or_update_tables, delete_schema, create_schema_and_tables, insert_base_data, \
+        apply_required_migrations
     if config['delete_data_and_recreate_database_schema']:
         logger.info('Delete the data and recrete the database schema')
         delete_schema(config['database_schema'])
         create_schema_and_tables(config['database_schema'])
         insert_base_data(config['data_files'])
-    elif config['update_database_schema']:
+    if config['delete_data_and_recreate_database_schema'] or config['update_database_schema']:
         logger.info('Update database to new database schema')
-        create_or_update_tables()
+        create_or_update_tables(config['database_schema'], config['data_files'])
+    else:
+        # the upserts need the unique keys even if the schema is not updated otherwise
+        apply_required_migrations(config['database_schema'])
+    if config.get('refresh_base_data', False):
+        logger.info('Merge the data files into the database')
+        insert_base_data(config['data_files'])
+
+    # Load the static task content into memory
+    from src.backend.db.sentence_data import load_sentence_bank
+    from src.backend.db.vocab_guessing_data import load_word_bank
+    from src.backend.db.discussion_data import load_discussion_text_bank
+    load_sentence_bank(config['data_files']['sentence_correction_task'])
+    load_word_bank(config['data_files']['vocabulary_guessing_task'])
+    load_discussion_text_bank(config['data_files']['discussion_task'])
 
     # load the configuration of the group handler
     set_group_handler_config(config['telegram_api'], config['bot']['id'])
@@ -84,7 +114,7 @@ if __name__ == '__main__':
     # Initialize the task phrases
     from src.backend.tasks.sentence_correction import set_sentence_correction_task_phrases
     from src.backend.tasks.vocabulary_description import set_vocab_guessing_task_phrases
-    from src.backend.tasks.discussion import set_discussion_task_phrases
+    from src.backend.tasks.discussion import set_discussion_task_phrases, start_grammar_service
     from src.backend.tasks.listening import set_listening_task_phrases
 
     set_sentence_correction_task_phrases(config['phrase_files'])
@@ -92,6 +122,9 @@ if __name__ == '__main__':
     set_discussion_task_phrases(config['phrase_files'])
     set_listening_task_phrases(config['phrase_files'])
 
+    # Load the grammar classifier of the discussion task
+    start_grammar_service(config.get('grammar_classifier', {}))
+
     # Initialize story scenario
     from src.bot.handler.room_handler import set_sentence_correction_task_phrases
     set_sentence_correction_task_phrases(config['phrase_files'])
@@ -104,6 +137,10 @@ if __name__ == '__main__':
     from src.bot.handler.private_base import set_phone_number
     set_phone_number(config['telegram_api']['phone_number'])
 
+    # write the queued adaptive data before the connections are closed when the bot stops
+    from src.backend.db.task import stop_adaptive_data_buffer
+    atexit.register(stop_adaptive_data_buffer)
+
     # start the bot
     from src.bot.bot import start_bot
 
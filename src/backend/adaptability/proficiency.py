@@ -59,6 +59,8 @@ class Others(Enum):
 class Proficiency():
 
     def __init__(self, initial = True, grammar_dict = None, vocab_dict = None, others_dict = None):
+        # Sub-types whose value changed since the proficiency was last saved to the database
+        self.changed_sub_types = set()
         # Initial creation
         if initial:
             # Create empty dictionaries for all types
@@ -137,6 +139,25 @@ class Proficiency():
             proficiencies.append((student_id, sub_type.value, proficiency))
         return proficiencies
 
+    def get_changed_as_list(self, student_id):
+        """
+        Return only the proficiencies that changed since the last save as a list for database upload that includes the user_id
+        """
+        changed_ids = {sub_type.value for sub_type in self.changed_sub_types}
+        return [row for row in self.get_as_list(student_id) if row[1] in changed_ids]
+
+    def has_changes(self):
+        """
+        Returns whether a proficiency changed since the last save
+        """
+        return len(self.changed_sub_types) > 0
+
+    def mark_as_saved(self):
+        """
+        Marks all proficiencies as saved to the database
+        """
+        self.changed_sub_types = set()
+
     def get_proficiency(self, sub_type):
         """
         Return the current proficiency of a sub-scale. If no proficiency is known yet, returns None
@@ -191,7 +212,9 @@ class Proficiency():
             new_proficiency = 10
         elif new_proficiency < 1:
             new_proficiency = 1
-        # Assign new proficiency
+        # Assign new proficiency and remember the change
+        if dim_dict[sub_type] != new_proficiency:
+            self.changed_sub_types.add(sub_type)
         dim_dict[sub_type] = new_proficiency
 
     def update_proficiencies(self, proficiency_sub_types, correct, group_update = False):
@@ -250,3 +273,4 @@ class Proficiency():
                     self.others_dict[sub_type] += change_val
                 else:
                     self.others_dict[sub_type] -= change_val
+                self.changed_sub_types.add(sub_type)
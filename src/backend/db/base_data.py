@@ -0,0 +1,197 @@
+import psycopg2
+import logging
+import time
+
+from collections import namedtuple
+from psycopg2 import sql
+
+from .connection import db_session
+
+logger = logging.getLogger(__name__)
+
+# The lock that makes sure that only one process merges base data at a time
+BASE_DATA_LOCK_ID = 734216
+
+# Describes how a base data file is merged into its table.
+# The columns are (name, type) pairs in the order of the csv file, the key columns identify a row
+# and must be unique in the file.
+# Rows that are no longer in the file are deleted, unless delete_removed is false
+# or they are still referenced by the protected_by (table, column) pair.
+BaseDataTable = namedtuple('BaseDataTable', ['table', 'columns', 'key_columns', 'delete_removed', 'protected_by'])
+
+# The base data tables by the name of their data file in the configuration, in the order they are merged
+BASE_DATA_TABLES = {
+    # the proficiency ids are referenced by the discussion texts and the student proficiencies
+    'proficiency_info': BaseDataTable(
+        'proficiency_info',
+        [('proficiency_domain', 'text'), ('proficiency_id', 'smallint'), ('proficiency_name', 'text')],
+        ['proficiency_id'], False, None),
+    'sentence_correction_task': BaseDataTable(
+        'sentence_correction_data',
+        [('sub_type', 'smallint'), ('difficulty_level', 'smallint'), ('sentence_corpus', 'text'),
+         ('correct_answers', 'text[]'), ('error_words', 'text[]')],
+        # the same sentence is used by several exercises with different answers, so the whole row is the key
+        # and a changed exercise replaces the old one
+        ['sub_type', 'difficulty_level', 'sentence_corpus', 'correct_answers', 'error_words'], True,
+        ('sentence_correction_adaptive_data', 'sentence_id')),
+    'vocabulary_guessing_task': BaseDataTable(
+        'vocabulary_guessing_data',
+        [('sub_type', 'smallint'), ('word', 'text'), ('difficulty', 'smallint')],
+        ['sub_type', 'word'], True, None),
+    'discussion_task': BaseDataTable(
+        'discussion_data',
+        [('id', 'integer'), ('topic', 'varchar(50)'), ('proficiency_domain', 'integer'),
+         ('discussion_text', 'varchar'), ('difficulty', 'integer'), ('questions', 'varchar[]')],
+        ['id'], True, None),
+}
+
+
+def merge_base_data(data_file_locations: dict) -> dict:
+    """
+    Merges all base data files into their tables in a single transaction.
+    Running the merge again with unchanged files does not change any row.
+
+    Args:
+        data_file_locations (dict): The locations of the data files by their name in the configuration.
+
+    Returns:
+        A dictionary with the number of inserted, updated and deleted rows per table.
+
+    Raises:
+        psycopg2.Error: If the data could not be merged, nothing is changed in that case.
+        ValueError: If a key occurs in several different rows of a file, nothing is changed in that case.
+    """
+    results = {}
+    with db_session() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT pg_advisory_xact_lock(%s)', (BASE_DATA_LOCK_ID, ))
+        for name, base_data_table in BASE_DATA_TABLES.items():
+            if name in data_file_locations:
+                results[base_data_table.table] = _merge_file(cur, base_data_table, data_file_locations[name])
+        cur.close()
+    return results
+
+
+def refresh_base_data(name: str, file_location: str) -> bool:
+    """
+    Merges a single base data file into its table, e.g. after the file changed while the bot is running.
+    Errors are logged, the table keeps its old content in that case.
+
+    Args:
+        name (str): The name of the data file in the configuration, e.g. 'sentence_correction_task'.
+        file_location (str): The path of the data file.
+
+    Returns:
+        True if the file was merged, otherwise false.
+    """
+    try:
+        merge_base_data({name: file_location})
+        return True
+    except (psycopg2.Error, OSError, ValueError) as e:
+        logger.error('The base data file {} could not be merged: {}'.format(file_location, e))
+        return False
+
+
+def _merge_file(cur, base_data_table: BaseDataTable, file_location: str) -> dict:
+    """
+    Streams the csv file into a temporary staging table with COPY and merges the staged rows into the table.
+    Rows that occur more than once in the file are merged once. A key that occurs in different rows
+    is an error, because it cannot be decided which of the rows is meant.
+
+    Args:
+        cur (cursor): A cursor of the connection whose transaction is used for the merge.
+        base_data_table (BaseDataTable): The description of the table.
+        file_location (str): The path of the csv file.
+
+    Returns:
+        A dictionary with the number of inserted, updated and deleted rows.
+    """
+    start = time.monotonic()
+    table = sql.Identifier(base_data_table.table)
+    staging = sql.Identifier('staging_{}'.format(base_data_table.table))
+    column_names = [name for name, _ in base_data_table.columns]
+    value_columns = [name for name in column_names if name not in base_data_table.key_columns]
+    columns = sql.SQL(', ').join(map(sql.Identifier, column_names))
+    keys = sql.SQL(', ').join(map(sql.Identifier, base_data_table.key_columns))
+    key_condition = sql.SQL(' AND ').join(
+        sql.SQL('live.{column} = staged.{column}').format(column=sql.Identifier(column))
+        for column in base_data_table.key_columns)
+    # the staged rows without repeated rows, the line keeps the order of the file
+    staged_rows = sql.SQL('SELECT DISTINCT ON ({keys}) {columns}, line FROM {staging} ORDER BY {keys}, line').format(
+        keys=keys, columns=columns, staging=staging)
+
+    cur.execute(sql.SQL('CREATE TEMPORARY TABLE {staging} ({column_definitions}, line SERIAL) ON COMMIT DROP').format(
+        staging=staging,
+        column_definitions=sql.SQL(', ').join(
+            sql.SQL('{name} {type}').format(name=sql.Identifier(name), type=sql.SQL(column_type))
+            for name, column_type in base_data_table.columns)))
+    with open(file_location, encoding='utf-8') as data_file:
+        cur.copy_expert(sql.SQL('COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)').format(
+            staging=staging, columns=columns).as_string(cur), data_file)
+    cur.execute(sql.SQL('SELECT count(*) FROM {staging}').format(staging=staging))
+    staged_count = cur.fetchone()[0]
+    if staged_count == 0:
+        # an empty file is most likely a mistake, it must not delete the content
+        logger.warning('The data file {} is empty, the {} table is not changed.'.format(file_location, base_data_table.table))
+        return {'inserted': 0, 'updated': 0, 'deleted': 0}
+    cur.execute(sql.SQL("""
+        SELECT {keys} FROM (SELECT DISTINCT {columns} FROM {staging}) AS staged
+        GROUP BY {keys} HAVING count(*) > 1
+    """).format(keys=keys, columns=columns, staging=staging))
+    conflicting_keys = cur.fetchall()
+    if conflicting_keys:
+        raise ValueError('The data file {} has different rows with the same key ({}): {}'.format(
+            file_location, ', '.join(base_data_table.key_columns), conflicting_keys))
+
+    updated = 0
+    if value_columns:
+        cur.execute(sql.SQL("""
+            UPDATE {table} AS live SET {assignments}
+            FROM ({staged_rows}) AS staged
+            WHERE {key_condition} AND ({live_values}) IS DISTINCT FROM ({staged_values})
+        """).format(
+            table=table,
+            assignments=sql.SQL(', ').join(
+                sql.SQL('{column} = staged.{column}').format(column=sql.Identifier(column)) for column in value_columns),
+            staged_rows=staged_rows,
+            key_condition=key_condition,
+            live_values=sql.SQL(', ').join(
+                sql.SQL('live.{column}').format(column=sql.Identifier(column)) for column in value_columns),
+            staged_values=sql.SQL(', ').join(
+                sql.SQL('staged.{column}').format(column=sql.Identifier(column)) for column in value_columns)))
+        updated = cur.rowcount
+
+    cur.execute(sql.SQL("""
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM ({staged_rows}) AS staged
+        WHERE NOT EXISTS (SELECT 1 FROM {table} AS live WHERE {key_condition})
+        ORDER BY staged.line
+    """).format(table=table, columns=columns, staged_rows=staged_rows, key_condition=key_condition))
+    inserted = cur.rowcount
+
+    deleted = 0
+    if base_data_table.delete_removed:
+        delete_sql = sql.SQL('DELETE FROM {table} AS live WHERE NOT EXISTS (SELECT 1 FROM {staging} AS staged WHERE {key_condition})').format(
+            table=table, staging=staging, key_condition=key_condition)
+        if base_data_table.protected_by is not None:
+            # rows that are referenced by the adaptive data are kept, deleting them would delete the adaptive data
+            protected_table, protected_column = base_data_table.protected_by
+            delete_sql = sql.SQL('{delete_sql} AND NOT EXISTS (SELECT 1 FROM {protected_table} AS reference WHERE reference.{protected_column} = live.id)').format(
+                delete_sql=delete_sql, protected_table=sql.Identifier(protected_table),
+                protected_column=sql.Identifier(protected_column))
+        cur.execute(delete_sql)
+        deleted = cur.rowcount
+        if base_data_table.protected_by is not None:
+            # rows whose key occurs more than once in the table (e.g. from a merge with a key that was not unique)
+            # are reduced to the oldest one, unless they are referenced
+            cur.execute(sql.SQL("""
+                DELETE FROM {table} AS live USING {table} AS staged
+                WHERE {key_condition} AND live.id > staged.id
+                AND NOT EXISTS (SELECT 1 FROM {protected_table} AS reference WHERE reference.{protected_column} = live.id)
+            """).format(table=table, key_condition=key_condition, protected_table=sql.Identifier(protected_table),
+                        protected_column=sql.Identifier(protected_column)))
+            deleted += cur.rowcount
+
+    logger.info('Merged {} rows of {} into {} in {:.3f} seconds: {} inserted, {} updated, {} deleted.'.format(
+        staged_count, file_location, base_data_table.table, time.monotonic() - start, inserted, updated, deleted))
+    return {'inserted': inserted, 'updated': updated, 'deleted': deleted}
@@ -1,10 +1,38 @@
 import psycopg2
+import psycopg2.extensions
 import logging
+import threading
+import time
 import pandas as pd
 
+from contextlib import contextmanager
+from psycopg2 import pool
+
 db_config = {}
 db_config_without_options = {}
-logger = logging.getLogger(__name__)                                   
+db_pool_config = {
+    'min_connections': 1,
+    'max_connections': 10,
+    'wait_timeout': 30,
+    'health_check_interval': 60
+}
+logger = logging.getLogger(__name__)
+
+# The pool is created lazily with the first connection request
+_pool = None
+_pool_semaphore = None
+_pool_lock = threading.Lock()
+# Maps the id of every checked out connection to the time it was handed out
+_checked_out = {}
+# Maps the id of every idle pooled connection to the time it was returned
+_last_returned = {}
+_pool_stats = {
+    'checkouts': 0,
+    'wait_time_total': 0.0,
+    'wait_time_max': 0.0,
+    'wait_timeouts': 0,
+    'discarded_connections': 0
+}
 
 
 def set_db_config(new_db_config: dict):
@@ -22,9 +50,27 @@ def set_db_config(new_db_config: dict):
     logger.debug('New database config: ')
     logger.debug(db_config)
     _set_db_config_without_options()
+    # a new configuration invalidates all pooled connections
+    close_all_connections()
     return db_config
 
 
+def set_db_pool_config(new_db_pool_config: dict):
+    """
+    Sets the configuration of the connection pool.
+
+    Args:
+        new_db_pool_config (dict): A dictionary that can hold the keys min_connections, max_connections,
+            wait_timeout (seconds) and health_check_interval (seconds).
+    """
+    logger.info('Set database pool config: {}'.format(new_db_pool_config))
+    for key, item in new_db_pool_config.items():
+        db_pool_config[key] = item
+    # the pool is recreated with the new size on the next request
+    close_all_connections()
+    return db_pool_config
+
+
 def _set_db_config_without_options():
     """
     Creates a database configuration that does not use the options.
@@ -34,59 +80,230 @@ def _set_db_config_without_options():
     db_config_without_options.pop('options', None)
 
 
+def _get_pool():
+    """
+    Returns the connection pool and creates it if it does not exist yet.
+    """
+    global _pool, _pool_semaphore
+    with _pool_lock:
+        if _pool is None:
+            max_connections = db_pool_config['max_connections']
+            logger.info('Create a database connection pool with {} to {} connections.'.format(
+                db_pool_config['min_connections'], max_connections))
+            _pool = pool.ThreadedConnectionPool(
+                db_pool_config['min_connections'], max_connections, **db_config)
+            _pool_semaphore = threading.BoundedSemaphore(max_connections)
+        return _pool, _pool_semaphore
+
+
+def _is_healthy(conn) -> bool:
+    """
+    Checks whether a pooled connection can still be used.
+    Connections that were idle longer than the health check interval are pinged.
+
+    Args:
+        conn (connection): The connection to check.
+
+    Returns:
+        True if the connection is usable, otherwise false.
+    """
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    with _pool_lock:
+        last_returned = _last_returned.get(id(conn))
+    if last_returned is not None and time.monotonic() - last_returned > db_pool_config['health_check_interval']:
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+    return True
+
+
 def get_connection(use_options: bool = True):
     """
-    Creates a new connection to the database. 
+    Takes a connection from the connection pool.
+    If all connections are in use, waits up to the configured wait timeout for one to be returned.
+    Connections without options are only used for the schema setup and are not pooled.
 
     Args:
         use_options (bool): If true (default), the database configuration with the options is used.
 
     Returns:
-        A connection to the database.
+        A connection to the database or None if no connection could be obtained.
     """
-    try:
-        logger.debug('Open a new connection to the database.')
-        # Connect to the postgreSQL server
-        if use_options:
-            conn = psycopg2.connect(**db_config)
-        else:
-            conn = psycopg2.connect(**db_config_without_options)
-        return conn
+    if not use_options:
+        try:
+            logger.debug('Open a new connection to the database without options.')
+            return psycopg2.connect(**db_config_without_options)
+        except psycopg2.Error as error:
+            logger.error('No new connection was opened: {}'.format(error))
+            logger.error(error.pgcode)
+            logger.error(error.pgerror)
+            return None
 
+    try:
+        connection_pool, semaphore = _get_pool()
     except psycopg2.Error as error:
-        logger.error('No new connection was opened: {}'.format(error))
+        logger.error('The connection pool could not be created: {}'.format(error))
         logger.error(error.pgcode)
         logger.error(error.pgerror)
-        # TODO: Exception handling
+        return None
+
+    # wait for a free slot in the pool
+    wait_start = time.monotonic()
+    if not semaphore.acquire(timeout=db_pool_config['wait_timeout']):
+        with _pool_lock:
+            _pool_stats['wait_timeouts'] += 1
+        logger.error('No database connection became available within {} seconds.'.format(
+            db_pool_config['wait_timeout']))
+        return None
+    wait_time = time.monotonic() - wait_start
+
+    try:
+        conn = connection_pool.getconn()
+        # replace broken connections with fresh ones
+        while not _is_healthy(conn):
+            logger.warning('Discard an unhealthy connection from the pool.')
+            with _pool_lock:
+                # the id of a closed connection can be reused by a new connection
+                _last_returned.pop(id(conn), None)
+                _pool_stats['discarded_connections'] += 1
+            connection_pool.putconn(conn, close=True)
+            conn = connection_pool.getconn()
+    except (psycopg2.Error, pool.PoolError) as error:
+        semaphore.release()
+        logger.error('No connection could be taken from the pool: {}'.format(error))
+        return None
+
+    with _pool_lock:
+        _checked_out[id(conn)] = time.monotonic()
+        _last_returned.pop(id(conn), None)
+        _pool_stats['checkouts'] += 1
+        _pool_stats['wait_time_total'] += wait_time
+        _pool_stats['wait_time_max'] = max(_pool_stats['wait_time_max'], wait_time)
+    if wait_time > 1:
+        logger.warning('Waited {:.2f} seconds for a database connection.'.format(wait_time))
+    return conn
 
 
 def close_connection(conn):
     """
-    Closes the given connection.
+    Returns the given connection to the pool.
+    Open transactions are rolled back, so the next user gets a clean connection.
+    Connections that do not belong to the pool are closed.
 
     Args:
         connection: The connection to close.
     """
-    try:
-        # Closes the connection to the postgreSQL server
-        if (conn):
+    if not conn:
+        return
+    with _pool_lock:
+        is_pooled = _checked_out.pop(id(conn), None) is not None
+        connection_pool = _pool
+        semaphore = _pool_semaphore
+    if not is_pooled or connection_pool is None:
+        try:
+            # Closes the connection to the postgreSQL server
             conn.close()
+        except psycopg2.Error as error:
+            logger.error(error.pgcode)
+            logger.error(error.pgerror)
+        return
 
+    discard = bool(conn.closed)
+    try:
+        if not discard and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
     except psycopg2.Error as error:
-        logger.error(error.pgcode)
-        logger.error(error.pgerror)
-        # TODO: Exception handling
+        logger.error('Could not reset the connection, it is discarded: {}'.format(error))
+        discard = True
+
+    try:
+        with _pool_lock:
+            if discard:
+                _last_returned.pop(id(conn), None)
+                _pool_stats['discarded_connections'] += 1
+            else:
+                _last_returned[id(conn)] = time.monotonic()
+        connection_pool.putconn(conn, close=discard)
+    except pool.PoolError as error:
+        logger.error('Could not return the connection to the pool: {}'.format(error))
+    finally:
+        semaphore.release()
+
+
+def close_all_connections():
+    """
+    Closes all connections of the pool. The pool is recreated on the next request.
+    """
+    global _pool, _pool_semaphore
+    with _pool_lock:
+        if _pool is not None:
+            logger.info('Close all pooled database connections.')
+            _pool.closeall()
+        _pool = None
+        _pool_semaphore = None
+        _checked_out.clear()
+        _last_returned.clear()
+
+
+def get_pool_statistics() -> dict:
+    """
+    Returns metrics of the connection pool.
+
+    Returns:
+        A dictionary with the number of checkouts, the connections in use, the average and maximum
+        time spent waiting for a connection (in seconds), the number of wait timeouts and the number
+        of discarded connections.
+    """
+    with _pool_lock:
+        stats = _pool_stats.copy()
+        stats['in_use'] = len(_checked_out)
+        stats['idle'] = len(_last_returned)
+    stats['max_connections'] = db_pool_config['max_connections']
+    stats['wait_time_avg'] = stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    return stats
+
+
+@contextmanager
+def db_session(use_options: bool = True):
+    """
+    Provides a pooled connection for a with block.
+    The transaction is committed when the block is left normally and rolled back on an exception.
+
+    Args:
+        use_options (bool): If true (default), the database configuration with the options is used.
+
+    Yields:
+        A connection to the database.
+    """
+    conn = get_connection(use_options)
+    if conn is None:
+        raise psycopg2.OperationalError('No database connection is available.')
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error as error:
+            logger.error(error)
+        raise
+    finally:
+        close_connection(conn)
 
 
 def read_query_into_df(query, params = None):
-    # Open a connection
-    conn = get_connection()
-    # Try to execute the query
+    # Try to execute the query with a pooled connection
     try:
-        return pd.read_sql(query, conn, params = params)
+        with db_session() as conn:
+            return pd.read_sql(query, conn, params = params)
     except psycopg2.Error as error:
         logger.error('Error while reading query {} into dataframe: {}'.format(query, error))
         logger.error(error.pgcode)
         logger.error(error.pgerror)
-    # In the end, close the connection 
-    close_connection(conn)
\ No newline at end of file
@@ -0,0 +1,267 @@
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+# All content banks, so the decks of an owner can be removed from every bank
+_content_banks = weakref.WeakSet()
+
+
+def remove_decks_of_owner(owner):
+    """
+    Removes the decks of the owner from all content banks, e.g. when a group stops playing.
+
+    Args:
+        owner: The owner of the decks, e.g. the id of a group chat.
+    """
+    for content_bank in list(_content_banks):
+        content_bank.remove_decks(owner)
+
+
+class ContentBank:
+    """
+    Keeps static task content in memory, grouped into buckets, so that selecting an item does not need a database query.
+    The content is reloaded in the background when the data file it was created from changes.
+    """
+
+    def __init__(self, name: str, load_function, check_interval: float = 30.0, max_deck_owners: int = 1000):
+        """
+        Initializes an empty content bank. The content is loaded with the first access or by calling load.
+
+        Args:
+            name (str): The name of the content, used for the log messages.
+            load_function (function): A function without arguments that returns a dictionary
+                mapping each bucket key to a list of items.
+            check_interval (float): The minimum number of seconds between two checks of the data file.
+            max_deck_owners (int): The maximum number of owners (e.g. groups) whose decks are kept,
+                the decks of the least recently used owner are dropped first.
+        """
+        self.name = name
+        self._load_function = load_function
+        self._check_interval = check_interval
+        self._buckets = None
+        # Increased with every load, so decks of older content can be detected
+        self.version = 0
+        self._decks = OrderedDict()
+        self._decks_lock = threading.Lock()
+        self._max_deck_owners = max_deck_owners
+        self._load_lock = threading.Lock()
+        self._source_file = None
+        self._import_function = None
+        self._source_mtime = None
+        self._last_check = 0.0
+        self._reloading = False
+        self._reload_listeners = []
+        _content_banks.add(self)
+
+    def set_source_file(self, file_location: str, import_function=None):
+        """
+        Sets the data file whose changes trigger a reload of the content.
+
+        Args:
+            file_location (str): The path of the data file.
+            import_function (function): An optional function that is called with the path of the changed data file
+                before the content is reloaded, e.g. to merge the file into the database.
+        """
+        self._source_file = file_location
+        self._import_function = import_function
+        self._source_mtime = self._get_source_mtime()
+
+    def add_reload_listener(self, listener):
+        """
+        Registers a function that is called without arguments after the content was reloaded.
+
+        Args:
+            listener (function): The function to call.
+        """
+        self._reload_listeners.append(listener)
+
+    def load(self):
+        """
+        Loads the content and replaces the current buckets.
+        """
+        with self._load_lock:
+            start = time.monotonic()
+            buckets = self._load_function()
+            # store the items as tuples, they are not changed after loading
+            self._buckets = {key: tuple(items) for key, items in buckets.items()}
+            self.version += 1
+            logger.info('Loaded {} {} items into {} buckets in {:.3f} seconds.'.format(
+                sum(len(items) for items in self._buckets.values()), self.name,
+                len(self._buckets), time.monotonic() - start))
+        for listener in self._reload_listeners:
+            listener()
+
+    def get_bucket(self, key) -> tuple:
+        """
+        Returns all items of a bucket.
+
+        Args:
+            key: The key of the bucket.
+
+        Returns:
+            A tuple of the items, empty if the bucket does not exist.
+        """
+        return self._get_buckets().get(key, ())
+
+    def get_keys(self) -> list:
+        """
+        Returns the keys of all buckets.
+        """
+        return list(self._get_buckets().keys())
+
+    def sample(self, key):
+        """
+        Returns a random item of a bucket.
+
+        Args:
+            key: The key of the bucket.
+
+        Returns:
+            A random item of the bucket or None if the bucket is empty.
+        """
+        bucket = self.get_bucket(key)
+        if not bucket:
+            return None
+        return random.choice(bucket)
+
+    def draw(self, key, owner=None):
+        """
+        Draws an item of a bucket from the deck of the owner.
+        An owner does not get an item twice before all items of the bucket were drawn.
+
+        Args:
+            key: The key of the bucket.
+            owner: The owner of the deck, e.g. the id of a group chat.
+
+        Returns:
+            The drawn item or None if the bucket is empty.
+        """
+        bucket = self.get_bucket(key)
+        if not bucket:
+            return None
+        with self._decks_lock:
+            deck = self._decks.get(owner)
+            if deck is None or deck.version != self.version:
+                deck = Deck(self.version)
+                self._decks[owner] = deck
+            self._decks.move_to_end(owner)
+            # drop the decks of the least recently used owners
+            while len(self._decks) > self._max_deck_owners:
+                self._decks.popitem(last=False)
+            # concurrent draws of the same owner must not take the same index
+            index = deck.draw_index(key, len(bucket))
+        return bucket[index]
+
+    def remove_decks(self, owner):
+        """
+        Removes the decks of the owner.
+
+        Args:
+            owner: The owner of the decks.
+        """
+        with self._decks_lock:
+            self._decks.pop(owner, None)
+
+    def _get_buckets(self) -> dict:
+        """
+        Returns the current buckets, loads them if necessary and checks the data file for changes.
+        """
+        if self._buckets is None:
+            self.load()
+        else:
+            self._check_source_file()
+        return self._buckets
+
+    def _get_source_mtime(self):
+        """
+        Returns the modification time of the data file or None if it cannot be read.
+        """
+        if self._source_file is None:
+            return None
+        try:
+            return os.path.getmtime(self._source_file)
+        except OSError:
+            return None
+
+    def _check_source_file(self):
+        """
+        Starts a background reload if the data file changed since the last load.
+        """
+        now = time.monotonic()
+        if self._source_file is None or self._reloading or now - self._last_check < self._check_interval:
+            return
+        self._last_check = now
+        mtime = self._get_source_mtime()
+        if mtime is None or mtime == self._source_mtime:
+            return
+        logger.info('The data file {} of the {} content changed, reload the content.'.format(self._source_file, self.name))
+        self._source_mtime = mtime
+        self._reloading = True
+        threading.Thread(target=self._reload, name='{}-reload'.format(self.name), daemon=True).start()
+
+    def _reload(self):
+        """
+        Reloads the content, the old content stays in use if the reload fails.
+        """
+        try:
+            if self._import_function is not None:
+                self._import_function(self._source_file)
+            self.load()
+        except Exception as e:
+            logger.error('The {} content could not be reloaded: {}'.format(self.name, e))
+        finally:
+            self._reloading = False
+
+
+class Deck:
+    """
+    The shuffled item indices of all buckets of a content bank for a single owner.
+    """
+
+    def __init__(self, version: int):
+        """
+        Initializes an empty deck.
+
+        Args:
+            version (int): The version of the content bank the deck belongs to.
+        """
+        self.version = version
+        # The remaining indices per bucket, the next index is taken from the end
+        self._remaining = {}
+        # The last drawn index per bucket
+        self._last_drawn = {}
+        # The bucket sizes the remaining indices were created for
+        self._sizes = {}
+
+    def draw_index(self, key, bucket_size: int) -> int:
+        """
+        Draws the next index of a bucket in constant amortized time and reshuffles the bucket when it is exhausted.
+
+        Args:
+            key: The key of the bucket.
+            bucket_size (int): The number of items in the bucket.
+
+        Returns:
+            The index of the drawn item.
+        """
+        remaining = self._remaining.get(key)
+        # a bucket whose size changed (e.g. during a reload) is reshuffled
+        if self._sizes.get(key) != bucket_size:
+            remaining = None
+        if not remaining:
+            remaining = list(range(bucket_size))
+            random.shuffle(remaining)
+            # do not repeat the last item of the previous round directly
+            if bucket_size > 1 and remaining[-1] == self._last_drawn.get(key):
+                remaining[0], remaining[-1] = remaining[-1], remaining[0]
+            self._remaining[key] = remaining
+            self._sizes[key] = bucket_size
+        index = remaining.pop()
+        self._last_drawn[key] = index
+        return index
@@ -1,59 +1,89 @@
 import psycopg2
-from psycopg2 import sql
 import logging
-from .connection import get_connection, close_connection
+from collections import namedtuple
+from .connection import db_session
+from .base_data import refresh_base_data
+from .content_bank import ContentBank
 from ..entities.discussion_text import DiscussionText
 
 logger = logging.getLogger(__name__)
 
+# The bucket that holds every discussion text
+ALL_TEXTS = 'all'
 
-def get_random_discussion_text() -> DiscussionText:
-    '''
-    Get a random discussion text.
+# A discussion text with its questions already split into a tuple
+DiscussionTextItem = namedtuple('DiscussionTextItem', ['id', 'topic', 'proficiency_domain', 'text', 'difficulty', 'questions'])
 
-    Parameters
-    ---------
-        group_id : int
-            Unique group identifier.
 
-    Returns
-    ---------
-        discussion_text : DiscussionText
-            Discussion text object containing
-            all text metadata and questions.
-    '''
-    ret = ()
-    query = """
-        SELECT *
-        FROM discussion_data
-        ORDER BY RANDOM()
-        LIMIT 1;
+def _load_discussion_text_items() -> dict:
+    """
+    Loads all discussion texts from the database, bucketed by (proficiency_domain, difficulty).
+    Additionally, the bucket ALL_TEXTS holds every text.
     """
-    try:
-        conn = get_connection()
+    query = 'SELECT id, topic, proficiency_domain, discussion_text, difficulty, questions FROM discussion_data'
+    buckets = {ALL_TEXTS: []}
+    with db_session() as conn:
         cur = conn.cursor()
-        query = sql.SQL(query)
         cur.execute(query)
-        ret = cur.fetchone()
+        for text_id, topic, proficiency_domain, text, difficulty, questions in cur.fetchall():
+            item = DiscussionTextItem(text_id, topic, proficiency_domain, text, difficulty, tuple(questions))
+            buckets.setdefault((proficiency_domain, difficulty), []).append(item)
+            buckets[ALL_TEXTS].append(item)
+        cur.close()
+    return buckets
 
-    except psycopg2.Error as e:
-        logger.error(e)
 
-    finally:
-        cur.close()
-        close_connection(conn)
+# The discussion texts are static, so they are kept in memory
+discussion_text_bank = ContentBank('discussion text', _load_discussion_text_items)
+
+
+def load_discussion_text_bank(file_location: str):
+    '''
+    Loads the discussion texts into memory and reloads them whenever the data file changes.
+
+    Parameters
+    ---------
+        file_location : str
+            Path of the csv file with the discussion task data.
+    '''
+    # a changed data file is merged into the database before the content is reloaded
+    discussion_text_bank.set_source_file(file_location, lambda path: refresh_base_data('discussion_task', path))
+    discussion_text_bank.load()
+
 
-    assert len(ret) > 0, (
+def _draw_discussion_text(key, deck_owner, exclude_text_ids) -> DiscussionText:
+    '''
+    Draws a discussion text of the bucket, skipping excluded texts if possible.
+    '''
+    bucket = discussion_text_bank.get_bucket(key)
+    assert len(bucket) > 0, (
             'A random discussion '
             'text could not be '
-            'retrieved from the db.'
+            'retrieved from the bank.'
         )
+    item = discussion_text_bank.draw(key, deck_owner)
+    # the deck returns every text once per round, so one round is enough to find a text that is not excluded
+    if exclude_text_ids:
+        for _ in range(len(bucket) - 1):
+            if item.id not in exclude_text_ids:
+                break
+            item = discussion_text_bank.draw(key, deck_owner)
+    # the questions are copied, because the discussion text removes them while they are asked
+    return DiscussionText(item.id, item.topic, item.proficiency_domain, item.text, item.difficulty, list(item.questions))
 
-    return DiscussionText(*ret)
 
-def get_random_discussion_text_based_on(subtype, difficulty) -> DiscussionText:
+def get_random_discussion_text(deck_owner=None, exclude_text_ids=None) -> DiscussionText:
     '''
-    Filter the database for a subtype and a difficulty before retrieving a random discussion text.
+    Get a random discussion text.
+
+    Parameters
+    ---------
+        deck_owner
+            Owner of the text deck, e.g. the group chat id;
+            an owner gets every text once before texts are repeated.
+        exclude_text_ids : set
+            IDs of texts that should not be selected
+            (e.g. texts the group has already seen), if possible.
 
     Returns
     ---------
@@ -61,32 +91,30 @@ def get_random_discussion_text_based_on(subtype, difficulty) -> DiscussionText:
             Discussion text object containing
             all text metadata and questions.
     '''
-    ret = ()
-    query = """
-        SELECT *
-        FROM discussion_data
-        WHERE proficiency_domain = %s AND difficulty = %s
-        ORDER BY RANDOM()
-        LIMIT 1;
-    """.format
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        query = sql.SQL(query)
-        cur.execute(query, (subtype,difficulty))
-        ret = cur.fetchone()
+    return _draw_discussion_text(ALL_TEXTS, deck_owner, exclude_text_ids)
 
-    except psycopg2.Error as e:
-        logger.error(e)
 
-    finally:
-        cur.close()
-        close_connection(conn)
+def get_random_discussion_text_based_on(subtype, difficulty, deck_owner=None, exclude_text_ids=None) -> DiscussionText:
+    '''
+    Filter the discussion texts for a subtype and a difficulty before retrieving a random discussion text.
 
-    assert len(ret) > 0, (
-            'A random discussion '
-            'text could not be '
-            'retrieved from the db.'
-        )
+    Parameters
+    ---------
+        subtype : Vocabulary or int
+            Proficiency domain of the text.
+        difficulty : int
+            Difficulty of the text.
+        deck_owner
+            Owner of the text deck, e.g. the group chat id.
+        exclude_text_ids : set
+            IDs of texts that should not be selected, if possible.
 
-    return DiscussionText(*ret)
+    Returns
+    ---------
+        discussion_text : DiscussionText
+            Discussion text object containing
+            all text metadata and questions.
+    '''
+    # the proficiency domain is stored as the value of the sub type enum
+    proficiency_domain = getattr(subtype, 'value', subtype)
+    return _draw_discussion_text((proficiency_domain, difficulty), deck_owner, exclude_text_ids)
@@ -5,13 +5,11 @@ import uuid
 from typing import List
 
 from .connection import get_connection, close_connection
-from .student import get_student
-from .student_data import get_student_data
+from .student import get_student, load_students
 from ..entities.group import Group
 from ..entities.student import Student
 from ..result import BackendResult
 from ...telegram.groups.group_handler import create_telegram_group, add_user_to_channel, add_bot_to_channel, get_chat_invite_link, set_group_logo
-from .student_proficiency import get_student_proficiency
 
 logger = logging.getLogger(__name__)
 standard_group_name = 'Escape Mission {}'
@@ -194,38 +192,10 @@ def get_students_in_group(group_id: str) -> List[Student]:
     Returns:
         A list of students that are in the group.
     """
-    student_list = []
-    try:
-        query = """
-        SELECT student.id, student.telegram_name, student.name FROM student
-            INNER JOIN student_group
-                ON (student.id = student_group.student_id)
+    student_id_query = """
+        SELECT student_group.student_id FROM student_group
             INNER JOIN telegram_group
                 ON (telegram_group.id = student_group.group_id)
             WHERE telegram_group.chat_id = %s
         """
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(query, (group_id, ))
-        records = cur.fetchall()
-        for student_record in records:
-            # Store student id
-            student_id = student_record[0]
-            # Load proficiency for student
-            proficiency = get_student_proficiency(student_id)
-            # Load student data from database
-            data = get_student_data(student_id)
-            # Create student object and append to list
-            student_list.append(
-                Student(
-                    id=student_id, telegram_id=student_record[1],
-                    name=student_record[2],
-                    proficiency=proficiency, data=data))
-    except psycopg2.Error as e:
-        logger.error(e)
-    finally:
-        if cur:
-            cur.close()
-        close_connection(conn)
-
-    return student_list
+    return load_students(student_id_query, (group_id, ))
@@ -2,13 +2,51 @@ import psycopg2
 import pandas as pd
 import numpy as np
 import random
-from .connection import read_query_into_df
+import logging
+from collections import namedtuple
+from .connection import read_query_into_df, db_session
+from .base_data import refresh_base_data
+from .content_bank import ContentBank
 from ..entities.sentence import Sentence
 from ..adaptability.proficiency import Grammar
 import re
 
-# Store last id of sentence
-last_id = None
+logger = logging.getLogger(__name__)
+
+# A sentence correction item with the parsed template, correct answers and error words
+SentenceItem = namedtuple('SentenceItem', ['id', 'sub_type', 'difficulty', 'template', 'correct_answers', 'error_words'])
+
+
+def _load_sentence_items() -> dict:
+    """
+    Loads all sentence correction items from the database, bucketed by (sub_type, difficulty_level).
+    """
+    query = 'SELECT id, sub_type, difficulty_level, sentence_corpus, correct_answers, error_words FROM sentence_correction_data'
+    buckets = {}
+    with db_session() as conn:
+        cur = conn.cursor()
+        cur.execute(query)
+        for idx, sub_type, difficulty, template, correct_answers, error_words in cur.fetchall():
+            item = SentenceItem(idx, sub_type, difficulty, template, tuple(correct_answers), tuple(error_words))
+            buckets.setdefault((sub_type, difficulty), []).append(item)
+        cur.close()
+    return buckets
+
+
+# The sentence correction content is static, so it is kept in memory
+sentence_bank = ContentBank('sentence correction', _load_sentence_items)
+
+
+def load_sentence_bank(file_location: str):
+    """
+    Loads the sentence correction items into memory and reloads them whenever the data file changes.
+
+    Args:
+        file_location (str): The path of the csv file with the sentence correction data.
+    """
+    # a changed data file is merged into the database before the content is reloaded
+    sentence_bank.set_source_file(file_location, lambda path: refresh_base_data('sentence_correction_task', path))
+    sentence_bank.load()
 
 
 def get_test_data():
@@ -43,31 +81,29 @@ def get_sentence_information_from_df(row):
     return sentence, selected_error_word, correct_answers, sub_types
 
 
-def get_random_sentence_based_on_sub_type_and_difficulty(sub_type, difficulty):
-    global last_id
-    # Select sub_type string based on enum
+def get_random_sentence_based_on_sub_type_and_difficulty(sub_type, difficulty, deck_owner=None):
+    """
+    Draws a sentence with the sub type and difficulty.
+    The same owner (e.g. a group) does not get a sentence twice before all sentences of the bucket were drawn.
+
+    Args:
+        sub_type (Grammar): The grammar sub type of the sentence.
+        difficulty (int): The difficulty of the sentence on a scale of 1-3.
+        deck_owner: The owner of the sentence deck, e.g. the id of the group chat.
+
+    Returns:
+        A new sentence object.
+    """
+    # Select sub_type id based on enum
     sub_type_id = get_db_sub_type_id(sub_type)
-    # Execute select database statement # TODO use sub_type_id in selection query
-    query = """SELECT * FROM sentence_correction_data WHERE sub_type = %s AND difficulty_level = %s ORDER BY RANDOM() LIMIT 1;"""
-    #print("send query with subtype:" + str(sub_type_id) + ", difficulty: " + str(difficulty))
-    df = read_query_into_df(query, params=[sub_type_id, difficulty])
-    # print(df)
-    # Check if that sentence was selected before
-    new_id = df["id"][0]
-    # TODO: We need to get the last id for the group here not the last selected in general
-    if new_id == last_id:
-        return get_random_sentence_based_on_sub_type_and_difficulty(
-            sub_type, difficulty)
-    else:
-        last_id = new_id
-        # Extract all information of sentence database record
-        sentence, selected_error_word, correct_answers, sub_types = get_sentence_information_from_df(
-            df)
-        # Parse data into sentence object (the object randomly instantiates as correct or incorrect)
-        return Sentence(
-            sentence=sentence,
-            error_word=selected_error_word,
-            error_corrections=correct_answers,
-            sub_types=sub_types,
-            idx=last_id
-        )
+    item = sentence_bank.draw((sub_type_id, difficulty), deck_owner)
+    if item is None:
+        raise LookupError('There is no sentence with sub type {} and difficulty {}.'.format(sub_type_id, difficulty))
+    # Parse data into sentence object (the object randomly instantiates as correct or incorrect)
+    return Sentence(
+        sentence=item.template,
+        error_word=random.choice(item.error_words),
+        error_corrections=list(item.correct_answers),
+        sub_types=extract_sub_types(item.sub_type),
+        idx=item.id
+    )
@@ -1,10 +1,9 @@
 import psycopg2
-from psycopg2.extras import execute_values
 from psycopg2 import sql
 import logging
 import sys
-import pandas as pd
 
+from .base_data import merge_base_data
 from .connection import get_connection, close_connection
 
 logger = logging.getLogger("db.setup")
@@ -71,31 +70,237 @@ def create_schema_and_tables(schema: str):
 def insert_base_data(data_file_locations: dict):
     """
     Inserts all data that is necessary for the bot to run.
+    The data files are streamed into staging tables and merged into the tables in a single transaction,
+    so the data can also be refreshed on an existing database.
+
+    Args:
+        data_file_locations (dict): The locations of the base data files.
     """
     try:
-        conn = get_connection()
+        merge_base_data(data_file_locations)
+    except (psycopg2.Error, OSError, ValueError) as e:
+        logger.exception(e)
+        sys.exit()
 
-        # insert all data needed
-        _insert_sentence_correction_data(conn, data_file_locations['sentence_correction_task'])
-        _insert_vocab_guessing_data(conn, data_file_locations['vocabulary_guessing_task'])
-        _insert_proficiency_data(conn, data_file_locations['proficiency_info'])
-        _insert_discussion_data(conn, data_file_locations['discussion_task'])
 
-        conn.commit()
+def create_or_update_tables(schema: str, data_file_locations: dict = None):
+    """
+    Ensures that all tables are present in the database.
+    If they do not already exist, they are created.
+    If they exist, they are updated to match the current database schema by applying all migrations
+    that were not applied yet. The applied versions are recorded in the schema_migrations table.
+    Indexes are built concurrently, so the update can run while the bot is using the database.
+
+    Args:
+        schema (str): The database schema to create or update.
+        data_file_locations (dict): The locations of the base data files, used if the tables have to be created.
+    """
+    cur = None
+    conn = None
+    try:
+        conn = get_connection(use_options=False)
+        # concurrent index builds cannot run inside a transaction
+        conn.autocommit = True
+        cur = conn.cursor()
+        # make sure that only one process migrates the schema at a time
+        cur.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_ID, ))
+
+        if not _table_exists(cur, schema, 'student'):
+            logger.info('The tables of schema {} do not exist, create them.'.format(schema))
+            create_schema_and_tables(schema)
+            if data_file_locations is not None:
+                insert_base_data(data_file_locations)
+
+        _apply_migrations(cur, schema, [version for version, _, _ in MIGRATIONS])
+
+        cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID, ))
     except psycopg2.Error as e:
         logger.exception(e)
         sys.exit()
     finally:
+        if cur:
+            cur.close()
         close_connection(conn)
 
 
-def create_or_update_tables():
+def apply_required_migrations(schema: str):
     """
-    Ensures that all tables are present in the database.
-    If they do not already exist, they are created.
-    If they exist, they are updated to match the current database schema.
+    Applies the migrations the queries of the bot depend on, even if the schema is not updated otherwise.
+    The upserts of the student data and proficiencies need the unique keys of migrations 1 and 2.
+
+    Args:
+        schema (str): The database schema to update.
+    """
+    cur = None
+    conn = None
+    try:
+        conn = get_connection(use_options=False)
+        # concurrent index builds cannot run inside a transaction
+        conn.autocommit = True
+        cur = conn.cursor()
+        if not _table_exists(cur, schema, 'student'):
+            # the tables are created with the constraints
+            return
+        cur.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_ID, ))
+        _apply_migrations(cur, schema, REQUIRED_MIGRATIONS)
+        cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID, ))
+    except psycopg2.Error as e:
+        logger.exception(e)
+        sys.exit()
+    finally:
+        if cur:
+            cur.close()
+        close_connection(conn)
+
+
+def _apply_migrations(cur, schema: str, versions: list):
+    """
+    Applies the migrations with the given versions that were not applied yet and records them.
+    The caller holds the migration lock.
+    """
+    _create_schema_migrations_table(cur, schema)
+    cur.execute(sql.SQL('SELECT version FROM {schema}.schema_migrations').format(schema=sql.Identifier(schema)))
+    applied_versions = {row[0] for row in cur.fetchall()}
+
+    for version, description, migration in MIGRATIONS:
+        if version in applied_versions or version not in versions:
+            continue
+        logger.info('Apply migration {}: {}'.format(version, description))
+        migration(cur, schema)
+        cur.execute(
+            sql.SQL("""INSERT INTO {schema}.schema_migrations (version, description) VALUES (%s, %s)
+                ON CONFLICT (version) DO NOTHING""").format(schema=sql.Identifier(schema)),
+            (version, description))
+        logger.info('Applied migration {}.'.format(version))
+
+
+def _table_exists(cur, schema: str, table: str) -> bool:
+    """
+    Checks whether the table exists in the schema.
+    """
+    cur.execute('SELECT to_regclass(%s)', ('{}.{}'.format(schema, table), ))
+    return cur.fetchone()[0] is not None
+
+
+def _constraint_exists(cur, schema: str, constraint: str) -> bool:
+    """
+    Checks whether the constraint exists in the schema.
+    """
+    cur.execute("""
+        SELECT 1 FROM pg_constraint
+            INNER JOIN pg_namespace ON (pg_namespace.oid = pg_constraint.connamespace)
+        WHERE pg_namespace.nspname = %s AND pg_constraint.conname = %s
+    """, (schema, constraint))
+    return cur.fetchone() is not None
+
+
+def _create_index_concurrently(cur, schema: str, index: str, table: str, columns: str, unique: bool = False):
     """
-    # TODO: create or update tables, we need this later for updating a running version
+    Creates the index without locking the table against writes, if it does not exist yet.
+    An invalid index that is left over from a failed concurrent build is dropped and built again.
+
+    Args:
+        cur (cursor): A cursor of a connection in autocommit mode.
+        schema (str): The schema of the table.
+        index (str): The name of the index.
+        table (str): The name of the table.
+        columns (str): The column list of the index, e.g. 'student_id, turn_start DESC'.
+        unique (bool): Whether a unique index should be created.
+    """
+    cur.execute("""
+        SELECT pg_index.indisvalid FROM pg_index
+            INNER JOIN pg_class ON (pg_class.oid = pg_index.indexrelid)
+            INNER JOIN pg_namespace ON (pg_namespace.oid = pg_class.relnamespace)
+        WHERE pg_namespace.nspname = %s AND pg_class.relname = %s
+    """, (schema, index))
+    result = cur.fetchone()
+    if result is not None and result[0]:
+        logger.info('The index {} already exists.'.format(index))
+        return
+    if result is not None:
+        logger.warning('Drop the invalid index {} and build it again.'.format(index))
+        cur.execute(sql.SQL('DROP INDEX CONCURRENTLY IF EXISTS {schema}.{index}').format(
+            schema=sql.Identifier(schema), index=sql.Identifier(index)))
+    create_index_sql = 'CREATE UNIQUE INDEX CONCURRENTLY {index} ON {schema}.{table} ({columns})' if unique \
+        else 'CREATE INDEX CONCURRENTLY {index} ON {schema}.{table} ({columns})'
+    cur.execute(sql.SQL(create_index_sql).format(
+        schema=sql.Identifier(schema), index=sql.Identifier(index),
+        table=sql.Identifier(table), columns=sql.SQL(columns)))
+    logger.info('Created the index {}.'.format(index))
+
+
+def _add_unique_key(cur, schema: str, table: str, constraint: str, columns: str):
+    """
+    Removes duplicates of the columns, keeping the latest row, and adds a unique constraint on them.
+    The backing index is built concurrently before it is attached to the table.
+    """
+    if _constraint_exists(cur, schema, constraint):
+        logger.info('The constraint {} already exists.'.format(constraint))
+        return
+    column_names = [column.strip() for column in columns.split(',')]
+    duplicate_condition = sql.SQL(' AND ').join(
+        sql.SQL('a.{column} = b.{column}').format(column=sql.Identifier(column)) for column in column_names)
+    cur.execute(sql.SQL('DELETE FROM {schema}.{table} a USING {schema}.{table} b WHERE {condition} AND a.ctid < b.ctid').format(
+        schema=sql.Identifier(schema), table=sql.Identifier(table), condition=duplicate_condition))
+    logger.info('Removed {} duplicate rows from {}.'.format(cur.rowcount, table))
+    _create_index_concurrently(cur, schema, constraint, table, columns, unique=True)
+    cur.execute(sql.SQL('ALTER TABLE {schema}.{table} ADD CONSTRAINT {constraint} UNIQUE USING INDEX {constraint}').format(
+        schema=sql.Identifier(schema), table=sql.Identifier(table), constraint=sql.Identifier(constraint)))
+
+
+def _create_schema_migrations_table(cur, schema: str):
+    """
+    Creates the table that records the applied migrations, if it does not exist yet.
+    """
+    cur.execute(sql.SQL("""
+    CREATE TABLE IF NOT EXISTS {schema}.schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """).format(schema=sql.Identifier(schema)))
+
+
+def _migration_student_proficiency_unique_key(cur, schema: str):
+    # the unique index also serves the lookups by student_id
+    _add_unique_key(cur, schema, 'student_proficiency',
+                    'student_proficiency_student_id_proficiency_id_key', 'student_id, proficiency_id')
+
+
+def _migration_student_data_unique_key(cur, schema: str):
+    # the unique index also serves the lookups by student_id
+    _add_unique_key(cur, schema, 'student_data',
+                    'student_data_student_id_data_field_key', 'student_id, data_field')
+
+
+def _migration_student_group_group_id_index(cur, schema: str):
+    # the primary key (student_id, group_id) cannot be used for lookups by group_id
+    _create_index_concurrently(cur, schema, 'student_group_group_id_idx', 'student_group', 'group_id')
+
+
+def _migration_adaptive_data_indexes(cur, schema: str):
+    # the recent entries of a student are read with ORDER BY turn_start DESC
+    _create_index_concurrently(cur, schema, 'sentence_correction_adaptive_data_student_id_turn_start_idx',
+                               'sentence_correction_adaptive_data', 'student_id, turn_start DESC')
+    _create_index_concurrently(cur, schema, 'vocabulary_guessing_adaptive_data_student_id_turn_start_idx',
+                               'vocabulary_guessing_adaptive_data', 'student_id, turn_start DESC')
+    _create_index_concurrently(cur, schema, 'discussion_adaptive_data_student_id_discussion_start_idx',
+                               'discussion_adaptive_data', 'student_id, discussion_start DESC')
+
+
+# Lock id of the advisory lock that is held while the schema is migrated
+MIGRATION_LOCK_ID = 734215
+
+# All migrations in the order they are applied, the versions must never change.
+# student.telegram_name needs no migration, its unique constraint already provides an index.
+MIGRATIONS = [
+    (1, 'Unique key on student_proficiency (student_id, proficiency_id)', _migration_student_proficiency_unique_key),
+    (2, 'Unique key on student_data (student_id, data_field)', _migration_student_data_unique_key),
+    (3, 'Index on student_group (group_id)', _migration_student_group_group_id_index),
+    (4, 'Indexes on the adaptive data tables (student_id, start DESC)', _migration_adaptive_data_indexes),
+]
+# The migrations the queries of the bot cannot work without, they are applied on every start
+REQUIRED_MIGRATIONS = [1, 2]
 
 
 def _create_schema(schema: str):
@@ -150,7 +355,8 @@ def _create_student_data_table(conn, schema: str):
     CREATE TABLE {}.student_data (
         student_id INTEGER,
         data_field VARCHAR(50) NOT NULL,
-        value NUMERIC
+        value NUMERIC,
+        CONSTRAINT student_data_student_id_data_field_key UNIQUE (student_id, data_field)
     )
     """).format(sql.Identifier(schema))
     # create the student table
@@ -240,19 +446,6 @@ def _create_sentence_correction_data(conn, schema):
     logger.info('Created the sentence_correction_data table.')
 
 
-def _insert_sentence_correction_data(conn, file_location: str):
-    """
-    Inserts the data for the sentence correction task.
-    """
-    # read in the csv file and transform it to a list of tuples
-    df = pd.read_csv(file_location)
-    data = list(df.itertuples(index=False, name=None))
-    cur = conn.cursor()
-    insert_query = 'INSERT INTO sentence_correction_data (sub_type, difficulty_level, sentence_corpus, correct_answers, error_words) VALUES %s'
-    execute_values(cur, insert_query, data, page_size=1000)
-    cur.close()
-
-
 def _create_student_proficiency_table(conn, schema):
     """
     Creates the user proficiency data table.
@@ -262,7 +455,8 @@ def _create_student_proficiency_table(conn, schema):
     """
     logger.info('Create the student proficiency table.')
     create_table_sql = sql.SQL("""
-    CREATE TABLE {schema}.student_proficiency (student_id text, proficiency_id smallint, value float
+    CREATE TABLE {schema}.student_proficiency (student_id text, proficiency_id smallint, value float,
+        CONSTRAINT student_proficiency_student_id_proficiency_id_key UNIQUE (student_id, proficiency_id)
     )
     """).format(schema=sql.Identifier(schema))
     # create the sentence_correction_data table
@@ -291,17 +485,6 @@ def _create_proficiency_table(conn, schema):
     logger.info('Created the proficiency_info table.')
 
 
-def _insert_proficiency_data(conn, file_location: str):
-    """
-    Inserts the data with the proficiency levels.
-    """
-    df = pd.read_csv(file_location)
-    data = list(df.itertuples(index=False, name=None))
-    cur = conn.cursor()
-    insert_query = 'INSERT INTO proficiency_info (proficiency_domain, proficiency_id, proficiency_name) VALUES %s'
-    execute_values(cur, insert_query, data, page_size=1000)
-    cur.close()
-
 def _create_vocab_guessing_table(conn, schema):
     """
     Creates the vocab guessing data table.
@@ -319,18 +502,6 @@ def _create_vocab_guessing_table(conn, schema):
     cur.close()
     logger.info('Created the vocabulary guessing data table.')
 
-def _insert_vocab_guessing_data(conn, file_location: str):
-    """
-    Inserts the data for the vocabulary guessing task.
-    """
-    # read in the csv file and transform it to a list of tuples
-    df = pd.read_csv(file_location)
-    data = list(df.itertuples(index=False, name=None))
-    cur = conn.cursor()
-    insert_query = 'INSERT INTO vocabulary_guessing_data (sub_type, word, difficulty) VALUES %s'
-    execute_values(cur, insert_query, data, page_size=1000)
-    cur.close()
-
 def _create_sentence_correction_adaptive_data_table(
     conn: 'connection',
     schema: str
@@ -583,22 +754,6 @@ def _create_discussion_table(conn, schema):
     logger.info('Created the discussion task data table.')
 
 
-def _insert_discussion_data(conn, file_location: str):
-    '''
-    Inserts the data for the discussion task.
-    '''
-    # read in the csv file and transform it to a list of tuples
-    df = pd.read_csv(file_location)
-    data = list(df.itertuples(index=False, name=None))
-    cur = conn.cursor()
-    insert_query = (
-            'INSERT INTO discussion_data (id, topic, proficiency_domain, '
-            'discussion_text, difficulty, questions) VALUES %s'
-        )
-    execute_values(cur, insert_query, data, page_size=1000)
-    cur.close()
-
-
 def _create_discussion_adaptive_data_table(
     conn: 'connection',
     schema: str
@@ -2,10 +2,13 @@ import psycopg2
 import logging
 import datetime
 
+from typing import List
+
 from .connection import get_connection, close_connection
+from .student_cache import student_cache
 from ..entities.student import Student
-from .student_proficiency import get_student_proficiency, insert_student_proficiency
-from .student_data import get_student_data, insert_student_data
+from .student_proficiency import insert_student_proficiency, rows_to_proficiency, upsert_changed_student_proficiency
+from .student_data import insert_student_data, rows_to_data, upsert_changed_student_data
 from ...misc.date_tools import date_to_int
 from ..adaptability.proficiency import Grammar, Vocabulary
 from ...misc.constants import (SEN_CORR_TASK_NAME, DISCUSSION_TASK_NAME, VOC_DESC_TASK_NAME)
@@ -13,39 +16,78 @@ from ...misc.constants import (SEN_CORR_TASK_NAME, DISCUSSION_TASK_NAME, VOC_DES
 logger = logging.getLogger(__name__)
 
 
-def get_student(telegram_name: str) -> Student:
+def load_students(student_id_query: str, params: tuple) -> List[Student]:
     """
-    Gets the student with the specified telegram name from the database.
+    Loads the students together with their proficiency and data in a single database round trip.
+    Students that are already in use are not replaced, their live object is returned instead.
 
     Args:
-        telegram_name (str): The name from telegram to search the student with.
+        student_id_query (str): A query that selects the ids of the students to load.
+        params (tuple): The parameters of the student id query.
 
     Returns:
-        A student object if the student was found. Otherwise, None is returned.
+        A list of fully initialized student objects.
     """
-    student_or_none = None
+    students = []
+    # both arrays of a lateral join use the same order, so the ids and values stay aligned
+    query = """
+        SELECT student.id, student.telegram_name, student.name,
+            proficiency.ids, proficiency.prof_values, data.fields, data.field_values
+        FROM student
+            LEFT JOIN LATERAL (
+                SELECT array_agg(proficiency_id ORDER BY proficiency_id, value) AS ids,
+                    array_agg(value ORDER BY proficiency_id, value) AS prof_values
+                FROM student_proficiency
+                WHERE student_proficiency.student_id = student.id::text
+            ) AS proficiency ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT array_agg(data_field ORDER BY data_field, value) AS fields,
+                    array_agg(value ORDER BY data_field, value) AS field_values
+                FROM student_data
+                WHERE student_data.student_id = student.id
+            ) AS data ON TRUE
+        WHERE student.id IN ({})
+        ORDER BY student.id
+    """.format(student_id_query)
+    cur = None
+    conn = None
     try:
         conn = get_connection()
         cur = conn.cursor()
-        query = 'SELECT id, telegram_name, name FROM student WHERE telegram_name = %s'
-        cur.execute(query, (telegram_name, ))
-        student_record = cur.fetchone()
-        if student_record is not None:
-            # Store student id
-            student_id = student_record[0]
-            # Load proficiency for student
-            proficiency = get_student_proficiency(student_id)
-            # Load student data from database
-            data = get_student_data(student_id)
-            # Create student object
-            student_or_none = Student(id=student_id, telegram_id=student_record[1], name=student_record[2], proficiency=proficiency, data=data)
+        cur.execute(query, params)
+        for record in cur.fetchall():
+            student_id, telegram_name, name, proficiency_ids, proficiency_values, data_fields, data_values = record
+            # Parse the aggregated rows into the proficiency object and the data dictionary
+            proficiency = rows_to_proficiency(zip(proficiency_ids or [], proficiency_values or []))
+            data = rows_to_data(zip(data_fields or [], data_values or []))
+            student = Student(id=student_id, telegram_id=telegram_name, name=name, proficiency=proficiency, data=data)
+            students.append(student_cache.put(student))
     except psycopg2.Error as e:
         logger.error(e)
     finally:
         if cur:
             cur.close()
         close_connection(conn)
-    return student_or_none
+    return students
+
+
+def get_student(telegram_name: str) -> Student:
+    """
+    Gets the student with the specified telegram name from the cache or, if it is not cached, from the database.
+
+    Args:
+        telegram_name (str): The name from telegram to search the student with.
+
+    Returns:
+        A student object if the student was found. Otherwise, None is returned.
+    """
+    student = student_cache.get(telegram_name)
+    if student is not None:
+        return student
+    students = load_students('SELECT id FROM student WHERE telegram_name = %s', (telegram_name, ))
+    if students:
+        return students[0]
+    return None
 
 
 def create_student(telegram_name: str, name: str) -> Student:
@@ -74,6 +116,7 @@ def create_student(telegram_name: str, name: str) -> Student:
         insert_student_proficiency(student)
         # Also create default values for 'last_played' and 'consecutive_days' fields in the database
         insert_student_data(student)
+        student = student_cache.put(student)
     except psycopg2.Error as e:
         logger.error(e)
     finally:
@@ -83,6 +126,38 @@ def create_student(telegram_name: str, name: str) -> Student:
     return student
 
 
+def save_students(students: List[Student]):
+    """
+    Saves the changed proficiencies and data fields of all given students in a single transaction.
+    Students without changes do not cause any write.
+
+    Args:
+        students (List[Student]): The students to save, usually the joined students of a group.
+    """
+    changed_students = [student for student in students if student.has_changes()]
+    if not changed_students:
+        return
+    cur = None
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        n_proficiency_rows = upsert_changed_student_proficiency(cur, changed_students)
+        n_data_rows = upsert_changed_student_data(cur, changed_students)
+        conn.commit()
+        for student in changed_students:
+            student.mark_data_as_saved()
+            student.mark_proficiency_as_saved()
+        logger.debug('Saved {} proficiency and {} data rows of {} students.'.format(
+            n_proficiency_rows, n_data_rows, len(changed_students)))
+    except psycopg2.Error as e:
+        logger.error(e)
+    finally:
+        if cur:
+            cur.close()
+        close_connection(conn)
+
+
 def get_n_recent_adaptive_data_entries(
     student_id:str,
     task_name:str,
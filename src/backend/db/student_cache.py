@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+import weakref
+
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class StudentCache:
+    """
+    Keeps the recently used student objects in memory, keyed by their telegram name, so that
+    a student does not have to be loaded (and its achievements rebuilt) on every request.
+    The least recently used students are dropped when the cache is full and entries expire after the time to live.
+    A student that is still referenced elsewhere (e.g. by the room manager of a group) stays the live object
+    of that telegram name even after it was dropped, so there is only one object per student.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 600.0):
+        """
+        Initializes an empty cache.
+
+        Args:
+            max_size (int): The maximum number of students that are kept in the cache.
+            ttl (float): The number of seconds after which an unused entry expires.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        # Maps the telegram name to the student and the time it was last used
+        self._entries = OrderedDict()
+        # All student objects that are still in use somewhere, including the ones that were dropped from the cache
+        self._live_students = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def get(self, telegram_name: str):
+        """
+        Returns the cached student with the telegram name.
+
+        Args:
+            telegram_name (str): The telegram name of the student.
+
+        Returns:
+            The student or None if it is not cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(telegram_name)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[telegram_name]
+                self._stats['evictions'] += 1
+                entry = None
+            student = entry[0] if entry is not None else self._live_students.get(telegram_name)
+            if student is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._store(telegram_name, student, now)
+            return student
+
+    def put(self, student):
+        """
+        Stores the student in the cache.
+        If another object of the same student is still in use, that object is kept and returned instead,
+        so it does not lose its unsaved changes.
+
+        Args:
+            student (Student): The student to store.
+
+        Returns:
+            The live object of the student.
+        """
+        telegram_name = student.get_telegram_id()
+        with self._lock:
+            live_student = self._live_students.get(telegram_name)
+            if live_student is not None and live_student.get_id() == student.get_id():
+                student = live_student
+            self._store(telegram_name, student, time.monotonic())
+            return student
+
+    def invalidate(self, telegram_name: str):
+        """
+        Removes the student from the cache, so it is loaded from the database with the next request.
+
+        Args:
+            telegram_name (str): The telegram name of the student.
+        """
+        with self._lock:
+            self._entries.pop(telegram_name, None)
+            self._live_students.pop(telegram_name, None)
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        """
+        Removes all students from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._live_students.clear()
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the metrics of the cache.
+
+        Returns:
+            A dictionary with the number of hits, misses, evictions and invalidations,
+            the hit rate and the number of cached and live students.
+        """
+        with self._lock:
+            stats = self._stats.copy()
+            stats['size'] = len(self._entries)
+            stats['live'] = len(self._live_students)
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / requests if requests else 0.0
+        return stats
+
+    def _store(self, telegram_name: str, student, now: float):
+        """
+        Stores the student as the most recently used entry and drops the least recently used entries.
+        Must be called with the lock held.
+        """
+        self._entries[telegram_name] = (student, now)
+        self._entries.move_to_end(telegram_name)
+        self._live_students[telegram_name] = student
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+
+# The live student objects, shared by all handlers and room managers
+student_cache = StudentCache()
+
+
+def set_student_cache_config(new_student_cache_config: dict):
+    """
+    Sets the configuration of the student cache.
+
+    Args:
+        new_student_cache_config (dict): A dictionary that can hold the keys max_size and ttl (seconds).
+    """
+    logger.info('Set student cache config: {}'.format(new_student_cache_config))
+    student_cache.max_size = new_student_cache_config.get('max_size', student_cache.max_size)
+    student_cache.ttl = new_student_cache_config.get('ttl', student_cache.ttl)
+
+
+def get_student_cache_statistics() -> dict:
+    """
+    Returns the hit and miss counters of the student cache.
+    """
+    return student_cache.get_statistics()
@@ -1,4 +1,5 @@
 from .connection import get_connection, close_connection
+from .student_cache import student_cache
 from ..adaptability.proficiency import Proficiency, Grammar, Vocabulary
 import psycopg2
 from psycopg2.extras import execute_values
@@ -34,6 +35,8 @@ def delete_student_data(student):
         query = """DELETE FROM student_data WHERE student_id = '%s';"""
         cur.execute(query, (student_id, ))
         conn.commit()   
+        # the cached student no longer matches the database
+        student_cache.invalidate(student.get_telegram_id())
     except psycopg2.Error as e:
         logger.error(e)
     finally:
@@ -41,11 +44,46 @@ def delete_student_data(student):
             cur.close()
         close_connection(conn)    
 
+def upsert_changed_student_data(cur, students) -> int:
+    """
+    Writes the changed data fields of the students with the given cursor.
+    The caller is responsible for committing the transaction.
+
+    Args:
+        cur (cursor): The cursor that is used for the upsert.
+        students (list): The students whose changed data fields should be written.
+
+    Returns:
+        The number of written rows.
+    """
+    data = []
+    for student in students:
+        data.extend(student.get_changed_data_as_list())
+    # Unchanged students do not cost any write
+    if data:
+        upsert_query = """INSERT INTO student_data (student_id, data_field, value) VALUES %s
+            ON CONFLICT (student_id, data_field) DO UPDATE SET value = EXCLUDED.value"""
+        execute_values(cur, upsert_query, data)
+    return len(data)
+
 def update_student_data(student):
-    # First, delete all rows from student data table for the current user
-    delete_student_data(student)
-    # Then insert the data
-    insert_student_data(student)
+    # Write only the data fields that changed since the last save
+    if not student.changed_data_fields:
+        return
+    cur = None
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        upsert_changed_student_data(cur, [student])
+        conn.commit()
+        student.mark_data_as_saved()
+    except psycopg2.Error as e:
+        logger.error(e)
+    finally:
+        if cur:
+            cur.close()
+        close_connection(conn)
 
 def get_student_data(student_id):
     """
@@ -1,4 +1,5 @@
 from .connection import get_connection, close_connection
+from .student_cache import student_cache
 from ..entities.student import Student
 from ..adaptability.proficiency import Proficiency, Grammar, Vocabulary, Others
 import psycopg2
@@ -35,6 +36,8 @@ def delete_student_proficiency(student):
         query = """DELETE FROM student_proficiency WHERE student_id = '%s';"""
         cur.execute(query, (student_id, ))
         conn.commit()   
+        # the cached student no longer matches the database
+        student_cache.invalidate(student.get_telegram_id())
     except psycopg2.Error as e:
         logger.error(e)
     finally:
@@ -42,11 +45,46 @@ def delete_student_proficiency(student):
             cur.close()
         close_connection(conn)    
 
+def upsert_changed_student_proficiency(cur, students) -> int:
+    """
+    Writes the changed proficiencies of the students with the given cursor.
+    The caller is responsible for committing the transaction.
+
+    Args:
+        cur (cursor): The cursor that is used for the upsert.
+        students (list): The students whose changed proficiencies should be written.
+
+    Returns:
+        The number of written rows.
+    """
+    proficiency_list = []
+    for student in students:
+        proficiency_list.extend(student.get_changed_proficiency_as_list())
+    # Unchanged students do not cost any write
+    if proficiency_list:
+        upsert_query = """INSERT INTO student_proficiency (student_id, proficiency_id, value) VALUES %s
+            ON CONFLICT (student_id, proficiency_id) DO UPDATE SET value = EXCLUDED.value"""
+        execute_values(cur, upsert_query, proficiency_list)
+    return len(proficiency_list)
+
 def update_student_proficiency(student):
-    # First, delete all rows from student proficiency table for the current user
-    delete_student_proficiency(student)
-    # Then insert the proficiency
-    insert_student_proficiency(student)
+    # Write only the proficiencies that changed since the last save
+    if not student.get_proficiency().has_changes():
+        return
+    cur = None
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        upsert_changed_student_proficiency(cur, [student])
+        conn.commit()
+        student.mark_proficiency_as_saved()
+    except psycopg2.Error as e:
+        logger.error(e)
+    finally:
+        if cur:
+            cur.close()
+        close_connection(conn)
 
 def get_student_proficiency(student_id):
     """
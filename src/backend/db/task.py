@@ -6,6 +6,7 @@ import logging
 from typing import List
 
 from .connection import get_connection, close_connection
+from .write_behind import WriteBehindBuffer
 from .task_definition import TASK_DEF_DF, TASK_DEBUG_DEF_DF, Task_cols
 from ..entities.task import Task
 from src.backend.tasks.vocabulary_description import VocabularyDescription
@@ -18,6 +19,8 @@ from src.misc.debug_mode import is_debug_mode_active
 
 
 logger = logging.getLogger(__name__)
+# Adaptive data is only used for analytics, so it is written in the background
+adaptive_data_buffer = WriteBehindBuffer('adaptive_data', max_batch_size=100, flush_interval=5.0)
 
 def get_min_number_of_participants() -> int:
     """
@@ -61,7 +64,7 @@ def get_playable_tasks_for_number_of_participants(
     return lower_case_task_names
 
 
-def create_sentence_corr_task(active_users: List[Student]) -> SentenceCorrection:
+def create_sentence_corr_task(active_users: List[Student], group_chat_id: str = None) -> SentenceCorrection:
 
     if is_debug_mode_active():
         sen_cor_df = get_task_debug_df_row_by_name(SEN_CORR_TASK_NAME)
@@ -73,10 +76,11 @@ def create_sentence_corr_task(active_users: List[Student]) -> SentenceCorrection
 
     return SentenceCorrection(
         users=active_users, difficulty=3,
-        group_iterations=temp_task.get_num_of_iterations())
+        group_iterations=temp_task.get_num_of_iterations(),
+        group_chat_id=group_chat_id)
 
 
-def create_vocab_description_task(active_users: List[Student]) -> VocabularyDescription:
+def create_vocab_description_task(active_users: List[Student], group_chat_id: str = None) -> VocabularyDescription:
 
     if is_debug_mode_active():
         voc_desc_df = get_task_debug_df_row_by_name(VOC_DESC_TASK_NAME)
@@ -88,15 +92,16 @@ def create_vocab_description_task(active_users: List[Student]) -> VocabularyDesc
 
     return VocabularyDescription(
         users=active_users, difficulty=3,
-        group_iterations=temp_task.get_num_of_iterations())
+        group_iterations=temp_task.get_num_of_iterations(),
+        group_chat_id=group_chat_id)
 
 
-def create_discussion_task(active_users: List[Student]) -> Discussion:
+def create_discussion_task(active_users: List[Student], group_chat_id: str = None) -> Discussion:
 
     if is_debug_mode_active():
-        return Discussion(users=active_users, difficulty=3, timelimit=35)
+        return Discussion(users=active_users, difficulty=3, timelimit=35, group_chat_id=group_chat_id)
     else:
-        return Discussion(users=active_users, difficulty=3, timelimit=180)
+        return Discussion(users=active_users, difficulty=3, timelimit=180, group_chat_id=group_chat_id)
 
 
 """
@@ -124,86 +129,92 @@ def get_task_debug_df_row_by_name(task_name):
 
 def insert_sentence_correction_adaptive_data_entry(entry: dict) -> None:
     """
-    Inserts a new sentence correction task iteration
-    entry into the relevant adaptive data table.
+    Queues a new sentence correction task iteration
+    entry for the relevant adaptive data table.
+    The entry is written in the background by the adaptive data buffer.
     """
     timedelta = str(entry['turn_duration']).split(':')
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        query = sql.SQL("""
-            INSERT INTO sentence_correction_adaptive_data (
-                student_id,
-                group_id,
-                turn_start,
-                turn_duration,
-                performance,
-                messages_elected_user,
-                messages_other_users,
-                sentence_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-        """)
-        cur.execute(
-            query,
-            (str(entry['student_id']),
-             entry['group_id'],
-             entry['turn_start'].strftime("%Y-%m-%d %H:%M:%S"),
-             f"{int(timedelta[1])} minutes {round(float(timedelta[2]))} seconds",
-             str(entry['performance']),
-             str(entry['messages_elected_user']),
-             str(entry['messages_other_users']),
-             str(entry['sentence_id']),))
-        conn.commit()
-    except psycopg2.Error as e:
-        logger.error(e)
-    finally:
-        if cur:
-            cur.close()
-        close_connection(conn)
+    query = """
+        INSERT INTO sentence_correction_adaptive_data (
+            student_id,
+            group_id,
+            turn_start,
+            turn_duration,
+            performance,
+            messages_elected_user,
+            messages_other_users,
+            sentence_id)
+        VALUES %s;
+    """
+    adaptive_data_buffer.add(
+        query,
+        (str(entry['student_id']),
+         entry['group_id'],
+         entry['turn_start'].strftime("%Y-%m-%d %H:%M:%S"),
+         f"{int(timedelta[1])} minutes {round(float(timedelta[2]))} seconds",
+         str(entry['performance']),
+         str(entry['messages_elected_user']),
+         str(entry['messages_other_users']),
+         str(entry['sentence_id']),))
 
 
 def insert_vocabulary_guessing_adaptive_data_entry(entry: dict) -> None:
     """
-    Inserts a new vocabulary guesing task iteration
-    entry into the relevant adaptive data table.
+    Queues a new vocabulary guesing task iteration
+    entry for the relevant adaptive data table.
+    The entry is written in the background by the adaptive data buffer.
     """
     timedelta = str(entry['turn_duration']).split(':')
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        query = sql.SQL("""
-            INSERT INTO vocabulary_guessing_adaptive_data (
-                student_id,
-                group_id,
-                turn_start,
-                turn_duration,
-                correct,
-                skipped,
-                messages_elected_user,
-                messages_other_users,
-                description_texts,
-                vocab_word)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """)
-        cur.execute(
-            query,
-            (str(entry['student_id']),
-             entry['group_id'],
-             entry['turn_start'].strftime("%Y-%m-%d %H:%M:%S"),
-             f"{int(timedelta[1])} minutes {round(float(timedelta[2]))} seconds",
-             str(entry['correct']),
-             str(entry['skipped']),
-             str(entry['messages_elected_user']),
-             str(entry['messages_other_users']),
-             str(entry['description_texts']),
-             str(entry['vocab_word']),))
-        conn.commit()
-    except psycopg2.Error as e:
-        logger.error(e)
-    finally:
-        if cur:
-            cur.close()
-        close_connection(conn)
+    query = """
+        INSERT INTO vocabulary_guessing_adaptive_data (
+            student_id,
+            group_id,
+            turn_start,
+            turn_duration,
+            correct,
+            skipped,
+            messages_elected_user,
+            messages_other_users,
+            description_texts,
+            vocab_word)
+        VALUES %s;
+    """
+    adaptive_data_buffer.add(
+        query,
+        (str(entry['student_id']),
+         entry['group_id'],
+         entry['turn_start'].strftime("%Y-%m-%d %H:%M:%S"),
+         f"{int(timedelta[1])} minutes {round(float(timedelta[2]))} seconds",
+         str(entry['correct']),
+         str(entry['skipped']),
+         str(entry['messages_elected_user']),
+         str(entry['messages_other_users']),
+         str(entry['description_texts']),
+         str(entry['vocab_word']),))
+
+
+def flush_adaptive_data(timeout: float = 5.0) -> bool:
+    """
+    Writes all queued adaptive data entries, e.g. at the end of a task, and waits for the write.
+    The path selection after a task reads the entries of the task again.
+
+    Args:
+        timeout (float): The maximum number of seconds to wait for the write.
+
+    Returns:
+        True if the entries were written, false if the timeout passed first.
+    """
+    if not adaptive_data_buffer.flush(timeout):
+        logger.warning('The adaptive data was not written within {} seconds.'.format(timeout))
+        return False
+    return True
+
+
+def stop_adaptive_data_buffer() -> None:
+    """
+    Writes all queued adaptive data entries and stops the background writer.
+    """
+    adaptive_data_buffer.stop()
 
 
 def insert_discussion_adaptive_data_entry(entry: dict) -> None:
@@ -2,13 +2,50 @@ import psycopg2
 import pandas as pd
 import numpy as np
 import random
-from .connection import read_query_into_df
+import logging
+from collections import namedtuple
+from .connection import db_session
+from .base_data import refresh_base_data
+from .content_bank import ContentBank
 from ..entities.word import Word
 from ..adaptability.proficiency import Vocabulary
 import re
 
-# Store last id of word
-last_id = None
+logger = logging.getLogger(__name__)
+
+# A vocabulary guessing item
+WordItem = namedtuple('WordItem', ['id', 'sub_type', 'word', 'difficulty'])
+
+
+def _load_word_items() -> dict:
+    """
+    Loads all vocabulary guessing items from the database, bucketed by (sub_type, difficulty).
+    """
+    query = 'SELECT id, sub_type, word, difficulty FROM vocabulary_guessing_data'
+    buckets = {}
+    with db_session() as conn:
+        cur = conn.cursor()
+        cur.execute(query)
+        for idx, sub_type, word, difficulty in cur.fetchall():
+            buckets.setdefault((sub_type, difficulty), []).append(WordItem(idx, sub_type, word, difficulty))
+        cur.close()
+    return buckets
+
+
+# The vocabulary guessing content is static, so it is kept in memory
+word_bank = ContentBank('vocabulary guessing', _load_word_items)
+
+
+def load_word_bank(file_location: str):
+    """
+    Loads the vocabulary guessing items into memory and reloads them whenever the data file changes.
+
+    Args:
+        file_location (str): The path of the csv file with the vocabulary guessing data.
+    """
+    # a changed data file is merged into the database before the content is reloaded
+    word_bank.set_source_file(file_location, lambda path: refresh_base_data('vocabulary_guessing_task', path))
+    word_bank.load()
 
 
 def get_db_sub_type_id(sub_type):
@@ -26,26 +63,23 @@ def extract_sub_types(db_id):
     return [Vocabulary(db_id)]
 
 
-def get_random_word_based_on_sub_type_and_difficulty(sub_type, difficulty):
-    # TODO add difficulty to selection
-    global last_id
-    # Select sub_type string based on enum
+def get_random_word_based_on_sub_type_and_difficulty(sub_type, difficulty, deck_owner=None):
+    """
+    Draws a word with the sub type and difficulty.
+    The same owner (e.g. a group) does not get a word twice before all words of the bucket were drawn.
+
+    Args:
+        sub_type (Vocabulary): The vocabulary sub type of the word.
+        difficulty (int): The difficulty of the word on a scale of 1-3.
+        deck_owner: The owner of the word deck, e.g. the id of the group chat.
+
+    Returns:
+        A new word object.
+    """
+    # Select sub_type id based on enum
     sub_type_id = get_db_sub_type_id(sub_type)
-    # Execute select database statement # TODO use sub_type_id in selection query
-    query = """SELECT * FROM vocabulary_guessing_data WHERE sub_type = %s AND difficulty = %s ORDER BY RANDOM() LIMIT 1;"""
-    df = read_query_into_df(query, params=[sub_type_id, difficulty])
-    # print(sub_type_id)
-    # print(difficulty)
-    # print(df)
-    # Check if that word was selected before
-    new_id = df["id"].values[0]
-    # TODO: We need to get the last id for the group here not the last selected in general
-    if new_id == last_id:
-        return get_random_word_based_on_sub_type_and_difficulty(
-            sub_type, difficulty)
-    else:
-        last_id = new_id
-        # Extract sub-types as a list of sub-type enums
-        sub_types = extract_sub_types(df['sub_type'][0])
-        # Parse data into word object
-        return Word(word=df['word'][0], sub_types=sub_types)
+    item = word_bank.draw((sub_type_id, difficulty), deck_owner)
+    if item is None:
+        raise LookupError('There is no word with sub type {} and difficulty {}.'.format(sub_type_id, difficulty))
+    # Parse data into word object
+    return Word(word=item.word, sub_types=extract_sub_types(item.sub_type))
@@ -0,0 +1,254 @@
+import psycopg2
+import logging
+import queue
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from .connection import db_session
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Collects rows for insert statements and writes them in batches on a background thread,
+    so the caller never waits for the database.
+    A batch is written when it reaches the maximum batch size, when the flush interval has passed,
+    when a flush is requested or when the buffer is stopped.
+    While the database is unreachable, the rows are kept and written again later.
+    """
+
+    def __init__(self, name: str, max_batch_size: int = 100, flush_interval: float = 5.0, max_queue_size: int = 10000,
+                 max_retry_interval: float = 60.0):
+        """
+        Initializes the buffer. The background thread is started with the first row.
+
+        Args:
+            name (str): The name of the buffer, used for the thread and the log messages.
+            max_batch_size (int): The maximum number of rows written in one batch.
+            flush_interval (float): The maximum number of seconds a row waits in the buffer.
+            max_queue_size (int): The maximum number of queued rows, further rows are dropped.
+            max_retry_interval (float): The maximum number of seconds between two attempts to write rows
+                while the database is unreachable.
+        """
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retry_interval = max_retry_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # the rows that could not be written because the database was unreachable
+        self._retry_batch = []
+        self._retry_delay = 0.0
+        # the number of queued rows that were written or dropped, the rows are processed in the order of the queue
+        self._processed_rows = 0
+        self._processed = threading.Condition(self._lock)
+        self._stats = {
+            'queued_rows': 0,
+            'written_rows': 0,
+            'dropped_rows': 0,
+            'retried_rows': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'last_flush_latency': 0.0,
+            'max_flush_latency': 0.0
+        }
+
+    def _start(self):
+        """
+        Starts the background thread if it is not running.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='{}-writer'.format(self.name), daemon=True)
+                self._thread.start()
+
+    def add(self, insert_query: str, row: tuple) -> bool:
+        """
+        Queues a row for the insert statement without blocking.
+
+        Args:
+            insert_query (str): An insert statement with a single VALUES %s placeholder.
+            row (tuple): The values of the row.
+
+        Returns:
+            True if the row was queued, false if the buffer is full and the row was dropped.
+        """
+        self._start()
+        try:
+            self._queue.put_nowait((insert_query, row))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped_rows'] += 1
+            logger.warning('The {} buffer is full, a row was dropped.'.format(self.name))
+            return False
+        with self._lock:
+            self._stats['queued_rows'] += 1
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Asks the background thread to write all queued rows now.
+
+        Args:
+            timeout (float): If set, waits up to this number of seconds until the rows that were queued
+                before the call are written or dropped. None does not wait for the write.
+
+        Returns:
+            True if the rows were written or no timeout was given, false if the timeout passed first.
+        """
+        self._start()
+        with self._lock:
+            target = self._stats['queued_rows']
+        self._flush_requested.set()
+        if timeout is None:
+            return True
+        with self._processed:
+            return self._processed.wait_for(lambda: self._processed_rows >= target, timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Writes all queued rows and stops the background thread.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait for the remaining rows to be written.
+        """
+        self._stopped.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning('The {} buffer was stopped with {} unwritten rows.'.format(self.name, self._queue.qsize()))
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the metrics of the buffer.
+
+        Returns:
+            A dictionary with the current queue depth, the number of queued, written and dropped rows,
+            the number of rows that were kept for another attempt because the database was unreachable,
+            the number of (failed) flushes and the last and maximum flush latency in seconds.
+        """
+        with self._lock:
+            stats = self._stats.copy()
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
+
+    def _run(self):
+        """
+        The loop of the background thread.
+        """
+        while True:
+            if self._retry_batch:
+                # the database was unreachable, the failed rows are written before any new rows
+                self._stopped.wait(self._retry_delay)
+                batch = self._retry_batch
+            else:
+                batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+            if self._stopped.is_set() and self._queue.empty() and not self._retry_batch:
+                return
+
+    def _collect_batch(self) -> list:
+        """
+        Collects queued rows until the batch is full, the flush interval has passed or a flush is requested.
+        """
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            if self._flush_requested.is_set() or self._stopped.is_set():
+                # take everything that is queued right now
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    self._flush_requested.clear()
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # wake up regularly to react to flush requests
+                batch.append(self._queue.get(timeout=min(remaining, 0.2)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _write(self, batch: list):
+        """
+        Writes the batch with one execute_values call per insert statement.
+        Rows that fail because the database is unreachable are kept for the next attempt,
+        rows that are rejected by the database are dropped without dropping the rest of the batch.
+        """
+        rows_by_query = {}
+        for insert_query, row in batch:
+            rows_by_query.setdefault(insert_query, []).append(row)
+        flush_start = time.monotonic()
+        retry = []
+        written = 0
+        for insert_query, rows in rows_by_query.items():
+            written += self._write_rows(insert_query, rows, retry)
+        latency = time.monotonic() - flush_start
+
+        dropped = len(batch) - written - len(retry)
+        if retry and self._stopped.is_set():
+            logger.error('The {} buffer was stopped while the database was unreachable, {} rows were dropped.'.format(
+                self.name, len(retry)))
+            dropped += len(retry)
+            retry = []
+        # the rows are written again after a growing delay, new rows wait in the queue meanwhile
+        self._retry_batch = retry
+        self._retry_delay = min(max(2 * self._retry_delay, 1.0), self.max_retry_interval) if retry else 0.0
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['last_flush_latency'] = latency
+            self._stats['max_flush_latency'] = max(self._stats['max_flush_latency'], latency)
+            self._stats['written_rows'] += written
+            self._stats['dropped_rows'] += dropped
+            self._stats['retried_rows'] += len(retry)
+            if written < len(batch):
+                self._stats['failed_flushes'] += 1
+            self._processed_rows += written + dropped
+            self._processed.notify_all()
+        logger.debug('The {} buffer wrote {} rows in {:.3f} seconds, {} rows are queued.'.format(
+            self.name, written, latency, self._queue.qsize()))
+
+    def _write_rows(self, insert_query: str, rows: list, retry: list) -> int:
+        """
+        Writes the rows of an insert statement in one transaction. If the database rejects the rows,
+        both halves are written separately until only the rejected rows are left, which are dropped.
+
+        Args:
+            insert_query (str): The insert statement of the rows.
+            rows (list): The values of the rows.
+            retry (list): The list the rows are added to if the database is unreachable.
+
+        Returns:
+            The number of written rows.
+        """
+        try:
+            with db_session() as conn:
+                cur = conn.cursor()
+                execute_values(cur, insert_query, rows, page_size=self.max_batch_size)
+                cur.close()
+            return len(rows)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # the connection failed, the rows themselves may be fine
+            logger.error('The {} buffer could not write {} rows, they are written again later: {}'.format(
+                self.name, len(rows), e))
+            retry.extend((insert_query, row) for row in rows)
+            return 0
+        except psycopg2.Error as e:
+            if len(rows) == 1:
+                logger.error('The {} buffer dropped a row that could not be written: {}'.format(self.name, e))
+                return 0
+            middle = len(rows) // 2
+            return self._write_rows(insert_query, rows[:middle], retry) + \
+                self._write_rows(insert_query, rows[middle:], retry)
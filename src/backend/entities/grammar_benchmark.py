@@ -0,0 +1,217 @@
+"""Benchmarks the grammar classification on the annotated BEA evaluation set.
+
+Run from the repository root:
+    python -m src.backend.entities.grammar_benchmark --output ./logs/grammar_benchmark.json
+    python -m src.backend.entities.grammar_benchmark --compare ./logs/baseline.json ./logs/grammar_benchmark.json
+
+Every engine (the GrammarClassifier, GECToR alone and LanguageTool alone) runs in its own process, so the
+peak memory of one engine does not include the others. The memory of the LanguageTool server is not included,
+it runs in a separate Java process. The correct sentences of the evaluation set are labelled correct and the
+erroneous ones incorrect. With --compare, the check fails (exit code 1) if the second run is slower or less
+accurate than allowed.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+
+from src.backend.models.gector.evaluation_data import get_scores, load_labelled_sentences
+
+ENGINES = ['classifier', 'gector', 'languagetool']
+VOCAB_PATH = './data/gector/output_vocabulary/'
+MODEL_PATH = './data/gector/model/model.th'
+
+
+def get_classifier_function(options):
+    """Returns a function that flags the incorrect sentences of a batch with the GrammarClassifier."""
+    from src.backend.entities.grammar_classifier import GrammarClassifier
+
+    # no verdict may come from the cache
+    classifier = GrammarClassifier(cache_size=0, **options)
+    return lambda sents: [correctness_value < 1 for correctness_value, _ in classifier.classify_batch(sents)]
+
+
+def get_gector_function(options):
+    """Returns a function that flags the sentences of a batch that GECToR corrects."""
+    from src.backend.models.gector.gec_model import GecBERTModel
+
+    model = GecBERTModel(VOCAB_PATH, model_paths=[MODEL_PATH], weigths=None, max_len=50, min_len=3, iterations=5,
+                         lowercase_tokens=0, log=False, model_name='roberta', special_tokens_fix=1, is_ensemble=0,
+                         min_error_probability=0.0, confidence=0, quantize=options['quantize'],
+                         backend=options['backend'], onnx_paths=[options['onnx_path']],
+                         mmap_paths=[options['mmap_dir']] if options['mmap_dir'] else None)
+    if options['detection_threshold'] is not None:
+        threshold = options['detection_threshold']
+        return lambda sents: [error_prob >= threshold
+                              for error_prob in model.detect([sent.split() for sent in sents], threshold)[0]]
+
+    def correct(sents):
+        preds, _ = model.handle_batch([sent.split() for sent in sents])
+        return [sent.lower() != " ".join(pred).lower() for sent, pred in zip(sents, preds)]
+    return correct
+
+
+def get_languagetool_function(options):
+    """Returns a function that flags the sentences of a batch that LanguageTool alone does not judge correct.
+    The rules and the verdict are those of the GrammarClassifier."""
+    from src.backend.entities.grammar_classifier import GrammarClassifier
+
+    language_tool = GrammarClassifier.create_language_tool(options['language_tool_rules'])
+    return lambda sents: [GrammarClassifier.get_language_tool_verdict(language_tool.check(sent))[0] < 1
+                          for sent in sents]
+
+
+def run_engine(engine, input_file, batch_size, options):
+    """Classifies the evaluation set with the engine.
+
+    Returns:
+        The metrics of the run: the number of sentences, the runtime, the throughput, the latency percentiles
+        of a batch in milliseconds, the peak memory of the process and the accuracy, precision and recall.
+    """
+    sentences, labels = load_labelled_sentences(input_file)
+    function = {'classifier': get_classifier_function,
+                'gector': get_gector_function,
+                'languagetool': get_languagetool_function}[engine](options)
+    # the first call starts the LanguageTool server and initializes the model
+    function(sentences[:1])
+
+    verdicts = []
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(sentences), batch_size):
+        batch_start = time.perf_counter()
+        verdicts.extend(function(sentences[i:i + batch_size]))
+        latencies.append(time.perf_counter() - batch_start)
+    runtime = time.perf_counter() - start
+
+    accuracy, precision, recall = get_scores(verdicts, labels)
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        'sentences': len(sentences),
+        'seconds': runtime,
+        'sentences_per_second': len(sentences) / runtime,
+        'latency_ms': {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)},
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'accuracy': accuracy,
+        'precision': precision,
+        'recall': recall
+    }
+
+
+def run_benchmark(engines, input_file, batch_size, options):
+    """Runs every engine in a new process and returns the results of the run."""
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'input_file': input_file,
+        'batch_size': batch_size,
+        'options': options,
+        'engines': {}
+    }
+    context = multiprocessing.get_context('spawn')
+    for engine in engines:
+        with context.Pool(1) as pool:
+            results['engines'][engine] = pool.apply(run_engine, (engine, input_file, batch_size, options))
+        print_engine_results(engine, results['engines'][engine])
+    return results
+
+
+def print_engine_results(engine, metrics):
+    print(f"{engine}: {metrics['sentences_per_second']:.1f} sentences/s, "
+          f"latency p50 {metrics['latency_ms']['p50']:.1f}ms, p95 {metrics['latency_ms']['p95']:.1f}ms, "
+          f"p99 {metrics['latency_ms']['p99']:.1f}ms, peak RSS {metrics['peak_rss_mb']:.0f}MB, "
+          f"accuracy {100 * metrics['accuracy']:.1f}%, precision {100 * metrics['precision']:.1f}%, "
+          f"recall {100 * metrics['recall']:.1f}%")
+
+
+def compare_runs(baseline, current, max_slowdown, max_accuracy_drop):
+    """Compares the engines that are part of both runs.
+
+    Args:
+        baseline: results of the earlier run.
+        current: results of the run that is checked.
+        max_slowdown: maximum allowed loss of throughput and growth of the p95 latency, as a fraction.
+        max_accuracy_drop: maximum allowed loss of precision and recall, as a fraction.
+
+    Returns:
+        The list of regressions, empty if there are none.
+    """
+    regressions = []
+    for engine in ENGINES:
+        if engine not in baseline['engines'] or engine not in current['engines']:
+            continue
+        old, new = baseline['engines'][engine], current['engines'][engine]
+        throughput_change = new['sentences_per_second'] / old['sentences_per_second'] - 1
+        latency_change = new['latency_ms']['p95'] / old['latency_ms']['p95'] - 1
+        print(f"{engine}: throughput {100 * throughput_change:+.1f}%, p95 latency {100 * latency_change:+.1f}%, "
+              f"peak RSS {new['peak_rss_mb'] - old['peak_rss_mb']:+.0f}MB, "
+              f"precision {100 * (new['precision'] - old['precision']):+.1f} points, "
+              f"recall {100 * (new['recall'] - old['recall']):+.1f} points")
+        if throughput_change < -max_slowdown:
+            regressions.append(f"{engine}: the throughput dropped by {-100 * throughput_change:.1f}%")
+        if latency_change > max_slowdown:
+            regressions.append(f"{engine}: the p95 latency grew by {100 * latency_change:.1f}%")
+        for metric in ['precision', 'recall']:
+            if old[metric] - new[metric] > max_accuracy_drop:
+                regressions.append(f"{engine}: the {metric} dropped by {100 * (old[metric] - new[metric]):.1f} points")
+    return regressions
+
+
+def main(args):
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as baseline_file, \
+                open(args.compare[1], encoding='utf-8') as current_file:
+            baseline, current = json.load(baseline_file), json.load(current_file)
+        if baseline['batch_size'] != current['batch_size'] or baseline['options'] != current['options']:
+            print("Warning! The runs were made with different settings.")
+        regressions = compare_runs(baseline, current, args.max_slowdown, args.max_accuracy_drop)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit(1)
+        return
+
+    options = {'detection_threshold': args.detection_threshold, 'quantize': args.quantize, 'backend': args.backend,
+               'onnx_path': args.onnx_path, 'mmap_dir': args.mmap_dir, 'language_tool_rules': args.language_tool_rules}
+    engines = ENGINES if args.engine == 'all' else [args.engine]
+    results = run_benchmark(engines, args.input_file, args.batch_size, options)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=4)
+        print(f"Wrote the results to {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input_file', default='./data/test_data/BEA_eval_common_errors_annotated.csv',
+                        help='Path to the annotated evaluation set.')
+    parser.add_argument('--engine', choices=ENGINES + ['all'], default='all',
+                        help='The engine to benchmark.')
+    parser.add_argument('--batch_size', type=int, default=1,
+                        help='Number of sentences per call, 1 measures the latency of a single sentence.')
+    parser.add_argument('--output', default=None,
+                        help='Path of the JSON file the results are written to.')
+    parser.add_argument('--detection_threshold', type=float, default=None,
+                        help='Use the detection of GECToR with this threshold, like the grammar_classifier config.')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Quantize GECToR to int8.')
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch',
+                        help='The backend of GECToR.')
+    parser.add_argument('--onnx_path', default='./data/gector/model/model_0.onnx',
+                        help='The exported model of the onnx backend.')
+    parser.add_argument('--mmap_dir', default=None,
+                        help='The directory of the converted weights of GECToR.')
+    parser.add_argument('--language_tool_rules', choices=['all', 'scoped'], default='all',
+                        help='The LanguageTool rules of the classifier and of LanguageTool alone.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), default=None,
+                        help='Compare two result files instead of running the benchmark.')
+    parser.add_argument('--max_slowdown', type=float, default=0.1,
+                        help='Maximum allowed loss of throughput and growth of the p95 latency, as a fraction.')
+    parser.add_argument('--max_accuracy_drop', type=float, default=0.01,
+                        help='Maximum allowed loss of precision and recall, as a fraction.')
+    main(parser.parse_args())
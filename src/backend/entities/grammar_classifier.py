@@ -1,6 +1,17 @@
 # This is where the two models go and the classification function
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
 import language_tool_python
+from concurrent import futures
 from src.backend.models.gector.gec_model import GecBERTModel
+from src.backend.entities.verdict_cache import VerdictCache
+from src.backend.entities.language_tool_pool import LanguageToolPool
+
+MODEL_PATH = './data/gector/model/model.th'
 
 
 class GrammarClassifier():
@@ -32,61 +43,390 @@ class GrammarClassifier():
                   'EN_SPECIFIC_CASE',
                   'CHILDISH_LANGUAGE',
                   'EN_QUOTES']
+    # rules that compare sentences with each other, which never match a single sentence
+    # but would match the joined sentences of a batch
+    CROSS_SENTENCE_RULES = ['ENGLISH_WORD_REPEAT_BEGINNING_RULE',
+                            'PARAGRAPH_REPEAT_BEGINNING_RULE']
+    # the sentences of a batch are checked by LanguageTool as separate paragraphs of one text
+    SENTENCE_SEPARATOR = '\n\n'
+    # the version of the verdict logic of LanguageTool, cached verdicts of other versions are discarded
+    VERDICT_VERSION = 2
+    # the verdict of a sentence that neither engine checked before the deadline, the sentence is not penalized
+    NO_VERDICT = (1, [])
 
-    def __init__(self):
+    def __init__(self, detection_threshold: float = None, quantize: bool = False, backend: str = 'torch',
+                 onnx_path: str = './data/gector/model/model_0.onnx', cache_size: int = 10000, cache_file: str = None,
+                 mmap_dir: str = None, language_tool_rules: str = 'all', concurrent_engines: bool = False,
+                 deadline: float = None, language_tool_servers: int = 0, language_tool_port: int = 8081,
+                 language_tool_heap: str = '512m', language_tool_urls: list = None):
         """
         Initializes a GrammarClassifier.
+
+        Parameters
+        ----------
+            detection_threshold : float
+                If set, GECToR only runs its detection head once and a sentence counts as incorrect
+                if a token has at least this error probability. Otherwise, the sentence is corrected
+                iteratively and counts as incorrect if the correction differs from it.
+            quantize : bool
+                If true, the linear layers of GECToR are quantized to int8, which is faster on CPU
+                but slightly less accurate.
+            backend : str
+                'torch' runs GECToR with PyTorch, 'onnx' runs the exported model with onnxruntime on CPU.
+            onnx_path : str
+                The exported model that is used by the onnx backend.
+            cache_size : int
+                The maximum number of sentence verdicts that are kept in memory.
+            cache_file : str
+                The path of an sqlite file that keeps the verdicts across restarts, None to keep them only in memory.
+            mmap_dir : str
+                The directory of the converted weights (see mmap_weights). If set, the weights are mapped
+                into memory instead of being loaded, which starts faster and shares them between processes.
+            language_tool_rules : str
+                'all' checks all rules of LanguageTool, 'scoped' does not check the ignored categories and rules
+                at all, which is faster. Both modes give the same verdicts, because ignored matches never lower
+                the correctness value.
+            concurrent_engines : bool
+                If true, LanguageTool and GECToR check the sentences at the same time instead of one after the other.
+                GECToR is not waited for if LanguageTool finds common errors in all sentences.
+            deadline : float
+                The maximum number of seconds the classification of a batch waits for the engines if they run
+                concurrently. The budget covers the whole batch, not each of its sentences. Afterwards,
+                the degraded verdict of the engine that finished is returned, or NO_VERDICT if neither finished.
+                None waits for both engines.
+            language_tool_servers : int
+                The number of local LanguageTool servers the checks are spread across.
+                0 uses the single server that is started by python_language_toolkit.
+            language_tool_port : int
+                The port of the first LanguageTool server of the pool, the others use the following ports.
+            language_tool_heap : str
+                The maximum Java heap size of each LanguageTool server of the pool, e.g. '512m'.
+            language_tool_urls : list
+                The URLs of running LanguageTool servers, e.g. those of the bot process in a grammar worker.
+                If set, the checks are spread across them and no server is started.
         """
+        self.detection_threshold = detection_threshold
+        self.concurrent_engines = concurrent_engines
+        self.deadline = deadline
+        # one thread per engine, so the checks of an engine never overlap
+        self._language_tool_executor = futures.ThreadPoolExecutor(1, thread_name_prefix='language-tool')
+        self._gector_executor = futures.ThreadPoolExecutor(1, thread_name_prefix='gector')
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'concurrent_batches': 0,
+            'short_circuits': 0,
+            'deadline_exceeded': 0,
+            'degraded_language_tool_only': 0,
+            'degraded_gector_only': 0,
+            'degraded_no_verdict': 0
+        }
+        # the verdicts are only valid for the same model and rules
+        if backend == 'onnx':
+            model_path = onnx_path
+        elif mmap_dir is not None:
+            model_path = os.path.join(mmap_dir, 'weights.bin')
+        else:
+            model_path = MODEL_PATH
+        fingerprint = self._get_fingerprint(model_path,
+                                            detection_threshold=detection_threshold, quantize=quantize, backend=backend)
+        self.verdict_cache = VerdictCache(fingerprint, max_size=cache_size, file_location=cache_file)
         try:
             self.gector_model = GecBERTModel(
                 './data/gector/output_vocabulary/',
-                model_paths=['./data/gector/model/model.th'],
+                model_paths=[MODEL_PATH],
                 weigths=None, max_len=50, min_len=3, iterations=5,
                 lowercase_tokens=0, log=False, model_name='roberta',
                 special_tokens_fix=1, is_ensemble=0, min_error_probability=0.0,
-                confidence=0)
+                confidence=0, quantize=quantize, backend=backend, onnx_paths=[onnx_path],
+                mmap_paths=[mmap_dir] if mmap_dir is not None else None)
         except FileNotFoundError:
             print(
                 "The file of the model has not been found where it should be (./data/gector/model/model.th)")
             print("You can download it from here: https://drive.google.com/file/d/1GXxl6mThLKBpImjFNpL9sRTYu4mR93kX/view?usp=sharing")
 
-        self.language_tool = language_tool_python.LanguageTool('en-US')
+        if language_tool_urls:
+            self.language_tool = LanguageToolPool(
+                lambda remote_server: self.create_language_tool(language_tool_rules, remote_server)
+            ).connect(language_tool_urls)
+        elif language_tool_servers > 0:
+            self.language_tool = LanguageToolPool(
+                lambda remote_server: self.create_language_tool(language_tool_rules, remote_server),
+                size=language_tool_servers, first_port=language_tool_port, heap_size=language_tool_heap).start()
+        else:
+            self.language_tool = self.create_language_tool(language_tool_rules)
         # make test classification to start the python language tool
         self.language_tool.check('This is a test sentence.')
 
-    def classify(self, sent: str) -> tuple:
+    def get_language_tool_urls(self) -> list:
         """
-        Identifies errors and calculates a correctness value for a given string.
+        Returns the URLs of the LanguageTool servers of the pool or None if no pool is used.
+        """
+        if isinstance(self.language_tool, LanguageToolPool):
+            return self.language_tool.get_urls()
+        return None
+
+    @classmethod
+    def create_language_tool(cls, language_tool_rules: str = 'all', remote_server: str = None):
+        """
+        Starts a LanguageTool server for en-US or connects to a running one.
 
         Parameters
         ----------
-            sent : str
-                The sentence to be evaluated.
+            language_tool_rules : str
+                'all' enables all rules, 'scoped' disables the ignored categories and rules.
+            remote_server : str
+                The URL of a running LanguageTool server or None to start a new one.
+        """
+        if language_tool_rules not in ['all', 'scoped']:
+            raise ValueError("language_tool_rules must be 'all' or 'scoped', not {}".format(language_tool_rules))
+        language_tool = language_tool_python.LanguageTool('en-US', remote_server=remote_server)
+        language_tool.disabled_rules.update(cls.CROSS_SENTENCE_RULES)
+        if language_tool_rules == 'scoped':
+            language_tool.disabled_categories.update(cls.BAD_ERROR_CATEGORIES)
+            language_tool.disabled_rules.update(cls.BAD_ERRORS)
+        return language_tool
+
+    @classmethod
+    def is_ignored(cls, error) -> bool:
+        """
+        Whether a LanguageTool match belongs to the ignored categories or rules.
+        """
+        return error.category in cls.BAD_ERROR_CATEGORIES or error.ruleId in cls.BAD_ERRORS
+
+    @classmethod
+    def get_language_tool_verdict(cls, error_matches: list) -> tuple:
+        """
+        Determines the correctness of a sentence from the LanguageTool matches of the sentence.
+        Matches of the ignored categories and rules are skipped, so the verdict is the same
+        whether LanguageTool checked them or not.
 
         Returns
         -------
-            A tuple consisting of:
-            - the correctness value of the sentence (in float)
-            - the list of error types that were detected for the sentence
+            A tuple of the correctness value and the list of common error types.
+            If common errors were found, the correctness value is final.
         """
         error_types = []
         correctness_value = 1
 
-        # determine correctness according to python_language_toolkit
-        error_matches = self.language_tool.check(sent)
+        error_matches = [error for error in error_matches if not cls.is_ignored(error)]
         for error in error_matches:
-            if (error.category not in self.BAD_ERROR_CATEGORIES) and (error.ruleId not in self.BAD_ERRORS):
-                if error.ruleId in self.COMMON_ERRORS:
-                    error_types.append(error.ruleId)
+            if error.ruleId in cls.COMMON_ERRORS:
+                error_types.append(error.ruleId)
         if error_types:
             return (0, error_types)
         if error_matches:
             correctness_value -= 0.5
+        return (correctness_value, error_types)
 
-        # determine correctness according to GECToR
-        pred, _ = self.gector_model.handle_batch([sent.split()])
-        pred = " ".join(pred[0])
-        if sent.lower() != pred.lower():
-            correctness_value -= 0.5
+    def classify(self, sent: str) -> tuple:
+        """
+        Identifies errors and calculates a correctness value for a given string.
+
+        Parameters
+        ----------
+            sent : str
+                The sentence to be evaluated.
+
+        Returns
+        -------
+            A tuple consisting of:
+            - the correctness value of the sentence (in float)
+            - the list of error types that were detected for the sentence
+        """
+        return self.classify_batch([sent])[0]
+
+    def classify_batch(self, sents: list) -> list:
+        """
+        Identifies errors and calculates correctness values for several strings.
+        The sentences that need GECToR are corrected together in one batch.
+
+        Parameters
+        ----------
+            sents : list
+                The sentences to be evaluated.
+
+        Returns
+        -------
+            A list with a tuple of the correctness value and the list of error types for each sentence.
+        """
+        results = [self.verdict_cache.get(sent) for sent in sents]
+        missing_ids = [i for i, result in enumerate(results) if result is None]
+        if missing_ids:
+            missing_sents = [sents[i] for i in missing_ids]
+            verdicts, complete = self.classify_uncached(missing_sents)
+            # degraded verdicts are not cached, the sentence is classified again next time
+            self.verdict_cache.put_all([sent for sent, is_complete in zip(missing_sents, complete) if is_complete],
+                                       [verdict for verdict, is_complete in zip(verdicts, complete) if is_complete])
+            for i, verdict in zip(missing_ids, verdicts):
+                results[i] = verdict
+        return results
+
+    def classify_uncached(self, sents: list) -> tuple:
+        """
+        Classifies the sentences with python_language_toolkit and GECToR without using the verdict cache,
+        see classify_batch.
+
+        Returns
+        -------
+            A tuple of the list of verdicts and a list whether each verdict is complete.
+            A verdict is incomplete if an engine missed the deadline.
+        """
+        if self.concurrent_engines:
+            return self._classify_concurrently(sents)
+        results = self._check_language_tool(sents)
+
+        # determine correctness according to GECToR for the sentences without common errors
+        gector_ids = [i for i, (_, error_types) in enumerate(results) if not error_types]
+        if gector_ids:
+            incorrect = self._check_gector([sents[i] for i in gector_ids])
+            results = self._combine_verdicts(results, dict(zip(gector_ids, incorrect)))
+        return results, [True] * len(sents)
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the metrics of the classifier.
+
+        Returns
+        -------
+            A dictionary with the statistics of the verdict cache, the padding statistics of GECToR
+            (see GecBERTModel.get_padding_statistics) and the numbers of batches that were classified concurrently,
+            that did not wait for GECToR because of common errors, that missed the deadline
+            and of degraded verdicts from a single engine or from none. If a pool of LanguageTool servers is used,
+            also the statistics of every server.
+        """
+        with self._stats_lock:
+            engines = self._stats.copy()
+        stats = {'cache': self.verdict_cache.get_statistics(),
+                 'padding': self.gector_model.get_padding_statistics(),
+                 'engines': engines}
+        if isinstance(self.language_tool, LanguageToolPool):
+            stats['language_tool_servers'] = self.language_tool.get_statistics()
+        return stats
+
+    def _classify_concurrently(self, sents: list) -> tuple:
+        """
+        Checks the sentences with LanguageTool and GECToR at the same time, see classify_uncached.
+        """
+        deadline = None if self.deadline is None else time.monotonic() + self.deadline
+        language_tool_future = self._language_tool_executor.submit(self._check_language_tool, sents)
+        gector_future = self._gector_executor.submit(self._check_gector, sents)
+        self._count('concurrent_batches')
+
+        # common errors are final, GECToR is not needed for them
+        futures.wait([language_tool_future], timeout=self._get_remaining_time(deadline))
+        if language_tool_future.done():
+            language_tool_results = language_tool_future.result()
+            if all(error_types for _, error_types in language_tool_results):
+                gector_future.cancel()
+                self._count('short_circuits')
+                return language_tool_results, [True] * len(sents)
+
+        pending = [language_tool_future, gector_future]
+        futures.wait(pending, timeout=self._get_remaining_time(deadline))
+        if language_tool_future.done() and gector_future.done():
+            results = self._combine_verdicts(language_tool_future.result(), dict(enumerate(gector_future.result())))
+            return results, [True] * len(sents)
+
+        self._count('deadline_exceeded')
+        # checks that have not started yet are dropped, so the following batches do not wait behind them
+        for future in pending:
+            future.cancel()
+        finished = [future.done() and not future.cancelled() for future in pending]
+        if finished[0]:
+            results = language_tool_future.result()
+            complete = [bool(error_types) for _, error_types in results]
+            self._count('degraded_language_tool_only', complete.count(False))
+            return results, complete
+        if finished[1]:
+            results = [(0.5 if is_incorrect else 1, []) for is_incorrect in gector_future.result()]
+            self._count('degraded_gector_only', len(sents))
+            return results, [False] * len(sents)
+        # neither engine finished in time
+        self._count('degraded_no_verdict', len(sents))
+        return [self.NO_VERDICT] * len(sents), [False] * len(sents)
+
+    def _check_gector(self, sents: list) -> list:
+        """
+        Returns whether GECToR considers each sentence incorrect.
+        """
+        token_batch = [sent.split() for sent in sents]
+        if self.detection_threshold is not None:
+            error_probs, _ = self.gector_model.detect(token_batch, self.detection_threshold)
+            return [error_prob >= self.detection_threshold for error_prob in error_probs]
+        preds, _ = self.gector_model.handle_batch(token_batch)
+        return [sent.lower() != " ".join(pred).lower() for sent, pred in zip(sents, preds)]
+
+    @staticmethod
+    def _combine_verdicts(language_tool_results: list, incorrect: dict) -> list:
+        """
+        Lowers the correctness values of the LanguageTool verdicts of the sentences GECToR considers incorrect.
+        The verdicts of sentences with common errors are final.
+        """
+        results = []
+        for i, (correctness_value, error_types) in enumerate(language_tool_results):
+            if not error_types and incorrect.get(i, False):
+                correctness_value -= 0.5
+            results.append((correctness_value, error_types))
+        return results
+
+    @staticmethod
+    def _get_remaining_time(deadline: float):
+        """
+        Returns the number of seconds until the deadline or None if there is no deadline.
+        """
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _get_fingerprint(self, model_path: str, **options) -> str:
+        """
+        Returns a hash of the model checkpoint, the rules and the options that decide the verdicts.
+        The checkpoint is identified by its path, size and modification time.
+        """
+        try:
+            model_stat = os.stat(model_path)
+            model = [model_path, model_stat.st_size, model_stat.st_mtime]
+        except OSError:
+            model = [model_path]
+        description = json.dumps({
+            'model': model,
+            'options': options,
+            'common_errors': self.COMMON_ERRORS,
+            'bad_error_categories': self.BAD_ERROR_CATEGORIES,
+            'bad_errors': self.BAD_ERRORS,
+            'verdict_version': self.VERDICT_VERSION,
+            'cross_sentence_rules': self.CROSS_SENTENCE_RULES
+        }, sort_keys=True)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _check_language_tool(self, sents: list) -> list:
+        """
+        Determines the correctness of the sentences according to python_language_toolkit with one check.
+        The sentences are joined into paragraphs of one text and every match is mapped back to its sentence
+        by its offset. Matches of the separators and matches that reach beyond the end of their sentence
+        belong to no sentence, they only exist because the sentences were checked together.
+
+        Returns
+        -------
+            A list with a tuple of the correctness value and the list of common error types for each sentence.
+            If common errors were found, the correctness value is final.
+        """
+        if not sents:
+            return []
+        # LanguageTool counts the offsets in UTF-16 code units
+        starts = []
+        lengths = [len(sent.encode('utf-16-le')) // 2 for sent in sents]
+        separator_length = len(self.SENTENCE_SEPARATOR)
+        offset = 0
+        for length in lengths:
+            starts.append(offset)
+            offset += length + separator_length
 
-        return (correctness_value, [])
+        sentence_matches = [[] for _ in sents]
+        for error in self.language_tool.check(self.SENTENCE_SEPARATOR.join(sents)):
+            i = bisect.bisect_right(starts, error.offset) - 1
+            if i >= 0 and error.offset + error.errorLength <= starts[i] + lengths[i]:
+                sentence_matches[i].append(error)
+        return [self.get_language_tool_verdict(error_matches) for error_matches in sentence_matches]
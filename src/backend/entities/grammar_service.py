@@ -0,0 +1,195 @@
+import logging
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class GrammarInferenceService():
+    """
+    Classifies the sentences of all groups on a single background thread.
+    Pending sentences are collected into batches, so the GECToR model runs one forward pass per batch
+    instead of one per sentence.
+    """
+
+    # Put into the queue to stop the background thread
+    _STOP = object()
+
+    def __init__(self, classifier_factory, max_batch_size: int = 16, max_wait: float = 0.05,
+                 result_timeout: float = 60.0):
+        """
+        Initializes the service. The classifier is created when the service is started.
+
+        Parameters
+        ----------
+            classifier_factory : function
+                A function that creates the classifier with the classifier options,
+                e.g. the GrammarClassifier class.
+            max_batch_size : int
+                The maximum number of sentences that are classified in one batch.
+            max_wait : float
+                The maximum number of seconds a sentence waits for further sentences of its batch.
+            result_timeout : float
+                The maximum number of seconds a caller waits for the verdict of a sentence.
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.result_timeout = result_timeout
+        self._classifier_factory = classifier_factory
+        # The keyword arguments the classifier is created with
+        self.classifier_options = {}
+        self._classifier = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'sentences': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'max_batch_size': 0,
+            'queue_wait_total': 0.0,
+            'batch_latency_total': 0.0,
+            'batch_latency_max': 0.0
+        }
+
+    def start(self):
+        """
+        Creates the classifier and starts the background thread if they do not exist yet.
+        """
+        with self._lock:
+            if self._classifier is None:
+                self._classifier = self._classifier_factory(**self.classifier_options)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='grammar-inference', daemon=True)
+                self._thread.start()
+
+    def submit(self, sentence: str) -> Future:
+        """
+        Queues a sentence for classification.
+
+        Parameters
+        ----------
+            sentence : str
+                The sentence to be evaluated.
+
+        Returns
+        -------
+            A future whose result is the tuple of the correctness value and the list of error types
+            (see GrammarClassifier.classify).
+        """
+        self.start()
+        future = Future()
+        self._queue.put((sentence, future, time.monotonic()))
+        return future
+
+    def classify(self, sentence: str) -> tuple:
+        """
+        Classifies a sentence and waits for the result.
+        Raises a concurrent.futures.TimeoutError if the result takes longer than the result timeout.
+        """
+        return self.submit(sentence).result(self.result_timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Classifies the queued sentences and stops the background thread.
+
+        Parameters
+        ----------
+            timeout : float
+                The maximum number of seconds to wait for the background thread.
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the metrics of the service.
+
+        Returns
+        -------
+            A dictionary with the number of classified sentences and batches, the average and maximum batch size,
+            the average time a sentence waited in the queue, the average and maximum batch latency in seconds
+            and the statistics of the classifier.
+        """
+        with self._lock:
+            stats = self._stats.copy()
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch_size'] = stats['sentences'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queue_wait_avg'] = stats['queue_wait_total'] / stats['sentences'] if stats['sentences'] else 0.0
+        stats['batch_latency_avg'] = stats['batch_latency_total'] / stats['batches'] if stats['batches'] else 0.0
+        if self._classifier is not None:
+            stats['classifier'] = self._classifier.get_statistics()
+        return stats
+
+    def _run(self):
+        """
+        The loop of the background thread.
+        """
+        while True:
+            batch, stopped = self._collect_batch()
+            if batch:
+                self._classify_batch(batch)
+            if stopped:
+                return
+
+    def _collect_batch(self) -> tuple:
+        """
+        Waits for the first sentence and collects further sentences until the batch is full
+        or the first sentence waited for the maximum wait time.
+
+        Returns
+        -------
+            A tuple of the batch and whether the service was stopped.
+        """
+        item = self._queue.get()
+        if item is self._STOP:
+            return [], True
+        batch = [item]
+        deadline = item[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _classify_batch(self, batch: list):
+        """
+        Classifies the sentences of the batch and resolves their futures.
+        """
+        start = time.monotonic()
+        # skip the sentences whose futures were cancelled while they were queued
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        sentences = [sentence for sentence, _, _ in batch]
+        futures = [future for _, future, _ in batch]
+        try:
+            results = self._classifier.classify_batch(sentences)
+        except Exception as e:
+            logger.error('A batch of {} sentences could not be classified: {}'.format(len(sentences), e))
+            for future in futures:
+                future.set_exception(e)
+            with self._lock:
+                self._stats['failed_batches'] += 1
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
+        latency = time.monotonic() - start
+        with self._lock:
+            self._stats['sentences'] += len(sentences)
+            self._stats['batches'] += 1
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(sentences))
+            self._stats['queue_wait_total'] += sum(start - queued for _, _, queued in batch)
+            self._stats['batch_latency_total'] += latency
+            self._stats['batch_latency_max'] = max(self._stats['batch_latency_max'], latency)
+        logger.debug('Classified a batch of {} sentences in {:.3f} seconds.'.format(len(sentences), latency))
@@ -0,0 +1,324 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from .grammar_service import GrammarInferenceService
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(worker_id: int, classifier_factory, classifier_options: dict, requests, results, num_threads: int):
+    """
+    The loop of a worker process. Creates its own classifier, classifies the batches of its request queue
+    and puts the verdicts into the shared result queue.
+    If the classifier cannot be created, every batch fails with the error instead of restarting the worker.
+    """
+    try:
+        import torch
+        # the workers share the cores of the host
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    try:
+        classifier = classifier_factory(**classifier_options)
+        startup_error = None
+    except Exception as e:
+        classifier = None
+        startup_error = 'The classifier could not be created: {!r}'.format(e)
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        batch_id, sentences = request
+        start = time.monotonic()
+        try:
+            if startup_error is not None:
+                raise RuntimeError(startup_error)
+            verdicts, complete = classifier.classify_uncached(sentences)
+            error = None
+        except Exception as e:
+            # the exception may not be picklable
+            verdicts, complete = None, None
+            error = repr(e)
+        results.put((worker_id, batch_id, verdicts, complete, error, time.monotonic() - start))
+
+
+class GrammarWorkerPool(GrammarInferenceService):
+    """
+    Classifies the sentences of all groups in several worker processes.
+    The workers are started with forkserver (or spawn), never forked from the bot process, whose threads
+    could hold locks at the time of the fork. Every worker loads GECToR itself; with mmap_dir, all workers map
+    the same weight file, so they start fast and share its pages. The workers check the sentences with the
+    LanguageTool servers of the bot process, the verdict cache stays in the bot process.
+    The batches are collected like in the GrammarInferenceService and dispatched round-robin to the workers.
+    """
+
+    def __init__(self, classifier_factory, max_batch_size: int = 16, max_wait: float = 0.05, num_workers: int = 2,
+                 max_pending_batches: int = 2, max_queue_size: int = 256):
+        """
+        Initializes the pool. The classifier is created and the workers are started when the pool is started.
+
+        Parameters
+        ----------
+            classifier_factory : function
+                A function that creates the classifier with the classifier options,
+                e.g. the GrammarClassifier class.
+            max_batch_size : int
+                The maximum number of sentences that are classified in one batch.
+            max_wait : float
+                The maximum number of seconds a sentence waits for further sentences of its batch.
+            num_workers : int
+                The number of worker processes.
+            max_pending_batches : int
+                The maximum number of batches a worker is given before it returns its results.
+                If all workers are busy, no further batches are dispatched.
+            max_queue_size : int
+                The maximum number of sentences waiting for a batch. If the queue is full, submit blocks.
+        """
+        super(GrammarWorkerPool, self).__init__(classifier_factory, max_batch_size, max_wait)
+        self.num_workers = num_workers
+        self.max_pending_batches = max_pending_batches
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._context = None
+        self._worker_options = None
+        self._workers = []
+        self._results = None
+        self._collector = None
+        self._next_worker = itertools.cycle(range(num_workers))
+        self._batch_ids = itertools.count()
+        # batch id -> (worker id, sentences, futures, queued times, dispatch time)
+        self._pending = {}
+        self._stopping = threading.Event()
+
+    def start(self):
+        """
+        Creates the classifier, starts the workers and starts the background threads if they do not exist yet.
+        """
+        with self._lock:
+            if self._classifier is None:
+                if self.num_workers > 0 and not self.classifier_options.get('language_tool_servers'):
+                    # the workers need LanguageTool servers with known ports
+                    self.classifier_options['language_tool_servers'] = 1
+                self._classifier = self._classifier_factory(**self.classifier_options)
+            if not self._workers:
+                self._start_workers()
+            if self._workers and (self._collector is None or not self._collector.is_alive()):
+                self._collector = threading.Thread(target=self._collect_results, name='grammar-results', daemon=True)
+                self._collector.start()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='grammar-dispatch', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Classifies the queued sentences and stops the background threads and the workers.
+
+        Parameters
+        ----------
+            timeout : float
+                The maximum number of seconds to wait for the background threads and each worker.
+        """
+        super(GrammarWorkerPool, self).stop(timeout)
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # the workers that exit now are not restarted
+        self._stopping.set()
+        for worker in self._workers:
+            worker['requests'].put(None)
+        for worker in self._workers:
+            worker['process'].join(timeout)
+        if self._results is not None:
+            self._results.put(None)
+        if self._collector is not None:
+            self._collector.join(timeout)
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the metrics of the pool.
+
+        Returns
+        -------
+            The metrics of the GrammarInferenceService and, for each worker, its process id, whether it is alive,
+            the number of classified batches and sentences, the number of pending batches, the number of restarts
+            and its utilization, i.e. the fraction of its lifetime it spent classifying.
+        """
+        stats = super(GrammarWorkerPool, self).get_statistics()
+        if self._classifier is not None:
+            # the model runs in the workers, only the verdict cache is used in this process
+            stats['classifier'] = {'cache': self._classifier.verdict_cache.get_statistics()}
+        now = time.monotonic()
+        with self._lock:
+            stats['workers'] = [{
+                'pid': worker['process'].pid,
+                'alive': worker['process'].is_alive(),
+                'batches': worker['batches'],
+                'sentences': worker['sentences'],
+                'pending': worker['pending'],
+                'restarts': worker['restarts'],
+                'utilization': worker['busy_time'] / (now - worker['started']) if now > worker['started'] else 0.0
+            } for worker in self._workers]
+        return stats
+
+    def _start_workers(self):
+        """
+        Starts the worker processes.
+        """
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('forkserver')
+            # the server imports the model code once instead of the main module, the workers are forked from it
+            self._context.set_forkserver_preload(['src.backend.entities.grammar_classifier'])
+        else:
+            self._context = multiprocessing.get_context('spawn')
+        self._worker_options = dict(self.classifier_options,
+                                    language_tool_urls=self._classifier.get_language_tool_urls(),
+                                    language_tool_servers=0,
+                                    # the verdicts are cached in the bot process
+                                    cache_size=0, cache_file=None)
+        self._results = self._context.Queue()
+        for worker_id in range(self.num_workers):
+            self._workers.append({
+                'process': None,
+                'requests': None,
+                'slots': threading.BoundedSemaphore(self.max_pending_batches),
+                'batches': 0,
+                'sentences': 0,
+                'pending': 0,
+                'restarts': -1,
+                'busy_time': 0.0,
+                'started': 0.0
+            })
+            self._start_worker(worker_id)
+        logger.info('Started {} grammar workers.'.format(self.num_workers))
+
+    def _start_worker(self, worker_id: int):
+        """
+        Starts the worker with the given id with a new request queue.
+        """
+        worker = self._workers[worker_id]
+        num_threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+        worker['requests'] = self._context.Queue()
+        worker['process'] = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self._classifier_factory, self._worker_options, worker['requests'], self._results,
+                  num_threads),
+            name='grammar-worker-{}'.format(worker_id),
+            daemon=True)
+        worker['process'].start()
+        worker['restarts'] += 1
+        worker['busy_time'] = 0.0
+        worker['started'] = time.monotonic()
+
+    def _classify_batch(self, batch: list):
+        """
+        Resolves the futures of cached sentences and dispatches the other sentences to the next free worker.
+        Blocks while all workers have the maximum number of pending batches.
+        """
+        if not self._workers:
+            super(GrammarWorkerPool, self)._classify_batch(batch)
+            return
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        missing = []
+        for item in batch:
+            verdict = self._classifier.verdict_cache.get(item[0])
+            if verdict is None:
+                missing.append(item)
+            else:
+                item[1].set_result(verdict)
+        if not missing:
+            return
+
+        worker_id = self._acquire_worker()
+        batch_id = next(self._batch_ids)
+        sentences = [sentence for sentence, _, _ in missing]
+        with self._lock:
+            self._pending[batch_id] = (worker_id, sentences, [future for _, future, _ in missing],
+                                       [queued for _, _, queued in missing], time.monotonic())
+            self._workers[worker_id]['pending'] += 1
+        self._workers[worker_id]['requests'].put((batch_id, sentences))
+
+    def _acquire_worker(self) -> int:
+        """
+        Returns the id of the next worker in round-robin order that can take another batch.
+        Waits for the next worker if all of them are busy.
+        """
+        for _ in range(self.num_workers):
+            worker_id = next(self._next_worker)
+            if self._workers[worker_id]['slots'].acquire(blocking=False):
+                return worker_id
+        worker_id = next(self._next_worker)
+        self._workers[worker_id]['slots'].acquire()
+        return worker_id
+
+    def _collect_results(self):
+        """
+        The loop of the thread that resolves the futures with the results of the workers
+        and restarts workers that died.
+        """
+        while True:
+            # checked before every result, so a dead worker is noticed while the others keep returning results
+            self._restart_dead_workers()
+            try:
+                result = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if result is None:
+                return
+            worker_id, batch_id, verdicts, complete, error, busy_time = result
+            with self._lock:
+                pending = self._pending.pop(batch_id, None)
+                if pending is None:
+                    # the batch was already failed because its worker was restarted
+                    continue
+                _, sentences, futures, queued_times, dispatched = pending
+                worker = self._workers[worker_id]
+                worker['pending'] -= 1
+                worker['busy_time'] += busy_time
+            worker['slots'].release()
+
+            if error is not None:
+                logger.error('A batch of {} sentences could not be classified: {}'.format(len(sentences), error))
+                for future in futures:
+                    future.set_exception(RuntimeError(error))
+                with self._lock:
+                    self._stats['failed_batches'] += 1
+                continue
+            self._classifier.verdict_cache.put_all(
+                [sentence for sentence, is_complete in zip(sentences, complete) if is_complete],
+                [verdict for verdict, is_complete in zip(verdicts, complete) if is_complete])
+            for future, verdict in zip(futures, verdicts):
+                future.set_result(verdict)
+            latency = time.monotonic() - dispatched
+            with self._lock:
+                worker['batches'] += 1
+                worker['sentences'] += len(sentences)
+                self._stats['sentences'] += len(sentences)
+                self._stats['batches'] += 1
+                self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(sentences))
+                self._stats['queue_wait_total'] += sum(dispatched - queued for queued in queued_times)
+                self._stats['batch_latency_total'] += latency
+                self._stats['batch_latency_max'] = max(self._stats['batch_latency_max'], latency)
+
+    def _restart_dead_workers(self):
+        """
+        Fails the pending batches of workers that died and starts them again.
+        """
+        for worker_id, worker in enumerate(self._workers):
+            if worker['process'].is_alive() or self._stopping.is_set():
+                continue
+            logger.error('Grammar worker {} died with exit code {}, it is restarted.'.format(
+                worker_id, worker['process'].exitcode))
+            with self._lock:
+                lost = [batch_id for batch_id, pending in self._pending.items() if pending[0] == worker_id]
+                lost_batches = [self._pending.pop(batch_id) for batch_id in lost]
+                worker['pending'] = 0
+                self._stats['failed_batches'] += len(lost_batches)
+            self._start_worker(worker_id)
+            for _, _, futures, _, _ in lost_batches:
+                worker['slots'].release()
+                for future in futures:
+                    future.set_exception(RuntimeError('The grammar worker {} died.'.format(worker_id)))
@@ -0,0 +1,291 @@
+import atexit
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LanguageToolPool():
+    """
+    Starts several local LanguageTool servers and spreads the checks across them.
+    Every server runs in its own Java process with its own port and heap, so a slow check only occupies
+    one server while the other checks go to the others. Servers that die are restarted.
+    The pool can be used instead of a LanguageTool object, it offers the same check method.
+    """
+
+    def __init__(self, client_factory, size: int = 2, first_port: int = 8081, heap_size: str = '512m',
+                 health_check_interval: float = 5.0, start_timeout: float = 120.0):
+        """
+        Initializes the pool. The servers are started when the pool is started.
+
+        Parameters
+        ----------
+            client_factory : function
+                A function that creates the LanguageTool client for the URL of a server,
+                e.g. GrammarClassifier.create_language_tool.
+            size : int
+                The number of servers.
+            first_port : int
+                The port of the first server, the other servers use the following ports.
+            heap_size : str
+                The maximum heap size of each Java process, e.g. '512m' or '1g'.
+            health_check_interval : float
+                The number of seconds between two checks whether the servers are still alive.
+            start_timeout : float
+                The maximum number of seconds to wait until a server answers after it was started.
+        """
+        self.size = size
+        self.first_port = first_port
+        self.heap_size = heap_size
+        self.health_check_interval = health_check_interval
+        self.start_timeout = start_timeout
+        self._client_factory = client_factory
+        self._servers = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._monitor = None
+        self._turn = 0
+        # only the process that started the servers can restart them, forked workers only use them
+        self._owner_pid = None
+
+    def start(self):
+        """
+        Starts the servers and the thread that restarts servers that died.
+        If a server cannot be started, the servers that were already started are stopped again.
+        """
+        self._owner_pid = os.getpid()
+        command = self._get_server_command()
+        atexit.register(self.close)
+        try:
+            for index in range(self.size):
+                port = self.first_port + index
+                self._servers.append({
+                    'port': port,
+                    'url': 'http://localhost:{}'.format(port),
+                    'command': command + ['--port', str(port)],
+                    'process': None,
+                    'client': None,
+                    'available': False,
+                    'busy': 0,
+                    'checks': 0,
+                    'failures': 0,
+                    'restarts': -1
+                })
+                self._start_server(self._servers[-1])
+        except Exception:
+            self.close()
+            raise
+        self._monitor = threading.Thread(target=self._run_monitor, name='language-tool-monitor', daemon=True)
+        self._monitor.start()
+        logger.info('Started {} LanguageTool servers on the ports {} to {}.'.format(
+            self.size, self.first_port, self.first_port + self.size - 1))
+        return self
+
+    def connect(self, urls: list):
+        """
+        Uses running servers that were started by the pool of another process instead of starting new ones,
+        e.g. in the grammar worker processes. The servers are restarted by the other process only.
+
+        Parameters
+        ----------
+            urls : list
+                The URLs of the servers, see get_urls.
+        """
+        self.size = len(urls)
+        self.first_port = int(urls[0].rsplit(':', 1)[1])
+        for url in urls:
+            self._servers.append({
+                'port': int(url.rsplit(':', 1)[1]),
+                'url': url,
+                'command': None,
+                'process': None,
+                'client': self._connect_client(url),
+                'available': True,
+                'busy': 0,
+                'checks': 0,
+                'failures': 0,
+                'restarts': 0
+            })
+        return self
+
+    def get_urls(self) -> list:
+        """
+        Returns the URLs of the servers.
+        """
+        return [server['url'] for server in self._servers]
+
+    def check(self, text: str) -> list:
+        """
+        Checks the text with the least busy server and returns the LanguageTool matches.
+        If a server fails, the text is checked with the other servers.
+        """
+        tried = []
+        while True:
+            server = self._acquire_server(exclude=tried)
+            try:
+                matches = server['client'].check(text)
+            except Exception as e:
+                with self._lock:
+                    server['failures'] += 1
+                logger.error('The LanguageTool server on port {} failed: {}'.format(server['port'], e))
+                tried.append(server['port'])
+                if len(tried) >= self.size:
+                    raise
+                continue
+            finally:
+                with self._lock:
+                    server['busy'] -= 1
+            with self._lock:
+                server['checks'] += 1
+            return matches
+
+    def close(self):
+        """
+        Stops the servers. Only the process that started them stops them.
+        """
+        self._closed.set()
+        if os.getpid() != self._owner_pid:
+            return
+        with self._lock:
+            processes = [server['process'] for server in self._servers]
+        for process in processes:
+            if process is not None and process.poll() is None:
+                self._stop_process(process)
+
+    def get_statistics(self) -> list:
+        """
+        Returns the port, process id, availability, number of running checks, checks, failures
+        and restarts of every server.
+        """
+        with self._lock:
+            return [{
+                'port': server['port'],
+                'pid': server['process'].pid if server['process'] is not None else None,
+                'available': server['available'],
+                'busy': server['busy'],
+                'checks': server['checks'],
+                'failures': server['failures'],
+                'restarts': server['restarts']
+            } for server in self._servers]
+
+    def _acquire_server(self, exclude: list) -> dict:
+        """
+        Returns the available server with the fewest running checks of this process.
+        Servers with the same number of checks take turns, forked processes start with different servers.
+        """
+        with self._lock:
+            self._turn += 1
+            offset = (os.getpid() + self._turn) % self.size
+            candidates = [server for server in self._servers if server['available'] and server['port'] not in exclude]
+            if not candidates:
+                # all servers are restarting, the check waits for one of them in the client
+                candidates = [server for server in self._servers if server['port'] not in exclude]
+            server = min(candidates, key=lambda s: (s['busy'], (s['port'] - self.first_port - offset) % self.size))
+            server['busy'] += 1
+        return server
+
+    def _get_server_command(self) -> list:
+        """
+        Returns the command that starts a LanguageTool server, after downloading LanguageTool if necessary.
+        """
+        from language_tool_python.download_lt import download_lt
+        from language_tool_python.utils import get_jar_info
+
+        download_lt()
+        java_path, jar_path = get_jar_info()
+        return [java_path, '-Xmx{}'.format(self.heap_size), '-cp', jar_path, 'org.languagetool.server.HTTPServer']
+
+    def _start_server(self, server: dict):
+        """
+        Starts the Java process of the server and waits until it answers.
+        The process is stopped again if it does not answer in time.
+        """
+        if self._is_port_in_use(server['port']):
+            # a client would connect to the other process instead of the new server
+            raise RuntimeError('The port {} of a LanguageTool server is already in use.'.format(server['port']))
+        process = subprocess.Popen(server['command'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with self._lock:
+            server['process'] = process
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            try:
+                client = self._client_factory(remote_server=server['url'])
+            except Exception:
+                client = None
+            # the client only belongs to the new server if the process is still running
+            if process.poll() is not None:
+                raise RuntimeError('The LanguageTool server on port {} exited with exit code {}.'.format(
+                    server['port'], process.returncode))
+            if client is not None:
+                break
+            if time.monotonic() > deadline:
+                self._stop_process(process)
+                raise RuntimeError('The LanguageTool server on port {} did not answer within {} seconds.'.format(
+                    server['port'], self.start_timeout))
+            time.sleep(0.5)
+        with self._lock:
+            server['client'] = client
+            server['available'] = True
+            server['restarts'] += 1
+
+    @staticmethod
+    def _stop_process(process):
+        """
+        Terminates the process and kills it if it does not exit.
+        """
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    @staticmethod
+    def _is_port_in_use(port: int) -> bool:
+        """
+        Whether a process already accepts connections on the local port.
+        """
+        try:
+            with socket.create_connection(('localhost', port), timeout=1.0):
+                return True
+        except OSError:
+            return False
+
+    def _connect_client(self, url: str):
+        """
+        Creates the client of a running server, waits while the server is restarted.
+        """
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            try:
+                return self._client_factory(remote_server=url)
+            except Exception:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _run_monitor(self):
+        """
+        The loop of the thread that restarts the servers that died.
+        """
+        while not self._closed.wait(self.health_check_interval):
+            for server in self._servers:
+                with self._lock:
+                    process = server['process']
+                # servers of another process are not restarted here
+                if process is None or process.poll() is None:
+                    continue
+                if self._closed.is_set():
+                    return
+                logger.error('The LanguageTool server on port {} died with exit code {}, it is restarted.'.format(
+                    server['port'], process.returncode))
+                with self._lock:
+                    server['available'] = False
+                try:
+                    self._start_server(server)
+                except RuntimeError as e:
+                    logger.error(e)
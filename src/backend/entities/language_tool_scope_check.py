@@ -0,0 +1,83 @@
+"""Compares the scoped LanguageTool rules of the GrammarClassifier with all rules on the BEA evaluation set.
+
+Run from the repository root:
+    python -m src.backend.entities.language_tool_scope_check
+
+The check fails (exit code 1) if the scoped rules do not find exactly the matches of all rules that are not
+ignored by the GrammarClassifier, i.e. if disabling the ignored categories and rules in LanguageTool is not the
+same as filtering their matches afterwards, or if any sentence gets another correctness value in scoped mode.
+The check time per sentence of both modes is compared.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from src.backend.entities.grammar_classifier import GrammarClassifier
+from src.backend.models.gector.evaluation_data import load_labelled_sentences
+
+
+def get_match_keys(error_matches):
+    """Returns the rule, position and length of the matches, which identify them across both modes."""
+    return sorted((error.ruleId, error.offset, error.errorLength) for error in error_matches)
+
+
+def check_sentences(sentences, rounds):
+    """Checks every sentence with all rules and with the scoped rules.
+
+    Returns:
+        The matches of all rules, the matches of the scoped rules and the check times in seconds of both modes.
+    """
+    language_tools = {mode: GrammarClassifier.create_language_tool(mode) for mode in ['all', 'scoped']}
+    matches = {mode: [] for mode in language_tools}
+    times = {mode: [] for mode in language_tools}
+    for language_tool in language_tools.values():
+        language_tool.check('This is a test sentence.')
+    for sentence in sentences:
+        for mode, language_tool in language_tools.items():
+            start = time.perf_counter()
+            for _ in range(rounds):
+                sentence_matches = language_tool.check(sentence)
+            times[mode].append((time.perf_counter() - start) / rounds)
+            matches[mode].append(sentence_matches)
+    for language_tool in language_tools.values():
+        language_tool.close()
+    return matches['all'], matches['scoped'], times['all'], times['scoped']
+
+
+def main(args):
+    sentences, _ = load_labelled_sentences(args.input_file)
+    all_matches, scoped_matches, all_times, scoped_times = check_sentences(sentences, args.rounds)
+
+    mismatches = 0
+    changed_verdicts = 0
+    for sentence, full, scoped in zip(sentences, all_matches, scoped_matches):
+        filtered = [error for error in full if not GrammarClassifier.is_ignored(error)]
+        if get_match_keys(filtered) != get_match_keys(scoped):
+            mismatches += 1
+            print(f"Different matches for '{sentence}': "
+                  f"filtered {get_match_keys(filtered)}, scoped {get_match_keys(scoped)}")
+        if GrammarClassifier.get_language_tool_verdict(full) != GrammarClassifier.get_language_tool_verdict(scoped):
+            changed_verdicts += 1
+            print(f"Different verdicts for '{sentence}': "
+                  f"all {GrammarClassifier.get_language_tool_verdict(full)}, "
+                  f"scoped {GrammarClassifier.get_language_tool_verdict(scoped)}")
+
+    all_ms, scoped_ms = np.array(all_times) * 1000, np.array(scoped_times) * 1000
+    print(f"All rules: {all_ms.mean():.1f}ms per sentence (p50 {np.percentile(all_ms, 50):.1f}ms), "
+          f"scoped rules: {scoped_ms.mean():.1f}ms per sentence (p50 {np.percentile(scoped_ms, 50):.1f}ms), "
+          f"reduction {100 * (1 - scoped_ms.mean() / all_ms.mean()):.1f}%")
+    print(f"Parity: {len(sentences) - mismatches} of {len(sentences)} sentences have the same matches, "
+          f"{len(sentences) - changed_verdicts} of {len(sentences)} sentences have the same verdict.")
+    if mismatches or changed_verdicts:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input_file', default='./data/test_data/BEA_eval_common_errors_annotated.csv',
+                        help='Path to the annotated evaluation set.')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Number of checks per sentence and mode, the time is averaged.')
+    main(parser.parse_args())
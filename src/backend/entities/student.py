@@ -28,6 +28,8 @@ class Student():
             self.data = data
         else:
             self.data = {}
+        # Data fields whose value changed since the student was last saved to the database
+        self.changed_data_fields = set()
         # Initialize achievements
         self.completed_achievements = []
         self.open_achievements = []
@@ -132,11 +134,14 @@ class Student():
             self.data[field] = self.data[field] + increment
         else:
             self.data[field] = increment
+        self.changed_data_fields.add(field)
 
     def update_data(self, field, value):
         """
         Updates the user data field with the given value
         """
+        if field not in self.data or self.data[field] != value:
+            self.changed_data_fields.add(field)
         self.data[field] = value
 
     def get_data_value(self, field):
@@ -165,6 +170,36 @@ class Student():
             data.append((self.id, field, value))        
         return data
 
+    def get_changed_data_as_list(self):
+        """
+        Returns only the user data fields that changed since the last save as a list for database input
+        """
+        return [(self.id, field, value) for field, value in self.data.items() if field in self.changed_data_fields]
+
+    def get_changed_proficiency_as_list(self):
+        """
+        Returns only the proficiencies that changed since the last save as a list that includes the user ID
+        """
+        return self.proficiency.get_changed_as_list(self.id)
+
+    def has_changes(self):
+        """
+        Returns whether the user data or proficiency changed since the last save
+        """
+        return len(self.changed_data_fields) > 0 or self.proficiency.has_changes()
+
+    def mark_data_as_saved(self):
+        """
+        Marks the user data as saved to the database
+        """
+        self.changed_data_fields = set()
+
+    def mark_proficiency_as_saved(self):
+        """
+        Marks the proficiency as saved to the database
+        """
+        self.proficiency.mark_as_saved()
+
     def update_achievements(self):
         """ Check open achievements for completion and add to list of completed achievements, also return list of newly completed achievements """
         # List for newly completed achievements
@@ -0,0 +1,168 @@
+import json
+import logging
+import sqlite3
+import threading
+import unicodedata
+
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class VerdictCache():
+    """
+    Remembers the verdicts of the grammar classifier for sentences that were already classified.
+    The verdicts are kept in a bounded in-memory LRU cache and, optionally, in an sqlite file that survives restarts.
+    Every verdict belongs to a fingerprint of the model and the rules, the cache is emptied when the fingerprint changes.
+    """
+
+    def __init__(self, fingerprint: str, max_size: int = 10000, file_location: str = None):
+        """
+        Initializes the cache and loads the persistent tier, if it was created with the same fingerprint.
+
+        Parameters
+        ----------
+            fingerprint : str
+                Identifies the model checkpoint and the rule configuration that produced the verdicts.
+            max_size : int
+                The maximum number of verdicts kept in memory.
+            file_location : str
+                The path of the sqlite file of the persistent tier or None to keep the verdicts only in memory.
+        """
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+        self._db = None
+        if file_location is not None:
+            self._open_file(file_location)
+
+    @staticmethod
+    def normalize(sentence: str) -> str:
+        """
+        Returns the cache key of a sentence.
+        Only the unicode form and the surrounding whitespace are normalized, because LanguageTool
+        also reports whitespace and casing inside the sentence, which changes the verdict.
+        """
+        return unicodedata.normalize('NFC', sentence).strip()
+
+    def get(self, sentence: str):
+        """
+        Returns the cached verdict of the sentence.
+
+        Returns
+        -------
+            The tuple of the correctness value and the list of error types or None if it is not cached.
+        """
+        key = self.normalize(sentence)
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is not None:
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return verdict[0], list(verdict[1])
+            verdict = self._read_from_file(key)
+            if verdict is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._store(key, verdict)
+            return verdict[0], list(verdict[1])
+
+    def put_all(self, sentences: list, verdicts: list):
+        """
+        Stores the verdicts of the sentences in memory and in the persistent tier.
+        """
+        rows = []
+        with self._lock:
+            for sentence, (correctness_value, error_types) in zip(sentences, verdicts):
+                key = self.normalize(sentence)
+                self._store(key, (correctness_value, tuple(error_types)))
+                rows.append((key, correctness_value, json.dumps(list(error_types))))
+            if self._db is not None and rows:
+                try:
+                    with self._db:
+                        self._db.executemany(
+                            'INSERT OR REPLACE INTO verdicts (sentence, correctness_value, error_types) VALUES (?, ?, ?)',
+                            rows)
+                except sqlite3.Error as e:
+                    logger.error('The verdicts could not be written to the cache file: {}'.format(e))
+
+    def clear(self):
+        """
+        Removes all verdicts from memory and from the persistent tier.
+        """
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('DELETE FROM verdicts')
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the metrics of the cache.
+
+        Returns
+        -------
+            A dictionary with the number of memory hits, disk hits, misses and evictions,
+            the hit rate and the number of verdicts in memory.
+        """
+        with self._lock:
+            stats = self._stats.copy()
+            stats['size'] = len(self._entries)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        stats['hit_rate'] = hits / (hits + stats['misses']) if hits + stats['misses'] else 0.0
+        return stats
+
+    def _store(self, key: str, verdict: tuple):
+        """
+        Stores the verdict in memory and drops the least recently used verdicts. Must be called with the lock held.
+        """
+        self._entries[key] = verdict
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _open_file(self, file_location: str):
+        """
+        Opens the persistent tier and empties it if it was created with another fingerprint.
+        """
+        try:
+            self._db = sqlite3.connect(file_location, check_same_thread=False)
+            with self._db:
+                self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+                self._db.execute('CREATE TABLE IF NOT EXISTS verdicts '
+                                 '(sentence TEXT PRIMARY KEY, correctness_value REAL, error_types TEXT)')
+                row = self._db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+                if row is None or row[0] != self.fingerprint:
+                    if row is not None:
+                        logger.info('The model or the rules changed, the verdict cache {} is emptied.'.format(file_location))
+                    self._db.execute('DELETE FROM verdicts')
+                    self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)",
+                                     (self.fingerprint, ))
+        except sqlite3.Error as e:
+            logger.error('The verdict cache file {} could not be opened, only the memory is used: {}'.format(file_location, e))
+            self._db = None
+
+    def _read_from_file(self, key: str):
+        """
+        Reads the verdict of the key from the persistent tier. Must be called with the lock held.
+        """
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute('SELECT correctness_value, error_types FROM verdicts WHERE sentence = ?',
+                                   (key, )).fetchone()
+        except sqlite3.Error as e:
+            logger.error('The verdict could not be read from the cache file: {}'.format(e))
+            return None
+        if row is None:
+            return None
+        return row[0], tuple(json.loads(row[1]))
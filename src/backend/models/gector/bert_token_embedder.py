@@ -7,6 +7,7 @@ import torch
 import torch.nn.functional as F
 from allennlp.modules.token_embedders.token_embedder import TokenEmbedder
 from allennlp.nn import util
+import transformers
 from transformers import AutoModel, PreTrainedModel
 
 logger = logging.getLogger(__name__)
@@ -22,13 +23,20 @@ class PretrainedBertModel:
     _cache: Dict[str, PreTrainedModel] = {}
 
     @classmethod
-    def load(cls, model_name: str, cache_model: bool = True) -> PreTrainedModel:
-        if model_name in cls._cache:
-            return PretrainedBertModel._cache[model_name]
-
-        model = AutoModel.from_pretrained(model_name)
+    def load(cls, model_name: str, cache_model: bool = True, transformer_config: Dict = None) -> PreTrainedModel:
+        # a model that is built from its configuration has no pretrained weights yet
+        cache_key = model_name if transformer_config is None else model_name + ':config'
+        if cache_key in cls._cache:
+            return PretrainedBertModel._cache[cache_key]
+
+        if transformer_config is None:
+            model = AutoModel.from_pretrained(model_name)
+        else:
+            config_class = getattr(transformers, transformer_config['config_class'])
+            model_class = getattr(transformers, transformer_config['model_class'])
+            model = model_class(config_class.from_dict(transformer_config['config']))
         if cache_model:
-            cls._cache[model_name] = model
+            cls._cache[cache_key] = model
 
         return model
 
@@ -242,6 +250,9 @@ class PretrainedBertEmbedder(BertEmbedder):
         If not ``None``, use these scalar mix parameters to weight the representations
         produced by different layers. These mixing weights are not updated during
         training.
+    transformer_config: ``Dict``, optional (default = None)
+        If not ``None``, the model is built from this configuration (see mmap_weights)
+        without loading the pretrained weights, because they are replaced afterwards.
     """
 
     def __init__(
@@ -250,8 +261,9 @@ class PretrainedBertEmbedder(BertEmbedder):
         requires_grad: bool = False,
         top_layer_only: bool = False,
         special_tokens_fix: int = 0,
+        transformer_config: Dict = None,
     ) -> None:
-        model = PretrainedBertModel.load(pretrained_model)
+        model = PretrainedBertModel.load(pretrained_model, transformer_config=transformer_config)
 
         for param in model.parameters():
             param.requires_grad = requires_grad
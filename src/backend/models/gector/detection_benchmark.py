@@ -0,0 +1,72 @@
+"""Compares the single pass detection of GecBERTModel with the verdict of the iterative correction.
+
+Run from the repository root:
+    python -m src.backend.models.gector.detection_benchmark --thresholds 0.3 0.5 0.7
+"""
+import argparse
+from time import time
+
+import pandas as pd
+
+from src.backend.models.gector.gec_model import GecBERTModel
+
+
+def load_sentences(input_file):
+    """Returns the correct and the erroneous sentences of the annotated evaluation set."""
+    df = pd.read_csv(input_file, sep=';')
+    sentences = [str(sent).strip() for sent in df['Sentence'].tolist() + df['Sentence_erroneous'].tolist()]
+    return [sent for sent in sentences if sent]
+
+
+def run_in_batches(function, token_batch, batch_size):
+    """Runs the function on the token batch in chunks and returns the concatenated results and the runtime."""
+    results = []
+    start = time()
+    for i in range(0, len(token_batch), batch_size):
+        results.extend(function(token_batch[i:i + batch_size]))
+    return results, time() - start
+
+
+def main(args):
+    model = GecBERTModel(args.vocab_path,
+                         model_paths=[args.model_path],
+                         weigths=None, max_len=50, min_len=3, iterations=args.iterations,
+                         lowercase_tokens=0, log=False, model_name='roberta',
+                         special_tokens_fix=1, is_ensemble=0, min_error_probability=0.0,
+                         confidence=0)
+    sentences = load_sentences(args.input_file)
+    token_batch = [sent.split() for sent in sentences]
+
+    corrections, correction_time = run_in_batches(lambda batch: model.handle_batch(batch)[0],
+                                                  token_batch, args.batch_size)
+    iterative_verdicts = [sent.lower() != " ".join(pred).lower() for sent, pred in zip(sentences, corrections)]
+    error_probs, detection_time = run_in_batches(lambda batch: model.detect(batch)[0],
+                                                 token_batch, args.batch_size)
+
+    print(f"Sentences: {len(sentences)}, flagged by the iterative correction: {sum(iterative_verdicts)}")
+    print(f"Iterative correction: {correction_time:.2f}s ({1000 * correction_time / len(sentences):.1f}ms per sentence)")
+    print(f"Detection: {detection_time:.2f}s ({1000 * detection_time / len(sentences):.1f}ms per sentence)")
+    for threshold in args.thresholds:
+        detected_verdicts = [error_prob >= threshold for error_prob in error_probs]
+        agreement = sum(d == i for d, i in zip(detected_verdicts, iterative_verdicts)) / len(sentences)
+        only_detected = sum(d and not i for d, i in zip(detected_verdicts, iterative_verdicts))
+        only_iterative = sum(i and not d for d, i in zip(detected_verdicts, iterative_verdicts))
+        print(f"Threshold {threshold}: agreement {100 * agreement:.1f}%, "
+              f"flagged only by detection {only_detected}, flagged only by correction {only_iterative}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--input_file', default='./data/test_data/BEA_eval_common_errors_annotated.csv',
+                        help='Path to the annotated evaluation set.')
+    parser.add_argument('--vocab_path', default='./data/gector/output_vocabulary/',
+                        help='Path to the output vocabulary.')
+    parser.add_argument('--model_path', default='./data/gector/model/model.th',
+                        help='Path to the model checkpoint.')
+    parser.add_argument('--iterations', type=int, default=5,
+                        help='Number of correction iterations, like in the GrammarClassifier.')
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help='Number of sentences per batch.')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.3, 0.5, 0.7],
+                        help='Error probability thresholds of the detection to compare.')
+    main(parser.parse_args())
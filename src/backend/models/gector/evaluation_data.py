@@ -0,0 +1,26 @@
+"""Loads the annotated BEA evaluation set and scores verdicts against it."""
+import pandas as pd
+
+
+def load_labelled_sentences(input_file):
+    """Returns the sentences of the evaluation set and whether they are erroneous.
+    Pairs without a difference between the correct and the erroneous sentence are skipped."""
+    df = pd.read_csv(input_file, sep=';')
+    sentences = []
+    labels = []
+    for correct, erroneous in zip(df['Sentence'], df['Sentence_erroneous']):
+        correct, erroneous = str(correct).strip(), str(erroneous).strip()
+        if correct == erroneous:
+            continue
+        sentences.extend([correct, erroneous])
+        labels.extend([False, True])
+    return sentences, labels
+
+
+def get_scores(verdicts, labels):
+    """Returns the accuracy, precision and recall of the verdicts."""
+    true_positives = sum(v and l for v, l in zip(verdicts, labels))
+    accuracy = sum(v == l for v, l in zip(verdicts, labels)) / len(labels)
+    precision = true_positives / sum(verdicts) if sum(verdicts) else 0.0
+    recall = true_positives / sum(labels) if sum(labels) else 0.0
+    return accuracy, precision, recall
@@ -17,6 +17,8 @@ from src.backend.models.gector.bert_token_embedder import PretrainedBertEmbedder
 from src.backend.models.gector.seq2labels_model import Seq2Labels
 from src.backend.models.gector.wordpiece_indexer import PretrainedBertIndexer
 from src.backend.models.gector.helpers import PAD, UNK, get_target_sent_by_edits, START_TOKEN
+from src.backend.models.gector.onnx_export import ONNX_OUTPUT_NAMES, get_onnx_inputs
+from src.backend.models.gector.mmap_weights import load_index, load_vocabulary, map_state_dict, assign_state_dict
 
 logging.getLogger("werkzeug").setLevel(logging.ERROR)
 logger = logging.getLogger(__file__)
@@ -48,6 +50,9 @@ def get_weights_name(transformer_name, lowercase):
 
 
 class GecBERTModel(object):
+    # sentences that are at most this many wordpieces longer than the shortest one of a bucket always join it
+    MIN_BUCKET_WIDTH = 8
+
     def __init__(self, vocab_path=None, model_paths=None,
                  weigths=None,
                  max_len=50,
@@ -61,6 +66,12 @@ class GecBERTModel(object):
                  min_error_probability=0.0,
                  confidence=0,
                  resolve_cycles=False,
+                 quantize=False,
+                 backend='torch',
+                 onnx_paths=None,
+                 length_bucketing=True,
+                 bucket_ratio=1.5,
+                 mmap_paths=None,
                  ):
         self.model_weights = list(map(float, weigths)) if weigths else [1] * len(model_paths)
         self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -68,20 +79,50 @@ class GecBERTModel(object):
         self.min_len = min_len
         self.lowercase_tokens = lowercase_tokens
         self.min_error_probability = min_error_probability
-        self.vocab = Vocabulary.from_files(vocab_path)
+        # the directories of the converted weights (see mmap_weights), which are mapped instead of loaded
+        self.mmap_indexes = [load_index(path) for path in mmap_paths] if mmap_paths else None
+        if self.mmap_indexes:
+            self.vocab = load_vocabulary(self.mmap_indexes[0])
+        else:
+            self.vocab = Vocabulary.from_files(vocab_path)
         self.log = log
         self.iterations = iterations
         self.confidence = confidence
         self.resolve_cycles = resolve_cycles
+        # 'torch' runs the models eagerly, 'onnx' runs the exported graphs (see onnx_export) with onnxruntime on CPU
+        self.backend = backend
+        # sentences of similar wordpiece length are predicted together to reduce padding
+        self.length_bucketing = length_bucketing
+        self.bucket_ratio = bucket_ratio
+        self.padding_stats = {'batches': 0, 'sentences': 0, 'wordpieces': 0, 'padded_wordpieces': 0}
+        # the label tokens and the mask of the labels that are edits, created with the first postprocessing
+        self._label_tokens = None
+        self._label_is_action = None
         # set training parameters and operations
 
         self.indexers = []
         self.models = []
-        for model_path in model_paths:
+        for index, model_path in enumerate(model_paths):
             if is_ensemble:
                 model_name, special_tokens_fix = self._get_model_data(model_path)
             weights_name = get_weights_name(model_name, lowercase_tokens)
             self.indexers.append(self._get_indexer(weights_name, special_tokens_fix))
+            if self.backend == 'onnx':
+                self.models.append(self._get_onnx_session(onnx_paths[index]))
+                continue
+            if self.mmap_indexes:
+                mmap_index = self.mmap_indexes[index]
+                model = Seq2Labels(vocab=self.vocab,
+                                   text_field_embedder=self._get_embbeder(weights_name, special_tokens_fix,
+                                                                          mmap_index['transformer']),
+                                   confidence=self.confidence)
+                # on CPU the mapped tensors are used directly, on GPU they are copied to the device
+                model = assign_state_dict(model, map_state_dict(mmap_paths[index], mmap_index)).to(self.device)
+                model.eval()
+                if quantize:
+                    model = self._quantize(model)
+                self.models.append(model)
+                continue
             model = Seq2Labels(vocab=self.vocab,
                                text_field_embedder=self._get_embbeder(weights_name, special_tokens_fix),
                                confidence=self.confidence
@@ -93,8 +134,35 @@ class GecBERTModel(object):
                                                  map_location=torch.device('cpu')
                                                  ), strict=False)
             model.eval()
+            if quantize:
+                model = self._quantize(model)
             self.models.append(model)
 
+    def _quantize(self, model):
+        """Applies dynamic int8 quantization to the linear layers of the transformer and the tag projections.
+        The weights are stored as int8 and the activations are quantized on the fly, which only works on CPU."""
+        if self.device.type != 'cpu':
+            print('Warning! Dynamic quantization is only supported on CPU, the model is not quantized.')
+            return model
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    @staticmethod
+    def _get_onnx_session(onnx_path):
+        """Loads an exported model into an onnxruntime session on CPU."""
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return onnxruntime.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def _run_model(self, model, batch):
+        """Runs a model of the ensemble on an indexed batch with the configured backend."""
+        if self.backend == 'onnx':
+            outputs = model.run(ONNX_OUTPUT_NAMES, get_onnx_inputs(batch))
+            return dict(zip(ONNX_OUTPUT_NAMES, map(torch.from_numpy, outputs)))
+        batch = util.move_to_device(batch.as_tensor_dict(), 0 if torch.cuda.is_available() else -1)
+        with torch.no_grad():
+            return model.forward(**batch)
+
     @staticmethod
     def _get_model_data(model_path):
         model_name = model_path.split('/')[-1]
@@ -134,10 +202,7 @@ class GecBERTModel(object):
         t11 = time()
         predictions = []
         for batch, model in zip(batches, self.models):
-            batch = util.move_to_device(batch.as_tensor_dict(), 0 if torch.cuda.is_available() else -1)
-            with torch.no_grad():
-                prediction = model.forward(**batch)
-            predictions.append(prediction)
+            predictions.append(self._run_model(model, batch))
 
         preds, idx, error_probs = self._convert(predictions)
         t55 = time()
@@ -145,6 +210,50 @@ class GecBERTModel(object):
             print(f"Inference time {t55 - t11}")
         return preds, idx, error_probs
 
+    def detect(self, token_batch, threshold=0.5):
+        """
+        Detects errors with a single forward pass of the detection head, without correcting the sentences.
+
+        Args:
+            token_batch: list of tokenized sentences.
+            threshold: minimal error probability of a token to be flagged.
+
+        Returns:
+            A tuple of the error probability of every sentence (the highest probability of its tokens, without START)
+            and the list of flagged token positions of every sentence. Sentences that are shorter than min_len
+            are not checked, like in handle_batch, and get an error probability of 0.
+        """
+        error_probs = [0.0] * len(token_batch)
+        flagged = [[] for _ in token_batch]
+        pred_ids = [i for i in range(len(token_batch)) if len(token_batch[i]) >= self.min_len]
+        batches = self.preprocess([token_batch[i] for i in pred_ids])
+        if not batches:
+            return error_probs, flagged
+
+        t11 = time()
+        token_probs = None
+        for batch, model, weight in zip(batches, self.models, self.model_weights):
+            if self.backend == 'onnx':
+                # the exported graph has no separate detection head, its error probabilities are used
+                probs = self._run_model(model, batch)['error_probabilities']
+            else:
+                batch = util.move_to_device(batch.as_tensor_dict(), 0 if torch.cuda.is_available() else -1)
+                with torch.no_grad():
+                    probs = model.detect(batch['tokens'])['error_probabilities']
+            probs = probs * (weight / sum(self.model_weights))
+            token_probs = probs if token_probs is None else token_probs + probs
+        # position 0 is the START token, the sentence verdict and the flagged positions only use the tokens after it
+        sentence_probs = token_probs[:, 1:]
+        max_probs = torch.max(sentence_probs, dim=-1)[0].tolist()
+        flagged_positions = (sentence_probs >= threshold).nonzero().tolist()
+        for batch_index, i in enumerate(pred_ids):
+            error_probs[i] = max_probs[batch_index]
+        for batch_index, position in flagged_positions:
+            flagged[pred_ids[batch_index]].append(position)
+        if self.log:
+            print(f"Detection time {time() - t11}")
+        return error_probs, flagged
+
     def get_token_action(self, token, index, prob, sugg_token):
         """Get lost of suggested actions for token."""
         # cases when we don't need to do anything
@@ -167,12 +276,13 @@ class GecBERTModel(object):
 
         return start_pos - 1, end_pos - 1, sugg_token_clear, prob
 
-    def _get_embbeder(self, weigths_name, special_tokens_fix):
+    def _get_embbeder(self, weigths_name, special_tokens_fix, transformer_config=None):
         embedders = {'bert': PretrainedBertEmbedder(
             pretrained_model=weigths_name,
             requires_grad=False,
             top_layer_only=True,
-            special_tokens_fix=special_tokens_fix)
+            special_tokens_fix=special_tokens_fix,
+            transformer_config=transformer_config)
         }
         text_field_embedder = BasicTextFieldEmbedder(
             token_embedders=embedders,
@@ -193,22 +303,72 @@ class GecBERTModel(object):
         return {'bert': bert_token_indexer}
 
     def preprocess(self, token_batch):
+        return [Batch(instances) for instances in self._get_instances(token_batch)]
+
+    def _get_instances(self, token_batch):
+        """Returns the indexed instances of the sentences for every indexer."""
         seq_lens = [len(sequence) for sequence in token_batch if sequence]
         if not seq_lens:
             return []
         max_len = min(max(seq_lens), self.max_len)
-        batches = []
+        all_instances = []
         for indexer in self.indexers:
-            batch = []
+            instances = []
             for sequence in token_batch:
                 tokens = sequence[:max_len]
                 tokens = [Token(token) for token in ['$START'] + tokens]
-                batch.append(Instance({'tokens': TextField(tokens, indexer)}))
-            batch = Batch(batch)
-            batch.index_instances(self.vocab)
-            batches.append(batch)
+                instance = Instance({'tokens': TextField(tokens, indexer)})
+                instance.index_fields(self.vocab)
+                instances.append(instance)
+            all_instances.append(instances)
+        return all_instances
+
+    def correct_in_buckets(self, token_batch):
+        """Predicts and applies the corrections of the sentences in buckets of similar wordpiece length,
+        so short sentences are not padded to the length of the longest one. Returns the corrected sentences
+        in the order of the token batch or None if there is nothing to predict."""
+        all_instances = self._get_instances(token_batch)
+        if not all_instances:
+            return None
+        # the wordpieces of the first indexer decide the buckets
+        lengths = [len(instance.fields['tokens']._indexed_tokens['bert']) for instance in all_instances[0]]
+        pred_batch = [None] * len(token_batch)
+        for bucket in self._get_buckets(lengths):
+            batches = [Batch([instances[i] for i in bucket]) for instances in all_instances]
+            probabilities, idxs, error_probs = self.predict(batches)
+            bucket_preds = self.postprocess_batch([token_batch[i] for i in bucket], probabilities, idxs, error_probs)
+            for i, pred in zip(bucket, bucket_preds):
+                pred_batch[i] = pred
+            bucket_lengths = [lengths[i] for i in bucket]
+            self.padding_stats['batches'] += 1
+            self.padding_stats['sentences'] += len(bucket)
+            self.padding_stats['wordpieces'] += sum(bucket_lengths)
+            self.padding_stats['padded_wordpieces'] += len(bucket) * max(bucket_lengths)
+        return pred_batch
+
+    def _get_buckets(self, lengths):
+        """Splits the sentence indices into buckets. A bucket starts with its shortest sentence and takes
+        the following sentences as long as they are at most bucket_ratio times (or MIN_BUCKET_WIDTH wordpieces)
+        longer."""
+        if not self.length_bucketing:
+            return [list(range(len(lengths)))]
+        buckets = []
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            if buckets:
+                shortest = lengths[buckets[-1][0]]
+                if lengths[i] <= max(shortest * self.bucket_ratio, shortest + self.MIN_BUCKET_WIDTH):
+                    buckets[-1].append(i)
+                    continue
+            buckets.append([i])
+        return buckets
 
-        return batches
+    def get_padding_statistics(self):
+        """Returns the number of forward passes, sentences, real and padded wordpieces and the padding efficiency,
+        the share of the computed wordpieces that are not padding."""
+        stats = dict(self.padding_stats)
+        stats['padding_efficiency'] = stats['wordpieces'] / stats['padded_wordpieces'] \
+            if stats['padded_wordpieces'] else 1.0
+        return stats
 
     def _convert(self, data):
         all_class_probs = torch.zeros_like(data[0]['class_probabilities_labels'])
@@ -217,10 +377,9 @@ class GecBERTModel(object):
             all_class_probs += weight * output['class_probabilities_labels'] / sum(self.model_weights)
             error_probs += weight * output['max_error_probability'] / sum(self.model_weights)
 
-        max_vals = torch.max(all_class_probs, dim=-1)
-        probs = max_vals[0].tolist()
-        idx = max_vals[1].tolist()
-        return probs, idx, error_probs.tolist()
+        # the results stay tensors, postprocess_batch only converts the positions with edits
+        probs, idx = torch.max(all_class_probs, dim=-1)
+        return probs, idx, error_probs
 
     def update_final_batch(self, final_batch, pred_ids, pred_batch,
                            prev_preds_dict):
@@ -243,47 +402,54 @@ class GecBERTModel(object):
                 continue
         return final_batch, new_pred_ids, total_updated
 
+    def _get_label_tokens(self):
+        """Returns the tokens of the label vocabulary and a mask of the labels that can cause an edit."""
+        if self._label_tokens is None:
+            self._label_tokens = [self.vocab.get_token_from_index(i, namespace='labels')
+                                  for i in range(self.vocab.get_vocab_size('labels'))]
+            self._label_is_action = torch.tensor([token not in [UNK, PAD, '$KEEP'] for token in self._label_tokens])
+        return self._label_tokens, self._label_is_action
+
     def postprocess_batch(self, batch, all_probabilities, all_idxs,
                           error_probs,
                           max_len=50):
-        all_results = []
+        """Applies the predicted edits to the sentences. The probability and index tensors have the shape
+        (batch_size, num_tokens), the error probabilities the shape (batch_size,). Positions without an edit are
+        filtered with tensor operations, only the remaining positions are converted into edits."""
+        label_tokens, label_is_action = self._get_label_tokens()
         noop_index = self.vocab.get_token_index("$KEEP", "labels")
-        for tokens, probabilities, idxs, error_prob in zip(batch,
-                                                           all_probabilities,
-                                                           all_idxs,
-                                                           error_probs):
-            length = min(len(tokens), max_len)
-            edits = []
-
-            # skip whole sentences if there no errors
-            if max(idxs) == 0:
-                all_results.append(tokens)
-                continue
+        all_idxs = all_idxs.cpu()
+        all_probabilities = all_probabilities.cpu()
+        error_probs = error_probs.cpu()
+
+        # skip whole sentences if there no errors
+        # or if the probability of correctness is not high
+        sentence_has_errors = (all_idxs.max(dim=-1)[0] != 0) & (error_probs >= self.min_error_probability)
+        # only positions of the sentence (including the START token) can be edited
+        lengths = torch.tensor([min(len(tokens), max_len) for tokens in batch])
+        positions = torch.arange(all_idxs.size(1)).unsqueeze(0)
+        edit_mask = (positions <= lengths.unsqueeze(1)) & sentence_has_errors.unsqueeze(1)
+        # skip positions without an error, with a label that is no edit or with a low probability
+        edit_mask &= (all_idxs != noop_index) & label_is_action[all_idxs]
+        edit_mask &= all_probabilities >= self.min_error_probability
+
+        edit_positions = edit_mask.nonzero().tolist()
+        edit_probabilities = all_probabilities[edit_mask].tolist()
+        edit_idxs = all_idxs[edit_mask].tolist()
+        all_edits = {}
+        for (sentence_index, i), prob, idx in zip(edit_positions, edit_probabilities, edit_idxs):
+            # because of START token
+            token = START_TOKEN if i == 0 else batch[sentence_index][i - 1]
+            action = self.get_token_action(token, i, prob, label_tokens[idx])
+            if action:
+                all_edits.setdefault(sentence_index, []).append(action)
 
-            # skip whole sentence if probability of correctness is not high
-            if error_prob < self.min_error_probability:
+        all_results = []
+        for sentence_index, (tokens, has_errors) in enumerate(zip(batch, sentence_has_errors.tolist())):
+            if not has_errors:
                 all_results.append(tokens)
-                continue
-
-            for i in range(length + 1):
-                # because of START token
-                if i == 0:
-                    token = START_TOKEN
-                else:
-                    token = tokens[i - 1]
-                # skip if there is no error
-                if idxs[i] == noop_index:
-                    continue
-
-                sugg_token = self.vocab.get_token_from_index(idxs[i],
-                                                             namespace='labels')
-                action = self.get_token_action(token, i, probabilities[i],
-                                               sugg_token)
-                if not action:
-                    continue
-
-                edits.append(action)
-            all_results.append(get_target_sent_by_edits(tokens, edits))
+            else:
+                all_results.append(get_target_sent_by_edits(tokens, all_edits.get(sentence_index, [])))
         return all_results
 
     def handle_batch(self, full_batch):
@@ -301,14 +467,10 @@ class GecBERTModel(object):
         for n_iter in range(self.iterations):
             orig_batch = [final_batch[i] for i in pred_ids]
 
-            sequences = self.preprocess(orig_batch)
+            pred_batch = self.correct_in_buckets(orig_batch)
 
-            if not sequences:
+            if pred_batch is None:
                 break
-            probabilities, idxs, error_probs = self.predict(sequences)
-
-            pred_batch = self.postprocess_batch(orig_batch, probabilities,
-                                                idxs, error_probs)
             if self.log:
                 print(f"Iteration {n_iter + 1}. Predicted {round(100*len(pred_ids)/batch_size, 1)}% of sentences.")
 
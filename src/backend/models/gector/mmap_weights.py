@@ -0,0 +1,157 @@
+"""Converts a GECToR checkpoint and its vocabulary into a memory-mappable format and maps it lazily.
+
+Run once from the repository root:
+    python -m src.backend.models.gector.mmap_weights --output_dir ./data/gector/model/mmap/
+
+The weights are written into one flat file and are mapped copy-on-write when the model is loaded, so only the
+pages that are used are read from disk and all processes on the host share them through the page cache.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+from allennlp.data.vocabulary import Vocabulary
+
+WEIGHTS_FILE = 'weights.bin'
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+# the offset of every tensor is a multiple of this many bytes
+ALIGNMENT = 64
+
+
+def convert_model(model_path, vocab_path, output_dir, transformer_name='roberta-base', special_tokens_fix=1):
+    """Writes the weights of the checkpoint, the configuration of the transformer and the vocabulary.
+
+    Args:
+        model_path: path to the model checkpoint (model.th).
+        vocab_path: path to the output vocabulary of the checkpoint.
+        output_dir: directory the weights.bin and index.json files are written to.
+        transformer_name: name of the pretrained transformer the checkpoint was fine-tuned from.
+        special_tokens_fix: whether the embeddings of the transformer were resized for the special tokens.
+
+    Returns:
+        The index that describes the written files.
+    """
+    from src.backend.models.gector.bert_token_embedder import PretrainedBertModel
+
+    os.makedirs(output_dir, exist_ok=True)
+    state_dict = torch.load(model_path, map_location=torch.device('cpu'))
+    transformer = PretrainedBertModel.load(transformer_name, cache_model=False)
+    index = {
+        'format_version': FORMAT_VERSION,
+        'transformer': {
+            'model_class': type(transformer).__name__,
+            'config_class': type(transformer.config).__name__,
+            'config': transformer.config.to_dict(),
+            'special_tokens_fix': special_tokens_fix
+        },
+        'vocabulary': get_vocabulary_data(vocab_path),
+        'tensors': {}
+    }
+    offset = 0
+    with open(os.path.join(output_dir, WEIGHTS_FILE), 'wb') as weights_file:
+        for name, tensor in state_dict.items():
+            array = tensor.detach().cpu().contiguous().numpy()
+            padding = -offset % ALIGNMENT
+            weights_file.write(b'\0' * padding)
+            offset += padding
+            index['tensors'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            weights_file.write(array.tobytes())
+            offset += array.nbytes
+    with open(os.path.join(output_dir, INDEX_FILE), 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file)
+    return index
+
+
+def get_vocabulary_data(vocab_path):
+    """Returns the tokens of every namespace in the order of their indexes and the non-padded namespaces."""
+    vocab = Vocabulary.from_files(vocab_path)
+    with open(os.path.join(vocab_path, 'non_padded_namespaces.txt'), encoding='utf-8') as namespaces_file:
+        non_padded_namespaces = [line.strip() for line in namespaces_file if line.strip()]
+    namespaces = {}
+    for namespace in vocab.get_namespaces():
+        index_to_token = vocab.get_index_to_token_vocabulary(namespace)
+        namespaces[namespace] = [index_to_token[i] for i in range(len(index_to_token))]
+    return {'non_padded_namespaces': non_padded_namespaces, 'namespaces': namespaces}
+
+
+def load_index(weights_dir):
+    """Reads the index of converted weights."""
+    with open(os.path.join(weights_dir, INDEX_FILE), encoding='utf-8') as index_file:
+        index = json.load(index_file)
+    if index.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"{weights_dir} was converted with another format version, convert the model again.")
+    return index
+
+
+def load_vocabulary(index):
+    """Builds the allennlp Vocabulary of converted weights with the same indexes as the original files."""
+    vocabulary_data = index['vocabulary']
+    vocab = Vocabulary(non_padded_namespaces=vocabulary_data['non_padded_namespaces'])
+    for namespace, tokens in vocabulary_data['namespaces'].items():
+        # the padding and unknown tokens of padded namespaces already exist and keep their indexes
+        for token in tokens:
+            vocab.add_token_to_namespace(token, namespace)
+    return vocab
+
+
+def map_state_dict(weights_dir, index):
+    """Returns the weights as tensors that are backed by a copy-on-write mapping of the weights file.
+    Nothing is read from disk until a tensor is used."""
+    mapping = np.memmap(os.path.join(weights_dir, WEIGHTS_FILE), dtype=np.uint8, mode='c')
+    state_dict = {}
+    for name, tensor_info in index['tensors'].items():
+        dtype = np.dtype(tensor_info['dtype'])
+        count = int(np.prod(tensor_info['shape']))
+        offset = tensor_info['offset']
+        array = mapping[offset:offset + count * dtype.itemsize].view(dtype).reshape(tensor_info['shape'])
+        state_dict[name] = torch.from_numpy(array)
+    return state_dict
+
+
+def assign_state_dict(model, state_dict):
+    """Replaces the parameters and buffers of the model with the mapped tensors instead of copying them,
+    so the weights stay shared. Like load_state_dict with strict=False, unknown names are skipped."""
+    own_state = model.state_dict()
+    skipped = []
+    for name, tensor in state_dict.items():
+        if name not in own_state:
+            skipped.append(name)
+            continue
+        if own_state[name].shape != tensor.shape:
+            raise ValueError(f"The shape of {name} is {tuple(tensor.shape)} instead of {tuple(own_state[name].shape)}.")
+        module_name, _, attribute = name.rpartition('.')
+        module = model.get_submodule(module_name) if module_name else model
+        if attribute in module._parameters:
+            setattr(module, attribute, torch.nn.Parameter(tensor, requires_grad=False))
+        else:
+            setattr(module, attribute, tensor)
+    missing = [name for name in own_state if name not in state_dict]
+    if skipped or missing:
+        print(f"Warning! {len(skipped)} tensors of the weights file are unknown "
+              f"and {len(missing)} tensors of the model are missing.")
+    return model
+
+
+def main(args):
+    index = convert_model(args.model_path, args.vocab_path, args.output_dir, args.transformer_name,
+                          args.special_tokens_fix)
+    size = os.path.getsize(os.path.join(args.output_dir, WEIGHTS_FILE))
+    print(f"Converted {len(index['tensors'])} tensors ({size / 2 ** 20:.0f}MB) to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vocab_path', default='./data/gector/output_vocabulary/',
+                        help='Path to the output vocabulary.')
+    parser.add_argument('--model_path', default='./data/gector/model/model.th',
+                        help='Path to the model checkpoint.')
+    parser.add_argument('--output_dir', default='./data/gector/model/mmap/',
+                        help='Directory the converted weights are written to.')
+    parser.add_argument('--transformer_name', default='roberta-base',
+                        help='Name of the pretrained transformer of the checkpoint.')
+    parser.add_argument('--special_tokens_fix', type=int, default=1,
+                        help='Whether the embeddings of the transformer were resized for the special tokens.')
+    main(parser.parse_args())
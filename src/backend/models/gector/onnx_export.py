@@ -0,0 +1,125 @@
+"""Exports the Seq2Labels models of a GecBERTModel to ONNX and checks that both backends predict the same.
+
+Run from the repository root:
+    python -m src.backend.models.gector.onnx_export --output_dir ./data/gector/model/ --check_parity
+"""
+import argparse
+import os
+
+import torch
+from allennlp.nn import util
+
+# The names of the inputs and outputs of the exported graph
+ONNX_INPUT_NAMES = ['input_ids', 'offsets', 'mask']
+ONNX_OUTPUT_NAMES = ['class_probabilities_labels', 'max_error_probability', 'error_probabilities']
+
+
+class Seq2LabelsExportWrapper(torch.nn.Module):
+    """Exposes the tensors of the token dictionary as separate inputs and the probabilities as a tuple,
+    so the embedder and the Seq2Labels model can be traced into one graph."""
+
+    def __init__(self, model):
+        super(Seq2LabelsExportWrapper, self).__init__()
+        self.model = model
+
+    def forward(self, input_ids, offsets, mask):
+        output = self.model(tokens={'bert': input_ids, 'bert-offsets': offsets, 'mask': mask})
+        error_probs = output['class_probabilities_d_tags'][:, :, self.model.incorr_index] * mask
+        return output['class_probabilities_labels'], output['max_error_probability'], error_probs
+
+
+def get_onnx_inputs(batch):
+    """Returns the input arrays of the exported graph for an indexed allennlp batch."""
+    tokens = batch.as_tensor_dict()['tokens']
+    return {'input_ids': tokens['bert'].numpy(),
+            'offsets': tokens['bert-offsets'].numpy(),
+            'mask': tokens['mask'].numpy()}
+
+
+def export_to_onnx(gec_model, output_dir, example_sentences, opset_version=11):
+    """Exports every model of the GecBERTModel with dynamic batch and sequence axes.
+
+    Args:
+        gec_model: GecBERTModel with the torch backend.
+        output_dir: directory the model_<index>.onnx files are written to.
+        example_sentences: tokenized sentences used to trace the graph.
+        opset_version: ONNX opset version of the exported graph.
+
+    Returns:
+        The paths of the exported files, in the order of the models.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    batches = gec_model.preprocess(example_sentences)
+    paths = []
+    for index, (batch, model) in enumerate(zip(batches, gec_model.models)):
+        tokens = util.move_to_device(batch.as_tensor_dict(), -1)['tokens']
+        path = os.path.join(output_dir, f'model_{index}.onnx')
+        with torch.no_grad():
+            torch.onnx.export(Seq2LabelsExportWrapper(model.cpu()),
+                              (tokens['bert'], tokens['bert-offsets'], tokens['mask']),
+                              path,
+                              input_names=ONNX_INPUT_NAMES,
+                              output_names=ONNX_OUTPUT_NAMES,
+                              dynamic_axes={'input_ids': {0: 'batch', 1: 'wordpieces'},
+                                            'offsets': {0: 'batch', 1: 'tokens'},
+                                            'mask': {0: 'batch', 1: 'tokens'},
+                                            'class_probabilities_labels': {0: 'batch', 1: 'tokens'},
+                                            'max_error_probability': {0: 'batch'},
+                                            'error_probabilities': {0: 'batch', 1: 'tokens'}},
+                              opset_version=opset_version)
+        paths.append(path)
+        print(f"Exported model {index} to {path}")
+    return paths
+
+
+def check_parity(torch_model, onnx_model, token_batch, atol=1e-4):
+    """Compares the predictions of both backends on the token batch.
+
+    Returns:
+        True if all probabilities differ by at most atol and all corrections are the same.
+    """
+    torch_probs, torch_idxs, torch_error_probs = torch_model.predict(torch_model.preprocess(token_batch))
+    onnx_probs, onnx_idxs, onnx_error_probs = onnx_model.predict(onnx_model.preprocess(token_batch))
+    max_prob_diff = (torch_probs - onnx_probs).abs().max().item()
+    max_error_prob_diff = (torch_error_probs - onnx_error_probs).abs().max().item()
+    same_labels = torch.equal(torch_idxs, onnx_idxs)
+    same_corrections = torch_model.handle_batch(token_batch)[0] == onnx_model.handle_batch(token_batch)[0]
+    print(f"Max difference of the label probabilities {max_prob_diff:.2e}, "
+          f"of the error probabilities {max_error_prob_diff:.2e}, "
+          f"same labels: {same_labels}, same corrections: {same_corrections}")
+    return max_prob_diff <= atol and max_error_prob_diff <= atol and same_corrections
+
+
+def main(args):
+    from src.backend.models.gector.gec_model import GecBERTModel
+    from src.backend.models.gector.evaluation_data import load_labelled_sentences
+
+    model_args = dict(model_paths=[args.model_path], weigths=None, max_len=50, min_len=3, iterations=5,
+                      lowercase_tokens=0, log=False, model_name='roberta', special_tokens_fix=1, is_ensemble=0,
+                      min_error_probability=0.0, confidence=0)
+    torch_model = GecBERTModel(args.vocab_path, **model_args)
+    sentences, _ = load_labelled_sentences(args.input_file)
+    token_batch = [sent.split() for sent in sentences]
+    onnx_paths = export_to_onnx(torch_model, args.output_dir, token_batch[:2])
+    if args.check_parity:
+        onnx_model = GecBERTModel(args.vocab_path, backend='onnx', onnx_paths=onnx_paths, **model_args)
+        results = [check_parity(torch_model, onnx_model, token_batch[i:i + 16])
+                   for i in range(0, len(token_batch), 16)]
+        print(f"Parity: {sum(results)} of {len(results)} batches passed.")
+        if not all(results):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vocab_path', default='./data/gector/output_vocabulary/',
+                        help='Path to the output vocabulary.')
+    parser.add_argument('--model_path', default='./data/gector/model/model.th',
+                        help='Path to the model checkpoint.')
+    parser.add_argument('--output_dir', default='./data/gector/model/',
+                        help='Directory the ONNX files are written to.')
+    parser.add_argument('--input_file', default='./data/test_data/BEA_eval_common_errors_annotated.csv',
+                        help='Sentences used to trace the graph and to check the parity.')
+    parser.add_argument('--check_parity', action='store_true',
+                        help='Compare the predictions of the exported graph with the torch model.')
+    main(parser.parse_args())
@@ -0,0 +1,82 @@
+"""Checks the accuracy of the int8 quantized GecBERTModel against the full precision model.
+
+Run from the repository root:
+    python -m src.backend.models.gector.quantization_check --max_accuracy_drop 0.02
+
+The correct sentences of the annotated evaluation set are labelled correct and the erroneous ones incorrect.
+The check fails (exit code 1) if the quantized model loses more accuracy than allowed.
+"""
+import argparse
+import io
+import sys
+
+import torch
+
+from src.backend.models.gector.detection_benchmark import run_in_batches
+from src.backend.models.gector.evaluation_data import get_scores, load_labelled_sentences
+from src.backend.models.gector.gec_model import GecBERTModel
+
+
+def get_verdicts(model, sentences, batch_size, detection_threshold):
+    """Returns whether each sentence is flagged as incorrect and the runtime."""
+    token_batch = [sent.split() for sent in sentences]
+    if detection_threshold is not None:
+        error_probs, runtime = run_in_batches(lambda batch: model.detect(batch, detection_threshold)[0],
+                                              token_batch, batch_size)
+        return [error_prob >= detection_threshold for error_prob in error_probs], runtime
+    corrections, runtime = run_in_batches(lambda batch: model.handle_batch(batch)[0], token_batch, batch_size)
+    return [sent.lower() != " ".join(pred).lower() for sent, pred in zip(sentences, corrections)], runtime
+
+
+def get_model_size(model):
+    """Returns the size of the serialized weights of the model in MB."""
+    buffer = io.BytesIO()
+    torch.save(model.models[0].state_dict(), buffer)
+    return buffer.tell() / 2 ** 20
+
+
+def main(args):
+    sentences, labels = load_labelled_sentences(args.input_file)
+    results = {}
+    for quantize in [False, True]:
+        model = GecBERTModel(args.vocab_path,
+                             model_paths=[args.model_path],
+                             weigths=None, max_len=50, min_len=3, iterations=args.iterations,
+                             lowercase_tokens=0, log=False, model_name='roberta',
+                             special_tokens_fix=1, is_ensemble=0, min_error_probability=0.0,
+                             confidence=0, quantize=quantize)
+        verdicts, runtime = get_verdicts(model, sentences, args.batch_size, args.detection_threshold)
+        results[quantize] = (verdicts, runtime)
+        accuracy, precision, recall = get_scores(verdicts, labels)
+        print(f"{'int8' if quantize else 'float32'}: accuracy {100 * accuracy:.1f}%, precision {100 * precision:.1f}%, "
+              f"recall {100 * recall:.1f}%, {1000 * runtime / len(sentences):.1f}ms per sentence, "
+              f"weights {get_model_size(model):.0f}MB")
+        del model
+
+    (full_verdicts, full_runtime), (quantized_verdicts, quantized_runtime) = results[False], results[True]
+    accuracy_drop = get_scores(full_verdicts, labels)[0] - get_scores(quantized_verdicts, labels)[0]
+    agreement = sum(f == q for f, q in zip(full_verdicts, quantized_verdicts)) / len(sentences)
+    print(f"Speedup {full_runtime / quantized_runtime:.2f}x, verdict agreement {100 * agreement:.1f}%, "
+          f"accuracy drop {100 * accuracy_drop:.1f} points (allowed {100 * args.max_accuracy_drop:.1f})")
+    if accuracy_drop > args.max_accuracy_drop:
+        print("The quantized model is not accurate enough.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input_file', default='./data/test_data/BEA_eval_common_errors_annotated.csv',
+                        help='Path to the annotated evaluation set.')
+    parser.add_argument('--vocab_path', default='./data/gector/output_vocabulary/',
+                        help='Path to the output vocabulary.')
+    parser.add_argument('--model_path', default='./data/gector/model/model.th',
+                        help='Path to the model checkpoint.')
+    parser.add_argument('--iterations', type=int, default=5,
+                        help='Number of correction iterations, like in the GrammarClassifier.')
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help='Number of sentences per batch.')
+    parser.add_argument('--detection_threshold', type=float, default=None,
+                        help='Compare the detection verdicts with this threshold instead of the corrections.')
+    parser.add_argument('--max_accuracy_drop', type=float, default=0.02,
+                        help='Maximum allowed loss of accuracy (as a fraction) of the quantized model.')
+    main(parser.parse_args())
@@ -163,6 +163,31 @@ class Seq2Labels(Model):
             output_dict["words"] = [x["words"] for x in metadata]
         return output_dict
 
+    def detect(self, tokens: Dict[str, torch.LongTensor]) -> Dict[str, torch.Tensor]:
+        """
+        Runs only the detection head, the label projection and its softmax are skipped.
+
+        Parameters
+        ----------
+        tokens : Dict[str, torch.LongTensor], required
+            The output of ``TextField.as_array()``, see ``forward``.
+
+        Returns
+        -------
+        An output dictionary consisting of:
+        error_probabilities : torch.FloatTensor
+            A tensor of shape ``(batch_size, num_tokens)`` with the probability that a token is incorrect,
+            zero for padding.
+        max_error_probability : torch.FloatTensor
+            A tensor of shape ``(batch_size,)`` with the highest error probability of each sequence.
+        """
+        encoded_text = self.text_field_embedder(tokens)
+        mask = get_text_field_mask(tokens)
+        logits_d = self.tag_detect_projection_layer(encoded_text)
+        error_probs = F.softmax(logits_d, dim=-1)[:, :, self.incorr_index] * mask
+        return {"error_probabilities": error_probs,
+                "max_error_probability": torch.max(error_probs, dim=-1)[0]}
+
     @overrides
     def decode(self, output_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
         """
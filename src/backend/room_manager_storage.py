@@ -1,4 +1,5 @@
 from .room_manager import RoomManager
+from .db.content_bank import remove_decks_of_owner
 
 
 singeltons = {}
@@ -29,3 +30,5 @@ def remove_room_manager_of_group(group_chat_id: str):
         group_chat_id (str): The id of the group chat from telegram.
     """
     singeltons.pop(group_chat_id, None)
+    # the next game of the group starts with new decks
+    remove_decks_of_owner(group_chat_id)
@@ -5,6 +5,7 @@ import time
 import numpy as np
 import statistics as stats
 import datetime
+from concurrent import futures
 from nltk.tokenize import sent_tokenize, word_tokenize
 
 from .base_task import Task
@@ -14,15 +15,49 @@ from ...bot.util import send_message
 from ...backend.adaptability.selection import select_sub_type
 from ..adaptability.proficiency import Others
 from ..entities.grammar_classifier import GrammarClassifier
+from ..entities.grammar_service import GrammarInferenceService
+from ..entities.grammar_worker_pool import GrammarWorkerPool
 
 
 task_name = 'Discussion'
 logger = logging.getLogger(__name__)
-grammar_classifier = GrammarClassifier()
+# the sentences of all groups are classified in batches by one shared classifier
+grammar_service = GrammarInferenceService(GrammarClassifier)
 # Function to initialize phrases
 phrase_dict = {}
 
 
+def start_grammar_service(config):
+    """
+    Configures the batching of the grammar classification and loads the classifier.
+    If workers are configured, the sentences are classified by a pool of worker processes.
+    """
+    global grammar_service
+    if config.get('num_workers', 0) > 0:
+        grammar_service = GrammarWorkerPool(GrammarClassifier,
+                                            num_workers=config['num_workers'],
+                                            max_pending_batches=config.get('max_pending_batches', 2),
+                                            max_queue_size=config.get('max_queue_size', 256))
+    grammar_service.max_batch_size = config.get('max_batch_size', grammar_service.max_batch_size)
+    grammar_service.max_wait = config.get('max_wait', grammar_service.max_wait)
+    grammar_service.result_timeout = config.get('result_timeout', grammar_service.result_timeout)
+    grammar_service.classifier_options = {
+        'detection_threshold': config.get('detection_threshold'),
+        'quantize': config.get('quantize', False),
+        'backend': config.get('backend', 'torch'),
+        'cache_size': config.get('cache_size', 10000),
+        'cache_file': config.get('cache_file'),
+        'mmap_dir': config.get('mmap_dir'),
+        'language_tool_rules': config.get('language_tool_rules', 'all'),
+        'concurrent_engines': config.get('concurrent_engines', False),
+        'deadline': config.get('deadline'),
+        'language_tool_servers': config.get('language_tool_servers', 0),
+        'language_tool_port': config.get('language_tool_port', 8081),
+        'language_tool_heap': config.get('language_tool_heap', '512m')
+    }
+    grammar_service.start()
+
+
 def set_discussion_task_phrases(config):
     global phrase_dict
     # Get filepaths from config
@@ -36,9 +71,12 @@ def set_discussion_task_phrases(config):
 
 class Discussion(Task):
     
-    def __init__(self, users, difficulty, timelimit=180):
+    def __init__(self, users, difficulty, timelimit=180, group_chat_id=None):
         self.all_users = users
 
+        # the group chat the task runs in, discussion texts are not repeated within a group
+        self.group_chat_id = group_chat_id
+
         self.difficulty = difficulty
 
         # track total words, total words per user, user participation, and user score
@@ -91,7 +129,7 @@ class Discussion(Task):
         #self.group_avg_difficulty = self.create_group_avg_difficulty(users)
         #self.discussion_text = self.select_discussion_text(self.group_difficulty_dict, self.group_avg_difficulty)
         # TODO remove random text, select one based on difficulty
-        self.discussion_text = self.set_random_discussion_text()
+        self.set_random_discussion_text()
 
 
     def get_question(self):
@@ -104,7 +142,11 @@ class Discussion(Task):
         return self.discussion_text.get_text()
 
     def set_random_discussion_text(self):
-        self.discussion_text = get_random_discussion_text()
+        # do not select the current text again
+        current_text = getattr(self, 'discussion_text', None)
+        exclude_text_ids = {current_text.get_text_id()} if current_text else None
+        self.discussion_text = get_random_discussion_text(
+            deck_owner=self.group_chat_id, exclude_text_ids=exclude_text_ids)
 
     def get_task_instructions(self):
         return phrase_dict['Task instruction']
@@ -217,6 +259,8 @@ class Discussion(Task):
             message = ""
         message = deEmojify(message)
         sentences = sent_tokenize(message)
+        # submit all sentences first, so they can be classified in one batch
+        pending = []
         for sentence in sentences:
             if len(sentence.split()) <= 2:
                 continue
@@ -225,8 +269,16 @@ class Discussion(Task):
             sentence = re.sub(
                 '([a-zA-Z])', lambda x: x.groups()[0].upper(),
                 sentence, 1)
-            correctness_value, error_types = grammar_classifier.classify(
-                sentence)
+            pending.append((sentence, grammar_service.submit(sentence)))
+        deadline = time.monotonic() + grammar_service.result_timeout
+        for sentence, future in pending:
+            try:
+                correctness_value, error_types = future.result(max(0.0, deadline - time.monotonic()))
+            except futures.TimeoutError:
+                # the classification is stuck, the sentence is not penalized
+                logger.error('The grammar classification of a sentence timed out.')
+                future.cancel()
+                correctness_value, error_types = GrammarClassifier.NO_VERDICT
             self.user_scores[user][
                 task_no - 1] += correctness_value * len(
                 word_tokenize(sentence))
@@ -295,7 +347,7 @@ class Discussion(Task):
             difficulty_dict, difficulty_avg, paths)
         difficulty = self.rescale_difficulty(difficulty)
         discussion_text = get_random_discussion_text_based_on(
-            subtype, difficulty)
+            subtype, difficulty, deck_owner=self.group_chat_id)
 
         return discussion_text
 
@@ -9,10 +9,8 @@ from .base_task import Task
 # from ..db.task import get_task_by_name
 from ..room_manager_storage import get_room_manager_of_group
 from ..tools import load_phrases
-from ..db.student_proficiency import update_student_proficiency
-from ..db.student_data import update_student_data
+from ..db.student import save_students
 from ...backend.adaptability.selection import select_sub_type
-from ..db.student_proficiency import update_student_proficiency
 from ..adaptability.proficiency import Others
 from random import randint, shuffle
 
@@ -230,9 +228,7 @@ def remove_listening_task_of_group(group_chat_id: str):
     Args:
         group_chat_id (str): The id of the group chat from telegram.
     """
-    # Save data to the database
-    for student in get_room_manager_of_group(group_chat_id).get_joined_student_list():
-        update_student_proficiency(student)
-        update_student_data(student)
+    # Save the changed data of all students to the database
+    save_students(get_room_manager_of_group(group_chat_id).get_joined_student_list())
     # Remove singleton
     singeltons.pop(group_chat_id, None)
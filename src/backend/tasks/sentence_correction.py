@@ -28,10 +28,12 @@ class SentenceCorrection(SequentialTask):
     grammar_rules_used = []
     second_chance = False
 
-    def __init__(self, users, difficulty, group_iterations):
+    def __init__(self, users, difficulty, group_iterations, group_chat_id=None):
         # Initialize parent class to get these attributes.
         super(SentenceCorrection, self).__init__(
             users, difficulty, group_iterations)
+        # Stores the group chat the task runs in, sentences are not repeated within a group
+        self.group_chat_id = group_chat_id
         # Stores information about all users currently working on the task
         self.all_users = users
         # Stores information about the users that have not yet had their turn
@@ -123,7 +125,7 @@ class SentenceCorrection(SequentialTask):
             'Test information: Sentence difficulty rescaled to 1-3 = {}'.format(difficulty))
         # Get sentence based on sub_type and difficulty
         self.curr_sentence = get_random_sentence_based_on_sub_type_and_difficulty(
-            sub_type, difficulty)
+            sub_type, difficulty, deck_owner=self.group_chat_id)
 
     def get_curr_proficiency_sub_types(self):
         """
@@ -1,7 +1,6 @@
 from .sentence_correction import SentenceCorrection
-from ..db.task import create_sentence_corr_task
-from ..db.student_proficiency import update_student_proficiency
-from ..db.student_data import update_student_data
+from ..db.task import create_sentence_corr_task, flush_adaptive_data
+from ..db.student import save_students
 from ..room_manager_storage import get_room_manager_of_group
 
 singeltons = {}
@@ -22,7 +21,7 @@ def get_sentence_correction_task_of_group(group_chat_id: str) -> SentenceCorrect
     if not group_singelton:
 
         active_users = get_room_manager_of_group(group_chat_id).get_joined_student_list()
-        sentence_correction_task = create_sentence_corr_task(active_users)
+        sentence_correction_task = create_sentence_corr_task(active_users, group_chat_id)
         group_singelton = sentence_correction_task
         singeltons[group_chat_id] = group_singelton
 
@@ -36,9 +35,9 @@ def remove_sentence_correction_task_of_group(group_chat_id: str):
     Args:
         group_chat_id (str): The id of the group chat from telegram.
     """
-    # Save data to the database
-    for student in get_room_manager_of_group(group_chat_id).get_joined_student_list():
-        update_student_proficiency(student)
-        update_student_data(student)
+    # Save the changed data of all students to the database
+    save_students(get_room_manager_of_group(group_chat_id).get_joined_student_list())
+    # Write the adaptive data of the task, the path selection of the next task reads it
+    flush_adaptive_data()
     # Remove singleton
     singeltons.pop(group_chat_id, None)
@@ -34,10 +34,12 @@ def set_vocab_guessing_task_phrases(config):
 
 class VocabularyDescription(SequentialTask):
 
-    def __init__(self, users, difficulty, group_iterations, timelimit=120):
+    def __init__(self, users, difficulty, group_iterations, timelimit=120, group_chat_id=None):
         # Initialize parent class to get these attributes.
         super(VocabularyDescription, self).__init__(
             users, difficulty, group_iterations)
+        # Stores the group chat the task runs in, words are not repeated within a group
+        self.group_chat_id = group_chat_id
         # Stores information about all users currently working on the task
         self.all_users = users
         # Stores information about the users that have not yet had their turn
@@ -177,7 +179,8 @@ class VocabularyDescription(SequentialTask):
         # Get the word based on scaled difficulty and sub-type
         self.curr_word = get_random_word_based_on_sub_type_and_difficulty(
             sub_type=sub_type,
-            difficulty=difficulty)
+            difficulty=difficulty,
+            deck_owner=self.group_chat_id)
 
     def reset_timelimits(self):
         """ Resets the timelimits once a word has been given to the user """
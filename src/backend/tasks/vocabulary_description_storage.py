@@ -1,7 +1,6 @@
 from .vocabulary_description import VocabularyDescription
-from ..db.task import create_vocab_description_task
-from ..db.student_proficiency import update_student_proficiency
-from ..db.student_data import update_student_data
+from ..db.task import create_vocab_description_task, flush_adaptive_data
+from ..db.student import save_students
 from ..room_manager_storage import get_room_manager_of_group
 
 
@@ -24,7 +23,7 @@ def get_vocab_description_task_of_group(group_chat_id: str) -> VocabularyDescrip
 
         # get the students that participate in the task
         active_users = get_room_manager_of_group(group_chat_id).get_joined_student_list()
-        vocabulary_description_task = create_vocab_description_task(active_users)
+        vocabulary_description_task = create_vocab_description_task(active_users, group_chat_id)
         group_singelton = vocabulary_description_task
         singeltons[group_chat_id] = group_singelton
 
@@ -38,9 +37,9 @@ def remove_vocab_description_task_of_group(group_chat_id: str):
     Args:
         group_chat_id (str): The id of the group chat from telegram.
     """
-    # Save data to the database
-    for student in get_room_manager_of_group(group_chat_id).get_joined_student_list():
-        update_student_proficiency(student)
-        update_student_data(student)
+    # Save the changed data of all students to the database
+    save_students(get_room_manager_of_group(group_chat_id).get_joined_student_list())
+    # Write the adaptive data of the task, the path selection of the next task reads it
+    flush_adaptive_data()
     # Remove singleton
     singeltons.pop(group_chat_id, None)
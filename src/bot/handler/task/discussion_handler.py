@@ -10,8 +10,7 @@ from ....backend.tasks.discussion import Discussion
 from ...util import get_gif_link, get_group_chat_id, send_animation, send_message, create_keyboard_markup, send_image
 from ....backend.db.task import insert_discussion_adaptive_data_entry
 
-from ....backend.db.student_data import update_student_data
-from ....backend.db.student_proficiency import update_student_proficiency
+from ....backend.db.student import save_students
 from ....backend.db.task import create_discussion_task
 from ....backend.room_manager_storage import get_room_manager_of_group
 
@@ -331,7 +330,7 @@ def get_discussion_task_of_group(group_chat_id: str) -> Discussion:
         # get the students that participate in the task
         active_users = get_room_manager_of_group(
             group_chat_id).get_joined_student_list()
-        group_singelton = create_discussion_task(active_users)
+        group_singelton = create_discussion_task(active_users, group_chat_id)
         singeltons[group_chat_id] = group_singelton
     return group_singelton
 
@@ -342,9 +341,7 @@ def remove_discussion_task_of_group(group_chat_id: str):
     Args:
         group_chat_id (str): The id of the group chat from telegram.
     """
-    # Save data to the database
-    for student in get_room_manager_of_group(group_chat_id).get_joined_student_list():
-        update_student_proficiency(student)
-        update_student_data(student)
+    # Save the changed data of all students to the database
+    save_students(get_room_manager_of_group(group_chat_id).get_joined_student_list())
     # Remove singleton
     singeltons.pop(group_chat_id, None)